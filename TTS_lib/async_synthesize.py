@@ -0,0 +1,163 @@
+"""asyncio interface of the synthesizer.
+
+    synth = await AsyncSynthesizer.load('projects/Xardas', speakers_json='speakers.json')
+    wav = await synth.synthesize('Was willst du?', speaker='Diego', timeout=10)
+    async for chunk in synth.stream('Hallo. Wie geht es dir?', speaker='Diego'):
+        ...
+    await synth.close()
+
+Model work runs on a dedicated thread pool with ``max_concurrency``
+threads, requests beyond that wait in its queue, so the event loop is never
+blocked and no thread is started per request. ``stream`` yields the
+waveform of every sentence as soon as it is vocoded, the next sentence is
+decoded meanwhile. Cancelling a request or running into its timeout stops
+its decoder at the next step.
+"""
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from TTS_lib.synthesize import get_synthesizer, split_into_sentences
+from TTS_lib.utils.logger import get_logger
+from TTS_lib.utils.metrics import metrics
+
+logger = get_logger('async_synthesize')
+
+# samples of silence after every sentence, as Synthesizer.synthesize_line
+SENTENCE_FILLER = 10000
+
+
+class AsyncSynthesizer():
+    """Runs a ``TTS_lib.synthesize.Synthesizer`` for asyncio code.
+
+    Args:
+        synthesizer (TTS_lib.synthesize.Synthesizer): loaded project.
+        max_concurrency (int): sentences decoded or vocoded at the same time.
+        executor (concurrent.futures.Executor): runs the model work, default
+            is a thread pool with ``max_concurrency`` threads.
+    """
+    def __init__(self, synthesizer, max_concurrency=1, executor=None):
+        self.synthesizer = synthesizer
+        self.own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_concurrency, thread_name_prefix='tts_async')
+
+    @classmethod
+    async def load(cls, project, use_cuda=False, vocoder_type='GriffinLim', speakers_json='', **kwargs):
+        """Load a project without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        synthesizer = await loop.run_in_executor(None, get_synthesizer, project, use_cuda, vocoder_type,
+                                                 speakers_json)
+        return cls(synthesizer, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def sample_rate(self):
+        return self.synthesizer.ap.sample_rate
+
+    def _inputs(self, speaker, style_input):
+        synthesizer = self.synthesizer
+        speaker_id = synthesizer.get_speaker_id(speaker) if speaker is not None else None
+        if speaker_id is None and synthesizer.speakers:
+            speaker_id = next(iter(synthesizer.speakers.values()))
+        if not synthesizer.C.use_gst:
+            style_input = None
+        elif style_input is None:
+            # neutral style instead of a random style wav of the speaker
+            style_input = {'0': 0.0}
+        return speaker_id, style_input
+
+    async def _call(self, cancel_event, deadline, fn, *args):
+        loop = asyncio.get_running_loop()
+        future = asyncio.wrap_future(self.executor.submit(fn, *args))
+        try:
+            if deadline is None:
+                return await future
+            return await asyncio.wait_for(future, max(0.0, deadline - loop.time()))
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # a running decoder stops at its next step
+            cancel_event.set()
+            raise
+
+    def _decode(self, sentence, speaker_id, style_input, cancel_event):
+        synthesizer = self.synthesizer
+        tokens = synthesizer.encode(sentence)
+        return synthesizer.decode(sentence, speaker_id=speaker_id, style_input=style_input, tokens=tokens,
+                                  cancel_event=cancel_event)
+
+    def _vocode(self, postnet_output):
+        wav = self.synthesizer.vocode(postnet_output)
+        chunk = np.concatenate([wav, np.zeros(SENTENCE_FILLER, dtype=wav.dtype)])
+        metrics.inc('tts_audio_seconds_total', len(chunk) / self.sample_rate)
+        return chunk
+
+    def _clean(self, text):
+        # pylint: disable=import-outside-toplevel
+        from TTS_lib.utils.text.text_cleaning import clean_sentence
+        with metrics.stage('text_normalization', chars=len(text)):
+            return clean_sentence(text)
+
+    async def stream(self, text, speaker=None, style_input=None, timeout=None, clean=True):
+        """Yield the waveform of every sentence of ``text``, each followed by
+        the filler that ``synthesize`` puts between sentences.
+
+        Args:
+            text (str): text to synthesize.
+            speaker (str): speakers.json name, default is the first speaker.
+            style_input (dict or str): GST style weights or a style wav,
+                default is the neutral style.
+            timeout (float): seconds for the whole text, raises
+                ``asyncio.TimeoutError``.
+            clean (bool): normalize the text like the GUI.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        cancel_event = threading.Event()
+        start_time = time.perf_counter()
+        speaker_id, style_input = self._inputs(speaker, style_input)
+        if clean:
+            text = await self._call(cancel_event, deadline, self._clean, text)
+        sentences = split_into_sentences(text)
+        audio_seconds = 0.0
+        decoding = None
+        try:
+            for idx, sentence in enumerate(sentences):
+                if decoding is None:
+                    decoding = asyncio.ensure_future(self._call(
+                        cancel_event, deadline, self._decode, sentence, speaker_id, style_input, cancel_event))
+                postnet_output = await decoding
+                decoding = None
+                if idx + 1 < len(sentences):
+                    # decode the next sentence while this one is vocoded
+                    decoding = asyncio.ensure_future(self._call(
+                        cancel_event, deadline, self._decode, sentences[idx + 1], speaker_id, style_input,
+                        cancel_event))
+                chunk = await self._call(cancel_event, deadline, self._vocode, postnet_output)
+                audio_seconds += len(chunk) / self.sample_rate
+                yield chunk
+        finally:
+            if decoding is not None:
+                cancel_event.set()
+                decoding.cancel()
+        if audio_seconds > 0:
+            metrics.observe('tts_real_time_factor', (time.perf_counter() - start_time) / audio_seconds)
+        metrics.inc('tts_lines_total')
+
+    async def synthesize(self, text, speaker=None, style_input=None, timeout=None, clean=True):
+        """Waveform of ``text``, see ``stream`` for the arguments."""
+        chunks = [chunk async for chunk in self.stream(text, speaker, style_input, timeout, clean)]
+        return np.concatenate(chunks) if chunks else np.zeros(0)
+
+    async def close(self):
+        """Wait for the running model work and save the duration estimates."""
+        if self.own_executor:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.executor.shutdown)
+        self.synthesizer.duration_estimator.save()
@@ -0,0 +1,301 @@
+"""Incremental voice pack builds.
+
+    python -m TTS_lib.build --project projects/Diego --sentence_file lines.txt \
+        --speakers_json projects/Diego/speakers.json --speaker_name Diego --speaker_name Xardas
+
+Lines of sentence files are ``name|text`` or plain text. Every line is
+rendered for every speaker to ``<out_path>/<speaker>/<name>.wav``; the name
+of a plain line is derived from its text. The output units of Daedalus
+scripts (``--scripts``) are rendered for their npc, mapped to a speaker by
+``--speaker_map``, to ``<out_path>/<output unit name>.wav``. With
+``--archive`` the outputs are packed into ``<out_path>/archive`` instead,
+see ``TTS_lib.utils.archive``, ``--export`` writes resampled, loudness
+normalized wav, flac or ogg files, see ``TTS_lib.utils.export``.
+
+A manifest in the build folder records the hash of the inputs of every
+output (cleaned text, speaker, style, checkpoint, config, vocoder, export or
+archive settings), so a build only renders the outputs whose inputs changed
+and removes the outputs that are no longer part of the pack. Outputs with the same inputs, e.g. a
+line repeated across dialogs, are rendered once. The model is only loaded
+if something has to be rendered.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import itertools
+import functools
+from pathlib import Path
+from collections import OrderedDict
+
+from TTS_lib.utils.journal import text_hash
+from TTS_lib.utils.logger import get_logger, setup_logger
+from TTS_lib.utils.manifest import BuildManifest, input_hash
+from TTS_lib.utils.daedalus import parse_scripts, resolve_speakers
+from TTS_lib.synthesize import (get_synthesizer, output_file_name, split_into_sentences,
+                                find_speaker_id, find_model_file)
+from TTS_lib.render_file import (iter_lines, synthesize_isolated, format_seconds, add_output_arguments,
+                                 setup_output_store, output_settings, PendingWrites)
+
+logger = get_logger('build')
+
+# changes of the output format invalidate all outputs
+BUILD_VERSION = 1
+
+
+class BuildEntry():
+    """An output of the pack, ``path`` is relative to the build folder."""
+    def __init__(self, path, speaker_name, text, inputs):
+        self.path = path
+        self.speaker_name = speaker_name
+        self.text = text
+        self.inputs = inputs
+        self.digest = input_hash(inputs)
+
+
+def parse_line(line):
+    """(name, text) of a ``name|text`` line, the name is None for plain text."""
+    name, sep, text = line.partition('|')
+    if not sep:
+        return None, line
+    return name.strip(), text.strip()
+
+
+def sentence_file_units(sentence_files, speaker_names):
+    """(folder, name, speaker, text, source) of every line of the sentence
+    files for every speaker, the name is None for plain text lines."""
+    for sentence_file in sentence_files:
+        for line_no, line in iter_lines(sentence_file):
+            name, text = parse_line(line)
+            for speaker_name in speaker_names:
+                yield speaker_name, name, speaker_name, text, '{}:{}'.format(sentence_file, line_no)
+
+
+def script_units(dialogue_lines):
+    """Units of the resolved output units of Daedalus scripts, written to
+    the top of the build folder under the names the game plays."""
+    for line in dialogue_lines:
+        if line.speaker is not None:
+            yield '', line.name, line.speaker, line.text, '{}:{}'.format(line.source, line.line_no)
+
+
+def plan_build(manifest, project, units, speakers_json='', style_input=None, vocoder_type='GriffinLim',
+               output=None):
+    """All entries of the pack in the order of ``units``, see ``sentence_file_units``.
+    ``output`` are the settings of the output store from ``output_settings``."""
+    # pylint: disable=import-outside-toplevel
+    from TTS_lib.utils.io import load_config
+    from TTS_lib.utils.text.text_cleaning import clean_sentence
+    config_path = str(Path(project, 'config.json'))
+    C = load_config(config_path)
+    speakers = load_speakers(speakers_json)
+    if not C.get('use_gst', False):
+        style_input = None
+    elif style_input is None:
+        # a neutral style, a random style wav would change every build
+        style_input = {'0': 0.0}
+    shared_inputs = {'build': BUILD_VERSION,
+                     'model': manifest.file_hash(find_model_file(project)),
+                     'config': manifest.file_hash(config_path),
+                     'audio': C.audio,
+                     'vocoder': vocoder_type,
+                     'style': style_input}
+    if output:
+        # plain wav builds keep the hashes they had before these settings
+        shared_inputs['output'] = output
+    if isinstance(style_input, str):
+        shared_inputs['style_wav'] = manifest.file_hash(style_input)
+    entries = OrderedDict()
+    cleaned_texts = {}
+    for folder, name, speaker_name, text, source in units:
+        if text not in cleaned_texts:
+            cleaned_texts[text] = clean_sentence(text)
+        cleaned = cleaned_texts[text]
+        if not split_into_sentences(cleaned):
+            logger.warning(" [!] Skipping %s without text", source)
+            continue
+        if not name:
+            name = output_file_name(cleaned, text_hash(cleaned)[:8])[:-len('.wav')]
+        path = '{}/{}.wav'.format(folder, name) if folder else name + '.wav'
+        if path in entries:
+            logger.warning(" [!] %s is defined twice, using %s", path, source)
+        inputs = dict(shared_inputs, text=cleaned, speaker=speaker_name,
+                      speaker_id=find_speaker_id(speakers, speaker_name))
+        entries[path] = BuildEntry(path, speaker_name, cleaned, inputs)
+    return list(entries.values()), style_input
+
+
+def load_speakers(speakers_json):
+    if not speakers_json:
+        return {}
+    with open(speakers_json, 'r') as f:
+        return json.load(f)
+
+
+def collect_garbage(manifest, store, entries):
+    """Remove the outputs of the manifest that are not part of ``entries``."""
+    keep = {entry.path for entry in entries}
+    removed = 0
+    for path in manifest.paths():
+        if path in keep:
+            continue
+        store.remove(path)
+        manifest.remove(path)
+        removed += 1
+    manifest.commit()
+    return removed
+
+
+def copy_entry(manifest, store, source_path, entry):
+    """Copy an output with the same inputs instead of rendering ``entry``."""
+    store.copy(source_path, entry.path)
+    source = manifest.get(source_path)
+    manifest.record(entry.path, entry.digest, entry.inputs, source['audio_seconds'] if source else None)
+
+
+def copy_existing(manifest, store, entries):
+    """Copy the entries whose inputs match an existing output, e.g. a
+    renamed line. Returns the entries that still have to be rendered."""
+    remaining = []
+    for entry in entries:
+        source_path = manifest.find(entry.digest, store)
+        if source_path is None:
+            remaining.append(entry)
+        else:
+            copy_entry(manifest, store, source_path, entry)
+    manifest.commit()
+    return remaining
+
+
+def render_entries(synthesizer, manifest, store, entries, style_input=None, batch_size=8, chunk_size=64):
+    """Render ``entries`` and record them in the manifest. Entries with the
+    same inputs, e.g. the same text of the same speaker, are rendered once
+    and copied. Returns the failed paths."""
+    ap = synthesizer.ap
+    failed = []
+    start_time = time.perf_counter()
+    duplicates = OrderedDict()
+    for entry in entries:
+        duplicates.setdefault(entry.digest, []).append(entry)
+    unique = [group[0] for group in duplicates.values()]
+    if len(unique) < len(entries):
+        logger.info(" > %d outputs share the inputs of others and are copied", len(entries) - len(unique))
+    writes = PendingWrites()
+
+    def on_done(entry, audio_seconds):
+        manifest.record(entry.path, entry.digest, entry.inputs, audio_seconds)
+        for duplicate in duplicates[entry.digest][1:]:
+            copy_entry(manifest, store, entry.path, duplicate)
+
+    def on_error(entry, error):
+        logger.error(" [!] %s failed: %s", entry.path, error)
+        failed.extend(duplicate.path for duplicate in duplicates[entry.digest])
+
+    num_done = 0
+    total_chars = sum(len(entry.text) for entry in unique)
+    rendered_chars = 0
+    by_speaker = sorted(unique, key=lambda entry: entry.speaker_name)
+    for speaker_name, speaker_entries in itertools.groupby(by_speaker, key=lambda entry: entry.speaker_name):
+        speaker_id = synthesizer.get_speaker_id(speaker_name)
+        speaker_entries = list(speaker_entries)
+        for idx in range(0, len(speaker_entries), chunk_size):
+            chunk = speaker_entries[idx:idx + chunk_size]
+            results = synthesize_isolated(synthesizer, [entry.text for entry in chunk], speaker_id,
+                                          style_input, batch_size)
+            for entry, wav in zip(chunk, results):
+                try:
+                    if isinstance(wav, Exception):
+                        raise wav
+                    result = store.write(entry.path, wav, ap.sample_rate)
+                except Exception as e:  # pylint: disable=broad-except
+                    on_error(entry, e)
+                    continue
+                # outputs are recorded once they are written
+                writes.add(result, functools.partial(on_done, entry, len(wav) / ap.sample_rate),
+                           functools.partial(on_error, entry))
+            writes.poll()
+            manifest.commit()
+            synthesizer.duration_estimator.save()
+            num_done += len(chunk)
+            rendered_chars += sum(len(entry.text) for entry in chunk)
+            elapsed = time.perf_counter() - start_time
+            logger.info(" > %d/%d rendered, %d failed, ETA %s", num_done, len(unique), len(failed),
+                        format_seconds((total_chars - rendered_chars) * elapsed / rendered_chars))
+    writes.poll(wait=True)
+    manifest.commit()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a voice pack, rendering only changed lines.')
+    parser.add_argument('--project', type=str, required=True, help='path to the project folder')
+    parser.add_argument('--sentence_file', type=str, action='append', default=[],
+                        help='file with one "name|text" or text line per output, can be repeated')
+    parser.add_argument('--scripts', type=str, action='append', default=[],
+                        help='Daedalus .d file or folder of a mod, can be repeated')
+    parser.add_argument('--speaker_map', type=str, default=None,
+                        help='json file mapping npc instances, npc names, voice numbers or "hero" '
+                             'of the scripts to speakers.json names')
+    parser.add_argument('--script_encoding', type=str, default='cp1252', help='encoding of the scripts')
+    parser.add_argument('--speakers_json', type=str, default='', help='path to speakers.json')
+    parser.add_argument('--speaker_name', type=str, action='append', default=None,
+                        help='speaker of the pack, can be repeated, default is Default')
+    parser.add_argument('--vocoder', type=str, default='GriffinLim', help='GriffinLim, WaveRNN or MelGAN')
+    parser.add_argument('--use_cuda', action='store_true', help='run on the gpu')
+    parser.add_argument('--style', type=str, default=None,
+                        help='style wav or json GST weights, e.g. {"0": 0.2}, default is a neutral style')
+    parser.add_argument('--out_path', type=str, default=None, help='build folder, default <project>/build')
+    parser.add_argument('--manifest', type=str, default=None, help='default <out_path>/manifest.sqlite')
+    parser.add_argument('--batch_size', type=int, default=8, help='sentences decoded together')
+    add_output_arguments(parser)
+    parser.add_argument('--no_gc', action='store_true', help='keep outputs that are no longer in the pack')
+    parser.add_argument('--dry_run', action='store_true', help='only report what would be rendered and removed')
+    parser.add_argument('--log_level', type=str, default=None, help='DEBUG, INFO, WARNING or ERROR')
+    args = parser.parse_args()
+    setup_logger(args.log_level)
+
+    out_path = args.out_path or str(Path(args.project, 'build'))
+    os.makedirs(out_path, exist_ok=True)
+    style_input = args.style
+    if style_input is not None and style_input.lstrip().startswith('{'):
+        style_input = json.loads(style_input)
+    if not args.sentence_file and not args.scripts:
+        parser.error('pass --sentence_file or --scripts')
+    units = list(sentence_file_units(args.sentence_file, args.speaker_name or ['Default']))
+    if args.scripts:
+        speaker_map = None
+        if args.speaker_map:
+            with open(args.speaker_map, 'r', encoding='utf8') as f:
+                speaker_map = json.load(f)
+        dialogue_lines = parse_scripts(args.scripts, encoding=args.script_encoding)
+        resolve_speakers(dialogue_lines, load_speakers(args.speakers_json), speaker_map)
+        units += list(script_units(dialogue_lines))
+    store = setup_output_store(parser, args, out_path)
+    with store, BuildManifest(args.manifest or os.path.join(out_path, 'manifest.sqlite')) as manifest:
+        entries, style_input = plan_build(manifest, args.project, units, args.speakers_json,
+                                          style_input, args.vocoder, output_settings(store))
+        outdated = [entry for entry in entries if not manifest.is_current(entry.path, entry.digest, store)]
+        paths = {entry.path for entry in entries}
+        stale = [] if args.no_gc else [path for path in manifest.paths() if path not in paths]
+        logger.info(" > %d outputs, %d to render, %d to remove", len(entries), len(outdated), len(stale))
+        if args.dry_run:
+            for entry in outdated:
+                logger.info("   | > render %s", entry.path)
+            for path in stale:
+                logger.info("   | > remove %s", path)
+            return
+        outdated = copy_existing(manifest, store, outdated)
+        if stale:
+            collect_garbage(manifest, store, entries)
+        failed = []
+        if outdated:
+            synthesizer = get_synthesizer(args.project, args.use_cuda, args.vocoder, args.speakers_json)
+            failed = render_entries(synthesizer, manifest, store, outdated, style_input, args.batch_size)
+    if failed:
+        logger.warning(" [!] %d outputs failed, they are rendered again by the next build", len(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
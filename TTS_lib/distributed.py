@@ -0,0 +1,264 @@
+"""Voice pack builds shared by several machines.
+
+    python -m TTS_lib.distributed submit --queue /net/render/xardas --project /net/projects/Xardas \
+        --scripts /net/mods/MyMod --speakers_json /net/projects/Xardas/speakers.json --out_path /net/build
+    python -m TTS_lib.distributed work --queue /net/render/xardas    # on every render host
+    python -m TTS_lib.distributed status --queue /net/render/xardas
+    python -m TTS_lib.distributed collect --queue /net/render/xardas
+
+``submit`` plans the build like ``TTS_lib.build``, copies and removes
+outputs, and splits the entries that have to be rendered into work items of
+a ``TTS_lib.utils.work_queue.WorkQueue``. Workers on any host claim the
+items, render them into the shared build folder and mark them done, the
+items of crashed workers are claimed again once their lease expires.
+``collect`` records the rendered outputs in the build manifest, so the next
+build only renders what changed; ``submit --wait`` collects when all items
+are finished. All hosts need the project and build folder at the same path,
+or ``work --project`` and ``--out_path`` to override them. The manifest is
+only written by ``submit`` and ``collect``. Packed archives use an SQLite
+index and are not supported on shared storage.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import itertools
+import functools
+from pathlib import Path
+from collections import OrderedDict
+
+from TTS_lib.utils.logger import get_logger, setup_logger
+from TTS_lib.utils.manifest import BuildManifest
+from TTS_lib.utils.daedalus import parse_scripts, resolve_speakers
+from TTS_lib.utils.work_queue import WorkQueue, work
+from TTS_lib.build import (sentence_file_units, script_units, plan_build, load_speakers, collect_garbage,
+                           copy_existing)
+from TTS_lib.render_file import (synthesize_isolated, add_output_arguments, setup_output_store, output_settings,
+                                 PendingWrites)
+from TTS_lib.synthesize import get_synthesizer
+
+logger = get_logger('distributed')
+
+# settings of the output store, passed from submit to the workers
+OUTPUT_SETTINGS = ('export', 'export_sample_rate', 'loudness', 'export_workers')
+
+
+def plan_items(entries, item_size):
+    """Payloads of the work items: entries with the same inputs are rendered
+    once and copied by ``collect``, every item holds entries of one speaker."""
+    unique = OrderedDict()
+    for entry in entries:
+        if entry.digest in unique:
+            unique[entry.digest]['copies'].append(entry.path)
+        else:
+            unique[entry.digest] = {'path': entry.path, 'speaker_name': entry.speaker_name, 'text': entry.text,
+                                    'digest': entry.digest, 'inputs': entry.inputs, 'copies': []}
+    payloads = []
+    by_speaker = sorted(unique.values(), key=lambda entry: entry['speaker_name'])
+    for _, speaker_entries in itertools.groupby(by_speaker, key=lambda entry: entry['speaker_name']):
+        speaker_entries = list(speaker_entries)
+        for idx in range(0, len(speaker_entries), item_size):
+            payloads.append({'entries': speaker_entries[idx:idx + item_size]})
+    return payloads
+
+
+def render_item(synthesizer, store, payload, style_input=None, batch_size=8):
+    """Render the entries of a work item into ``store``. Returns the paths
+    and lengths of the rendered entries and the errors of the failed ones."""
+    ap = synthesizer.ap
+    entries = payload['entries']
+    speaker_id = synthesizer.get_speaker_id(entries[0]['speaker_name'])
+    results = synthesize_isolated(synthesizer, [entry['text'] for entry in entries], speaker_id,
+                                  style_input, batch_size)
+    done, failed = [], []
+    writes = PendingWrites()
+
+    def on_error(entry, error):
+        logger.error(" [!] %s failed: %s", entry['path'], error)
+        failed.append({'path': entry['path'], 'error': repr(error)})
+
+    for entry, wav in zip(entries, results):
+        try:
+            if isinstance(wav, Exception):
+                raise wav
+            result = store.write(entry['path'], wav, ap.sample_rate)
+        except Exception as e:  # pylint: disable=broad-except
+            on_error(entry, e)
+            continue
+        writes.add(result,
+                   functools.partial(done.append, {'path': entry['path'],
+                                                   'audio_seconds': len(wav) / ap.sample_rate}),
+                   functools.partial(on_error, entry))
+    writes.poll(wait=True)
+    synthesizer.duration_estimator.save()
+    if not done and failed:
+        # e.g. out of memory, another worker may succeed
+        raise RuntimeError('all {} entries failed, first: {}'.format(len(failed), failed[0]['error']))
+    return {'done': done, 'failed': failed}
+
+
+def collect(queue, manifest, store):
+    """Record the outputs of the done items in the manifest and copy them
+    to the entries with the same inputs. Returns the failed paths."""
+    failed = []
+    for item_id, result in queue.results().items():
+        entries = {entry['path']: entry for entry in queue.payload(item_id)['entries']}
+        for rendered in result['done']:
+            entry = entries[rendered['path']]
+            manifest.record(entry['path'], entry['digest'], entry['inputs'], rendered['audio_seconds'])
+            for path in entry['copies']:
+                store.copy(entry['path'], path)
+                manifest.record(path, entry['digest'], entry['inputs'], rendered['audio_seconds'])
+        for rendered in result['failed']:
+            failed.append(rendered['path'])
+            failed += entries[rendered['path']]['copies']
+        manifest.commit()
+    for item_id in queue.failed():
+        for entry in queue.payload(item_id)['entries']:
+            failed += [entry['path']] + entry['copies']
+    return failed
+
+
+def output_store(parser, settings, out_path):
+    args = argparse.Namespace(archive=None, **{key: settings.get(key) for key in OUTPUT_SETTINGS})
+    return setup_output_store(parser, args, out_path)
+
+
+def submit(parser, args):
+    out_path = args.out_path or str(Path(args.project, 'build'))
+    os.makedirs(out_path, exist_ok=True)
+    style_input = args.style
+    if style_input is not None and style_input.lstrip().startswith('{'):
+        style_input = json.loads(style_input)
+    if not args.sentence_file and not args.scripts:
+        parser.error('pass --sentence_file or --scripts')
+    if args.archive:
+        parser.error('packed archives are not supported on shared storage, use wav files or --export')
+    if os.path.exists(os.path.join(args.queue, 'job.json')):
+        parser.error('{} already holds a work queue, collect it and remove the folder'.format(args.queue))
+    units = list(sentence_file_units(args.sentence_file, args.speaker_name or ['Default']))
+    if args.scripts:
+        speaker_map = None
+        if args.speaker_map:
+            with open(args.speaker_map, 'r', encoding='utf8') as f:
+                speaker_map = json.load(f)
+        dialogue_lines = parse_scripts(args.scripts, encoding=args.script_encoding)
+        resolve_speakers(dialogue_lines, load_speakers(args.speakers_json), speaker_map)
+        units += list(script_units(dialogue_lines))
+    settings = {'project': args.project, 'speakers_json': args.speakers_json, 'vocoder': args.vocoder,
+                'out_path': out_path, 'manifest': args.manifest or os.path.join(out_path, 'manifest.sqlite'),
+                'batch_size': args.batch_size}
+    settings.update({key: getattr(args, key) for key in OUTPUT_SETTINGS})
+    store = output_store(parser, settings, out_path)
+    with store, BuildManifest(settings['manifest']) as manifest:
+        entries, style_input = plan_build(manifest, args.project, units, args.speakers_json,
+                                          style_input, args.vocoder, output_settings(store))
+        outdated = [entry for entry in entries if not manifest.is_current(entry.path, entry.digest, store)]
+        outdated = copy_existing(manifest, store, outdated)
+        if not args.no_gc:
+            removed = collect_garbage(manifest, store, entries)
+            if removed:
+                logger.info(" > Removed %d outputs that are no longer in the pack", removed)
+    payloads = plan_items(outdated, args.item_size)
+    settings['style_input'] = style_input
+    WorkQueue.create(args.queue, settings, payloads)
+    logger.info(" > %d outputs, %d to render in %d work items queued in %s", len(entries), len(outdated),
+                len(payloads), args.queue)
+    if args.wait:
+        queue = WorkQueue(args.queue)
+        while not queue.finished:
+            time.sleep(args.poll_seconds)
+        return collect_queue(parser, args)
+    return 0
+
+
+def work_queue(parser, args):
+    queue = WorkQueue(args.queue, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+    settings = queue.settings
+    project = args.project or settings['project']
+    out_path = args.out_path or settings['out_path']
+    synthesizer = None
+    store = output_store(parser, settings, out_path)
+
+    def handler(payload):
+        nonlocal synthesizer
+        if synthesizer is None:
+            # only hosts that get an item load the model
+            synthesizer = get_synthesizer(project, args.use_cuda, settings['vocoder'],
+                                          args.speakers_json or settings['speakers_json'])
+        return render_item(synthesizer, store, payload, settings['style_input'], settings['batch_size'])
+
+    with store:
+        num_done = work(queue, handler, poll_seconds=args.poll_seconds, max_items=args.max_items)
+    logger.info(" > %s completed %d items", queue.worker_id, num_done)
+    return 0
+
+
+def show_status(parser, args):  # pylint: disable=unused-argument
+    queue = WorkQueue(args.queue)
+    logger.info(" > %s", ', '.join('{} {}'.format(value, key) for key, value in queue.status().items()))
+    return 0
+
+
+def collect_queue(parser, args):
+    queue = WorkQueue(args.queue)
+    settings = queue.settings
+    status = queue.status()
+    if not queue.finished:
+        logger.warning(" [!] %d of %d items are not finished yet", status['items'] - status['done'] - status['failed'],
+                       status['items'])
+    out_path = args.out_path or settings['out_path']
+    with output_store(parser, settings, out_path) as store, BuildManifest(settings['manifest']) as manifest:
+        failed = collect(queue, manifest, store)
+    logger.info(" > Collected %d items", status['done'])
+    if failed:
+        logger.warning(" [!] %d outputs failed, they are rendered again by the next build", len(failed))
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Share the rendering of a voice pack between machines.')
+    parser.add_argument('command', choices=['submit', 'work', 'status', 'collect'])
+    parser.add_argument('--queue', type=str, required=True, help='queue folder on storage shared by all hosts')
+    parser.add_argument('--project', type=str, default=None,
+                        help='path to the project folder, for work only to override the submitted one')
+    parser.add_argument('--sentence_file', type=str, action='append', default=[],
+                        help='file with one "name|text" or text line per output, can be repeated')
+    parser.add_argument('--scripts', type=str, action='append', default=[],
+                        help='Daedalus .d file or folder of a mod, can be repeated')
+    parser.add_argument('--speaker_map', type=str, default=None,
+                        help='json file mapping npcs of the scripts to speakers.json names')
+    parser.add_argument('--script_encoding', type=str, default='cp1252', help='encoding of the scripts')
+    parser.add_argument('--speakers_json', type=str, default='', help='path to speakers.json')
+    parser.add_argument('--speaker_name', type=str, action='append', default=None,
+                        help='speaker of the pack, can be repeated, default is Default')
+    parser.add_argument('--vocoder', type=str, default='GriffinLim', help='GriffinLim, WaveRNN or MelGAN')
+    parser.add_argument('--use_cuda', action='store_true', help='run on the gpu')
+    parser.add_argument('--style', type=str, default=None,
+                        help='style wav or json GST weights, e.g. {"0": 0.2}, default is a neutral style')
+    parser.add_argument('--out_path', type=str, default=None, help='build folder, default <project>/build')
+    parser.add_argument('--manifest', type=str, default=None, help='default <out_path>/manifest.sqlite')
+    parser.add_argument('--batch_size', type=int, default=8, help='sentences decoded together')
+    add_output_arguments(parser)
+    parser.add_argument('--no_gc', action='store_true', help='keep outputs that are no longer in the pack')
+    parser.add_argument('--item_size', type=int, default=32, help='outputs per work item')
+    parser.add_argument('--wait', action='store_true', help='submit: wait for the workers and collect')
+    parser.add_argument('--lease_seconds', type=float, default=300.0,
+                        help='work: an item is claimed again if its worker stops renewing it for this long')
+    parser.add_argument('--max_attempts', type=int, default=3, help='work: claims of an item before it fails')
+    parser.add_argument('--max_items', type=int, default=None, help='work: stop after this many items')
+    parser.add_argument('--poll_seconds', type=float, default=10.0,
+                        help='wait between checks for expired leases or finished queues')
+    parser.add_argument('--log_level', type=str, default=None, help='DEBUG, INFO, WARNING or ERROR')
+    args = parser.parse_args()
+    setup_logger(args.log_level)
+    if args.command == 'submit' and not args.project:
+        parser.error('submit needs --project')
+    commands = {'submit': submit, 'work': work_queue, 'status': show_status, 'collect': collect_queue}
+    sys.exit(commands[args.command](parser, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@ from torch import nn
 from torch.autograd import Variable
 from torch.nn import functional as F
 
+from TTS_lib.utils.decoder_profiler import section
+
 
 class Linear(nn.Module):
     def __init__(self,
@@ -110,6 +112,50 @@ class LocationLayer(nn.Module):
         return processed_attention
 
 
+class AttentionState():
+    """Per request attention states, e.g. ``attention_weights``,
+    ``attention_weights_cum``, ``alpha``, ``u``, ``win_idx`` or ``mu_prev``.
+
+    The attention modules only read their weights, so one module can serve
+    many states concurrently.
+    """
+    # B x T_in states, padded with zeros when states of different lengths are merged
+    TIME_STATES = ('attention_weights', 'attention_weights_cum', 'alpha')
+
+    def __init__(self, **states):
+        self.__dict__.update(states)
+
+    def index_select(self, indices, max_len=None):
+        """Keep the batch entries ``indices`` of all tensor states and
+        optionally drop the time steps beyond ``max_len``."""
+        for name, value in vars(self).items():
+            if isinstance(value, torch.Tensor) and value.dim() > 0 and name != 'J':
+                value = value.index_select(0, indices)
+                if max_len is not None and name in self.TIME_STATES:
+                    value = value[:, :max_len]
+                setattr(self, name, value)
+        return self
+
+    @classmethod
+    def cat(cls, states, max_len):
+        """Merge the states of several batches, padded to ``max_len`` inputs."""
+        merged = {}
+        for name, value in vars(states[0]).items():
+            values = [getattr(state, name) for state in states]
+            if not isinstance(value, torch.Tensor):
+                if any(v != value for v in values):
+                    raise NotImplementedError(" [!] Attention state '{}' cannot be batched.".format(name))
+                merged[name] = value
+            elif name == 'J':
+                # same arange for all states, keep the longest
+                merged[name] = max(values, key=len)
+            else:
+                if name in cls.TIME_STATES:
+                    values = [F.pad(v, (0, max_len - v.size(1))) for v in values]
+                merged[name] = torch.cat(values, dim=0)
+        return cls(**merged)
+
+
 class GravesAttention(nn.Module):
     """ Discretized Graves attention:
         - https://arxiv.org/abs/1910.10288
@@ -123,13 +169,11 @@ class GravesAttention(nn.Module):
         self.K = K
         # self.attention_alignment = 0.05
         self.eps = 1e-5
-        self.J = None
+        self.step_profiler = None
         self.N_a = nn.Sequential(
             nn.Linear(query_dim, query_dim, bias=True),
             nn.ReLU(),
             nn.Linear(query_dim, 3*K, bias=True))
-        self.attention_weights = None
-        self.mu_prev = None
         self.init_layers()
 
     def init_layers(self):
@@ -137,59 +181,64 @@ class GravesAttention(nn.Module):
         torch.nn.init.constant_(self.N_a[2].bias[self.K:(2*self.K)], 10)  # bias std
 
     def init_states(self, inputs):
-        if self.J is None or inputs.shape[1]+1 > self.J.shape[-1]:
-            self.J = torch.arange(0, inputs.shape[1]+2.0).to(inputs.device) + 0.5
-        self.attention_weights = torch.zeros(inputs.shape[0], inputs.shape[1]).to(inputs.device)
-        self.mu_prev = torch.zeros(inputs.shape[0], self.K).to(inputs.device)
+        return AttentionState(
+            J=torch.arange(0, inputs.shape[1]+2.0).to(inputs.device) + 0.5,
+            attention_weights=torch.zeros(inputs.shape[0], inputs.shape[1]).to(inputs.device),
+            mu_prev=torch.zeros(inputs.shape[0], self.K).to(inputs.device))
 
     # pylint: disable=R0201
     # pylint: disable=unused-argument
-    def preprocess_inputs(self, inputs):
+    def preprocess_inputs(self, inputs, static_inputs=None):
         return None
 
-    def forward(self, query, inputs, processed_inputs, mask):
+    def forward(self, query, inputs, processed_inputs, mask, state):
         """
         shapes:
             query: B x D_attention_rnn
             inputs: B x T_in x D_encoder
             processed_inputs: place_holder
             mask: B x T_in
+            state: AttentionState returned by ``init_states``, updated in place
         """
-        gbk_t = self.N_a(query)
-        gbk_t = gbk_t.view(gbk_t.size(0), -1, self.K)
+        profiler = self.step_profiler
+        with section(profiler, 'mixture_params'):
+            gbk_t = self.N_a(query)
+            gbk_t = gbk_t.view(gbk_t.size(0), -1, self.K)
 
-        # attention model parameters
-        # each B x K
-        g_t = gbk_t[:, 0, :]
-        b_t = gbk_t[:, 1, :]
-        k_t = gbk_t[:, 2, :]
+            # attention model parameters
+            # each B x K
+            g_t = gbk_t[:, 0, :]
+            b_t = gbk_t[:, 1, :]
+            k_t = gbk_t[:, 2, :]
 
-        # dropout to decorrelate attention heads
-        g_t = torch.nn.functional.dropout(g_t, p=0.5, training=self.training)
+            # dropout to decorrelate attention heads
+            g_t = torch.nn.functional.dropout(g_t, p=0.5, training=self.training)
 
-        # attention GMM parameters
-        sig_t = torch.nn.functional.softplus(b_t) + self.eps
+            # attention GMM parameters
+            sig_t = torch.nn.functional.softplus(b_t) + self.eps
 
-        mu_t = self.mu_prev + torch.nn.functional.softplus(k_t)
-        g_t = torch.softmax(g_t, dim=-1) + self.eps
+            mu_t = state.mu_prev + torch.nn.functional.softplus(k_t)
+            g_t = torch.softmax(g_t, dim=-1) + self.eps
 
-        j = self.J[:inputs.size(1)+1]
+        with section(profiler, 'weights'):
+            j = state.J[:inputs.size(1)+1]
 
-        # attention weights
-        phi_t = g_t.unsqueeze(-1) * (1 / (1 + torch.sigmoid((mu_t.unsqueeze(-1) - j) / sig_t.unsqueeze(-1))))
+            # attention weights
+            phi_t = g_t.unsqueeze(-1) * (1 / (1 + torch.sigmoid((mu_t.unsqueeze(-1) - j) / sig_t.unsqueeze(-1))))
 
-        # discritize attention weights
-        alpha_t = torch.sum(phi_t, 1)
-        alpha_t = alpha_t[:, 1:] - alpha_t[:, :-1]
-        alpha_t[alpha_t == 0] = 1e-8
+            # discritize attention weights
+            alpha_t = torch.sum(phi_t, 1)
+            alpha_t = alpha_t[:, 1:] - alpha_t[:, :-1]
+            alpha_t[alpha_t == 0] = 1e-8
 
-        # apply masking
-        if mask is not None:
-            alpha_t.data.masked_fill_(~mask, self._mask_value)
+            # apply masking
+            if mask is not None:
+                alpha_t.data.masked_fill_(~mask, self._mask_value)
 
-        context = torch.bmm(alpha_t.unsqueeze(1), inputs).squeeze(1)
-        self.attention_weights = alpha_t
-        self.mu_prev = mu_t
+        with section(profiler, 'context'):
+            context = torch.bmm(alpha_t.unsqueeze(1), inputs).squeeze(1)
+        state.attention_weights = alpha_t
+        state.mu_prev = mu_t
         return context
 
 
@@ -223,88 +272,103 @@ class OriginalAttention(nn.Module):
             )
         self._mask_value = -float("inf")
         self.windowing = windowing
-        self.win_idx = None
+        self.win_back = 2
+        self.win_front = 6
         self.norm = norm
         self.forward_attn = forward_attn
         self.trans_agent = trans_agent
         self.forward_attn_mask = forward_attn_mask
         self.location_attention = location_attention
+        self.step_profiler = None
 
-    def init_win_idx(self):
-        self.win_idx = -1
-        self.win_back = 2
-        self.win_front = 6
+    @staticmethod
+    def init_win_idx(state):
+        state.win_idx = -1
 
-    def init_forward_attn(self, inputs):
+    @staticmethod
+    def init_forward_attn(inputs, state):
         B = inputs.shape[0]
         T = inputs.shape[1]
-        self.alpha = torch.cat(
+        state.alpha = torch.cat(
             [torch.ones([B, 1]),
              torch.zeros([B, T])[:, :-1] + 1e-7], dim=1).to(inputs.device)
-        self.u = (0.5 * torch.ones([B, 1])).to(inputs.device)
+        state.u = (0.5 * torch.ones([B, 1])).to(inputs.device)
 
-    def init_location_attention(self, inputs):
+    @staticmethod
+    def init_location_attention(inputs, state):
         B = inputs.shape[0]
         T = inputs.shape[1]
-        self.attention_weights_cum = Variable(inputs.data.new(B, T).zero_())
+        state.attention_weights_cum = Variable(inputs.data.new(B, T).zero_())
 
     def init_states(self, inputs):
         B = inputs.shape[0]
         T = inputs.shape[1]
-        self.attention_weights = Variable(inputs.data.new(B, T).zero_())
+        state = AttentionState(attention_weights=Variable(inputs.data.new(B, T).zero_()))
         if self.location_attention:
-            self.init_location_attention(inputs)
+            self.init_location_attention(inputs, state)
         if self.forward_attn:
-            self.init_forward_attn(inputs)
+            self.init_forward_attn(inputs, state)
         if self.windowing:
-            self.init_win_idx()
-
-    def preprocess_inputs(self, inputs):
-        return self.inputs_layer(inputs)
-
-    def update_location_attention(self, alignments):
-        self.attention_weights_cum += alignments
-
-    def get_location_attention(self, query, processed_inputs):
-        attention_cat = torch.cat((self.attention_weights.unsqueeze(1),
-                                   self.attention_weights_cum.unsqueeze(1)),
-                                  dim=1)
-        processed_query = self.query_layer(query.unsqueeze(1))
-        processed_attention_weights = self.location_layer(attention_cat)
-        energies = self.v(
-            torch.tanh(processed_query + processed_attention_weights +
-                       processed_inputs))
-        energies = energies.squeeze(-1)
+            self.init_win_idx(state)
+        return state
+
+    def preprocess_inputs(self, inputs, static_inputs=None):
+        if static_inputs is None:
+            return self.inputs_layer(inputs)
+        # project the encoder frames and the time invariant inputs separately
+        weight = self.inputs_layer.linear_layer.weight
+        D_en = inputs.size(2)
+        processed_inputs = F.linear(inputs, weight[:, :D_en])
+        processed_static = F.linear(static_inputs, weight[:, D_en:])
+        return processed_inputs + processed_static.unsqueeze(1)
+
+    @staticmethod
+    def update_location_attention(alignments, state):
+        state.attention_weights_cum = state.attention_weights_cum + alignments
+
+    def get_location_attention(self, query, processed_inputs, state):
+        with section(self.step_profiler, 'location_conv'):
+            attention_cat = torch.cat((state.attention_weights.unsqueeze(1),
+                                       state.attention_weights_cum.unsqueeze(1)),
+                                      dim=1)
+            processed_attention_weights = self.location_layer(attention_cat)
+        with section(self.step_profiler, 'energies'):
+            processed_query = self.query_layer(query.unsqueeze(1))
+            energies = self.v(
+                torch.tanh(processed_query + processed_attention_weights +
+                           processed_inputs))
+            energies = energies.squeeze(-1)
         return energies, processed_query
 
     def get_attention(self, query, processed_inputs):
-        processed_query = self.query_layer(query.unsqueeze(1))
-        energies = self.v(torch.tanh(processed_query + processed_inputs))
-        energies = energies.squeeze(-1)
+        with section(self.step_profiler, 'energies'):
+            processed_query = self.query_layer(query.unsqueeze(1))
+            energies = self.v(torch.tanh(processed_query + processed_inputs))
+            energies = energies.squeeze(-1)
         return energies, processed_query
 
-    def apply_windowing(self, attention, inputs):
-        back_win = self.win_idx - self.win_back
-        front_win = self.win_idx + self.win_front
+    def apply_windowing(self, attention, inputs, state):
+        back_win = state.win_idx - self.win_back
+        front_win = state.win_idx + self.win_front
         if back_win > 0:
             attention[:, :back_win] = -float("inf")
         if front_win < inputs.shape[1]:
             attention[:, front_win:] = -float("inf")
         # this is a trick to solve a special problem.
         # but it does not hurt.
-        if self.win_idx == -1:
+        if state.win_idx == -1:
             attention[:, 0] = attention.max()
         # Update the window
-        self.win_idx = torch.argmax(attention, 1).long()[0].item()
+        state.win_idx = torch.argmax(attention, 1).long()[0].item()
         return attention
 
-    def apply_forward_attention(self, alignment):
+    def apply_forward_attention(self, alignment, state):
         # forward attention
-        fwd_shifted_alpha = F.pad(self.alpha[:, :-1].clone().to(alignment.device),
+        fwd_shifted_alpha = F.pad(state.alpha[:, :-1].clone().to(alignment.device),
                             (1, 0, 0, 0))
         # compute transition potentials
-        alpha = ((1 - self.u) * self.alpha
-                 + self.u * fwd_shifted_alpha
+        alpha = ((1 - state.u) * state.alpha
+                 + state.u * fwd_shifted_alpha
                  + 1e-8) * alignment
         # force incremental alignment
         if not self.training and self.forward_attn_mask:
@@ -322,53 +386,60 @@ class OriginalAttention(nn.Module):
         alpha = alpha / alpha.sum(dim=1, keepdim=True)
         return alpha
 
-    def forward(self, query, inputs, processed_inputs, mask):
+    def forward(self, query, inputs, processed_inputs, mask, state):
         """
         shapes:
             query: B x D_attn_rnn
             inputs: B x T_en x D_en
             processed_inputs:: B x T_en x D_attn
             mask: B x T_en
+            state: AttentionState returned by ``init_states``, updated in place
         """
         if self.location_attention:
             attention, _ = self.get_location_attention(
-                query, processed_inputs)
+                query, processed_inputs, state)
         else:
             attention, _ = self.get_attention(
                 query, processed_inputs)
+        profiler = self.step_profiler
         # apply masking
         if mask is not None:
             attention.data.masked_fill_(~mask, self._mask_value)
         # apply windowing - only in eval mode
         if not self.training and self.windowing:
-            attention = self.apply_windowing(attention, inputs)
+            with section(profiler, 'windowing'):
+                attention = self.apply_windowing(attention, inputs, state)
 
         # normalize attention values
-        if self.norm == "softmax":
-            alignment = torch.softmax(attention, dim=-1)
-        elif self.norm == "sigmoid":
-            alignment = torch.sigmoid(attention) / torch.sigmoid(
-                attention).sum(
-                    dim=1, keepdim=True)
-        else:
-            raise ValueError("Unknown value for attention norm type")
+        with section(profiler, 'normalization'):
+            if self.norm == "softmax":
+                alignment = torch.softmax(attention, dim=-1)
+            elif self.norm == "sigmoid":
+                alignment = torch.sigmoid(attention) / torch.sigmoid(
+                    attention).sum(
+                        dim=1, keepdim=True)
+            else:
+                raise ValueError("Unknown value for attention norm type")
 
-        if self.location_attention:
-            self.update_location_attention(alignment)
+            if self.location_attention:
+                self.update_location_attention(alignment, state)
 
         # apply forward attention if enabled
         if self.forward_attn:
-            alignment = self.apply_forward_attention(alignment)
-            self.alpha = alignment
+            with section(profiler, 'forward_attention'):
+                alignment = self.apply_forward_attention(alignment, state)
+                state.alpha = alignment
 
-        context = torch.bmm(alignment.unsqueeze(1), inputs)
-        context = context.squeeze(1)
-        self.attention_weights = alignment
+        with section(profiler, 'context'):
+            context = torch.bmm(alignment.unsqueeze(1), inputs)
+            context = context.squeeze(1)
+        state.attention_weights = alignment
 
         # compute transition agent
         if self.forward_attn and self.trans_agent:
-            ta_input = torch.cat([context, query.squeeze(1)], dim=-1)
-            self.u = torch.sigmoid(self.ta(ta_input))
+            with section(profiler, 'transition_agent'):
+                ta_input = torch.cat([context, query.squeeze(1)], dim=-1)
+                state.u = torch.sigmoid(self.ta(ta_input))
         return context
 
 
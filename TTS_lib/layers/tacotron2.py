@@ -2,7 +2,13 @@ import torch
 from torch.autograd import Variable
 from torch import nn
 from torch.nn import functional as F
-from .common_layers import init_attn, Prenet, Linear
+from .common_layers import init_attn, Prenet, Linear, OriginalAttention
+from TTS_lib.utils.logger import get_logger
+from TTS_lib.utils.decoder_profiler import section, describe_attention, NULL_SECTION
+# defined without torch, so the backends without torch raise it as well
+from TTS_lib.utils.backends import DecodingCancelled
+
+logger = get_logger('decoder')
 
 
 class ConvBNBlock(nn.Module):
@@ -88,6 +94,131 @@ class Encoder(nn.Module):
         return o
 
 
+class GrowableBuffer():
+    """Preallocated B x capacity x ... buffer for per step outputs.
+
+    The capacity doubles when it is exceeded, so appending is amortized O(1)
+    and the outputs are not stacked from a list at the end.
+    """
+    def __init__(self, capacity=64):
+        self.capacity = max(1, capacity)
+        self.data = None
+        self.length = 0
+
+    def append(self, x):
+        if self.data is None:
+            self.data = x.new_empty((x.size(0), self.capacity) + tuple(x.shape[1:]))
+        elif self.length == self.data.size(1):
+            data = x.new_empty((x.size(0), 2 * self.length) + tuple(x.shape[1:]))
+            data[:, :self.length] = self.data
+            self.data = data
+        self.data[:, self.length] = x
+        self.length += 1
+
+    def get(self):
+        return self.data[:, :self.length]
+
+
+class DecoderState():
+    """Recurrent states of one decoder run.
+
+    The decoder and attention modules only read their weights during
+    inference, all per request tensors live here, so a single model can
+    decode several requests concurrently, e.g. from different threads.
+    """
+    def __init__(self, inputs, processed_inputs, mask, query, attention_rnn_cell_state,
+                 decoder_hidden, decoder_cell, context, attention, static_terms=None,
+                 memory=None):
+        self.inputs = inputs
+        self.processed_inputs = processed_inputs
+        self.mask = mask
+        self.query = query
+        self.attention_rnn_cell_state = attention_rnn_cell_state
+        self.decoder_hidden = decoder_hidden
+        self.decoder_cell = decoder_cell
+        self.context = context
+        # AttentionState of the attention module
+        self.attention = attention
+        # per utterance speaker/style terms, see Decoder._precompute_static_terms
+        self.static_terms = static_terms
+        # last decoder output, kept between inference_truncated calls
+        self.memory = memory
+
+    @property
+    def batch_size(self):
+        return self.query.size(0)
+
+    def index_select(self, indices, max_len=None):
+        """Keep the batch entries ``indices``, e.g. to evict finished
+        utterances, and optionally drop the inputs beyond ``max_len``."""
+        for name in ['inputs', 'processed_inputs', 'mask']:
+            value = getattr(self, name)
+            if value is not None:
+                value = value.index_select(0, indices)
+                setattr(self, name, value[:, :max_len] if max_len is not None else value)
+        for name in ['query', 'attention_rnn_cell_state', 'decoder_hidden', 'decoder_cell',
+                     'context', 'memory']:
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, value.index_select(0, indices))
+        if self.static_terms is not None:
+            # the weights are shared, the last entry is the per utterance bias
+            self.static_terms = {name: terms[:-1] + (terms[-1].index_select(0, indices),)
+                                 for name, terms in self.static_terms.items()}
+        self.attention.index_select(indices, max_len)
+        return self
+
+    @classmethod
+    def cat(cls, states):
+        """Merge the states of several batches into one. Shorter inputs
+        are zero padded and masked, so every utterance decodes as it would
+        alone."""
+        max_len = max(state.inputs.size(1) for state in states)
+        has_static_terms = [state.static_terms is not None for state in states]
+        if any(has_static_terms) and not all(has_static_terms):
+            raise ValueError(" [!] States with and without static inputs cannot be merged.")
+
+        def pad(value):
+            return F.pad(value, (0, 0, 0, max_len - value.size(1)))
+
+        masks = []
+        for state in states:
+            B, T = state.inputs.shape[:2]
+            mask = state.mask
+            if mask is None:
+                mask = state.inputs.new_ones(B, T, dtype=torch.bool)
+            masks.append(F.pad(mask, (0, max_len - T), value=False))
+        static_terms = None
+        if states[0].static_terms is not None:
+            static_terms = {}
+            for name, terms in states[0].static_terms.items():
+                biases = [state.static_terms[name][-1].expand(state.batch_size, -1)
+                          for state in states]
+                static_terms[name] = terms[:-1] + (torch.cat(biases, dim=0),)
+
+        def cat(name):
+            values = [getattr(state, name) for state in states]
+            if any(value is None for value in values):
+                return None
+            return torch.cat(values, dim=0)
+
+        processed_inputs = None
+        if states[0].processed_inputs is not None:
+            processed_inputs = torch.cat([pad(state.processed_inputs) for state in states], dim=0)
+        return cls(inputs=torch.cat([pad(state.inputs) for state in states], dim=0),
+                   processed_inputs=processed_inputs,
+                   mask=torch.cat(masks, dim=0),
+                   query=cat('query'),
+                   attention_rnn_cell_state=cat('attention_rnn_cell_state'),
+                   decoder_hidden=cat('decoder_hidden'),
+                   decoder_cell=cat('decoder_cell'),
+                   context=cat('context'),
+                   attention=type(states[0].attention).cat(
+                       [state.attention for state in states], max_len),
+                   static_terms=static_terms,
+                   memory=cat('memory'))
+
+
 # adapted from https://github.com/NVIDIA/tacotron2/
 class Decoder(nn.Module):
     # Pylint gets confused by PyTorch conventions here
@@ -152,34 +283,137 @@ class Decoder(nn.Module):
                    1,
                    bias=True,
                    init_gain='sigmoid'))
-        self.memory_truncated = None
+        self.step_profiler = None
+        # all-zero initial states reused by inference calls
+        self._zeros = {}
 
     def set_r(self, new_r):
         self.r = new_r
 
+    def set_step_profiler(self, profiler):
+        """Time the sub-operations of every step, see ``TTS_lib.utils.decoder_profiler``."""
+        self.step_profiler = profiler
+        self.attention.step_profiler = profiler
+
+    def _step_section(self):
+        if self.step_profiler is None:
+            return NULL_SECTION
+        return self.step_profiler.step()
+
+    def _get_zeros(self, B, dim, inputs):
+        """B x dim zeros. In eval mode they are cached and shared, callers
+        replace the states instead of writing to them."""
+        if self.training:
+            return inputs.new_zeros(B, dim)
+        key = (B, dim, inputs.device, inputs.dtype)
+        zeros = self._zeros.get(key)
+        if zeros is None:
+            if len(self._zeros) > 64:
+                self._zeros.clear()
+            zeros = self._zeros[key] = inputs.new_zeros(B, dim)
+        return zeros
+
     def get_go_frame(self, inputs):
         B = inputs.size(0)
-        memory = torch.zeros(1, device=inputs.device).repeat(B,
-                             self.frame_dim * self.r)
-        return memory
+        return self._get_zeros(B, self.frame_dim * self.r, inputs)
 
-    def _init_states(self, inputs, mask, keep_states=False):
+    def init_state(self, inputs, mask=None, static_inputs=None, state=None):
+        """Create the DecoderState of a new run. If ``state`` is given its
+        recurrent states are kept and only the inputs and the attention are
+        reset, e.g. to continue decoding with the next chunk of inputs."""
         B = inputs.size(0)
-        # T = inputs.size(1)
-        if not keep_states:
-            self.query = torch.zeros(1, device=inputs.device).repeat(
-                B, self.query_dim)
-            self.attention_rnn_cell_state = torch.zeros(
-                1, device=inputs.device).repeat(B, self.query_dim)
-            self.decoder_hidden = torch.zeros(1, device=inputs.device).repeat(
-                B, self.decoder_rnn_dim)
-            self.decoder_cell = torch.zeros(1, device=inputs.device).repeat(
-                B, self.decoder_rnn_dim)
-            self.context = torch.zeros(1, device=inputs.device).repeat(
-                B, self.encoder_embedding_dim)
-        self.inputs = inputs
-        self.processed_inputs = self.attention.preprocess_inputs(inputs)
-        self.mask = mask
+        if static_inputs is None:
+            static_terms = None
+            processed_inputs = self.attention.preprocess_inputs(inputs)
+        else:
+            static_terms = self._precompute_static_terms(inputs, static_inputs)
+            processed_inputs = self.attention.preprocess_inputs(inputs, static_inputs)
+        attention_state = self.attention.init_states(inputs)
+        if state is not None:
+            state.inputs = inputs
+            state.processed_inputs = processed_inputs
+            state.mask = mask
+            state.static_terms = static_terms
+            state.attention = attention_state
+            return state
+        return DecoderState(
+            inputs=inputs,
+            processed_inputs=processed_inputs,
+            mask=mask,
+            query=self._get_zeros(B, self.query_dim, inputs),
+            attention_rnn_cell_state=self._get_zeros(B, self.query_dim, inputs),
+            decoder_hidden=self._get_zeros(B, self.decoder_rnn_dim, inputs),
+            decoder_cell=self._get_zeros(B, self.decoder_rnn_dim, inputs),
+            context=self._get_zeros(B, inputs.size(2), inputs),
+            attention=attention_state,
+            static_terms=static_terms)
+
+    def supports_static_inputs(self):
+        """Whether the layers consuming the context vector can be split into
+        an encoder part and a precomputed static (speaker/style) part."""
+        return (isinstance(self.attention, OriginalAttention)
+                and not self.attention.trans_agent
+                and type(self.attention_rnn) is nn.LSTMCell
+                and type(self.decoder_rnn) is nn.LSTMCell
+                and type(self.linear_projection.linear_layer) is nn.Linear
+                and type(self.attention.inputs_layer.linear_layer) is nn.Linear)
+
+    def prepare_static_inputs(self, inputs, static_inputs):
+        """Concatenate the static inputs to every input frame if the layers
+        cannot be split, see ``supports_static_inputs``."""
+        if static_inputs is not None and not self.supports_static_inputs():
+            static_inputs = static_inputs.unsqueeze(1).expand(-1, inputs.size(1), -1)
+            inputs = torch.cat([inputs, static_inputs], dim=-1)
+            static_inputs = None
+        return inputs, static_inputs
+
+    def _precompute_static_terms(self, inputs, static_inputs):
+        """
+        The context vector is [encoder context, static inputs] because the
+        attention weights sum to one. Every layer consuming it is linear in its
+        input, so the static columns of their weights are folded into a bias
+        once per utterance. The attention rnn sees the all-zero initial
+        context at the first step, so it starts without the static bias.
+        shapes:
+            - inputs: B x T_in x D_en
+            - static_inputs: B x D_static
+        """
+        D_en = inputs.size(2)
+
+        def split_lstm_cell(cell, num_dynamic, use_static=True):
+            bias = cell.bias_ih + cell.bias_hh
+            if use_static:
+                bias = bias + F.linear(static_inputs, cell.weight_ih[:, num_dynamic:])
+            return cell.weight_ih[:, :num_dynamic], cell.weight_hh, bias
+
+        def split_linear(layer, num_dynamic):
+            bias = F.linear(static_inputs, layer.weight[:, num_dynamic:], layer.bias)
+            return layer.weight[:, :num_dynamic], bias
+
+        return {
+            'attention_rnn': split_lstm_cell(self.attention_rnn, self.prenet_dim + D_en,
+                                             use_static=False),
+            'attention_rnn_context': split_lstm_cell(self.attention_rnn, self.prenet_dim + D_en),
+            'decoder_rnn': split_lstm_cell(self.decoder_rnn, self.query_dim + D_en),
+            'linear_projection': split_linear(self.linear_projection.linear_layer,
+                                              self.decoder_rnn_dim + D_en)
+        }
+
+    def _lstm_cell(self, name, x, hx, static_terms=None):
+        if static_terms is None:
+            return getattr(self, name)(x, hx)
+        weight_ih, weight_hh, bias = static_terms[name]
+        gates = F.linear(x, weight_ih) + F.linear(hx[0], weight_hh) + bias
+        in_gate, forget_gate, cell_gate, out_gate = gates.chunk(4, 1)
+        cell = torch.sigmoid(forget_gate) * hx[1] + torch.sigmoid(in_gate) * torch.tanh(cell_gate)
+        hidden = torch.sigmoid(out_gate) * torch.tanh(cell)
+        return hidden, cell
+
+    def _project(self, x, static_terms=None):
+        if static_terms is None:
+            return self.linear_projection(x)
+        weight, bias = static_terms['linear_projection']
+        return F.linear(x, weight, bias)
 
     def _reshape_memory(self, memory):
         """
@@ -205,46 +439,59 @@ class Decoder(nn.Module):
             return memory[:, self.frame_dim * (self.r - 1):]
         return memory[:, :, self.frame_dim * (self.r - 1):]
 
-    def decode(self, memory):
+    def decode(self, memory, state):
         '''
          shapes:
             - memory: B x r * self.frame_dim
+            - state: DecoderState returned by ``init_state``, updated in place
         '''
-        # self.context: B x D_en
+        # state.context: B x D_en
         # query_input: B x D_en + (r * self.frame_dim)
-        query_input = torch.cat((memory, self.context), -1)
-        # self.query and self.attention_rnn_cell_state : B x D_attn_rnn
-        self.query, self.attention_rnn_cell_state = self.attention_rnn(
-            query_input, (self.query, self.attention_rnn_cell_state))
-        self.query = F.dropout(self.query, self.p_attention_dropout,
-                               self.training)
-        self.attention_rnn_cell_state = F.dropout(
-            self.attention_rnn_cell_state, self.p_attention_dropout,
+        profiler = self.step_profiler
+        static_terms = state.static_terms
+        query_input = torch.cat((memory, state.context), -1)
+        # state.query and state.attention_rnn_cell_state : B x D_attn_rnn
+        with section(profiler, 'attention_rnn'):
+            state.query, state.attention_rnn_cell_state = self._lstm_cell(
+                'attention_rnn', query_input, (state.query, state.attention_rnn_cell_state),
+                static_terms)
+        state.query = F.dropout(state.query, self.p_attention_dropout,
+                                self.training)
+        state.attention_rnn_cell_state = F.dropout(
+            state.attention_rnn_cell_state, self.p_attention_dropout,
             self.training)
         # B x D_en
-        self.context = self.attention(self.query, self.inputs,
-                                      self.processed_inputs, self.mask)
+        with section(profiler, 'attention'):
+            state.context = self.attention(state.query, state.inputs,
+                                           state.processed_inputs, state.mask,
+                                           state.attention)
+        if static_terms is not None:
+            static_terms['attention_rnn'] = static_terms['attention_rnn_context']
         # B x (D_en + D_attn_rnn)
-        decoder_rnn_input = torch.cat((self.query, self.context), -1)
-        # self.decoder_hidden and self.decoder_cell: B x D_decoder_rnn
-        self.decoder_hidden, self.decoder_cell = self.decoder_rnn(
-            decoder_rnn_input, (self.decoder_hidden, self.decoder_cell))
-        self.decoder_hidden = F.dropout(self.decoder_hidden,
-                                        self.p_decoder_dropout, self.training)
+        decoder_rnn_input = torch.cat((state.query, state.context), -1)
+        # state.decoder_hidden and state.decoder_cell: B x D_decoder_rnn
+        with section(profiler, 'decoder_rnn'):
+            state.decoder_hidden, state.decoder_cell = self._lstm_cell(
+                'decoder_rnn', decoder_rnn_input, (state.decoder_hidden, state.decoder_cell),
+                static_terms)
+        state.decoder_hidden = F.dropout(state.decoder_hidden,
+                                         self.p_decoder_dropout, self.training)
         # B x (D_decoder_rnn + D_en)
-        decoder_hidden_context = torch.cat((self.decoder_hidden, self.context),
+        decoder_hidden_context = torch.cat((state.decoder_hidden, state.context),
                                            dim=1)
         # B x (self.r * self.frame_dim)
-        decoder_output = self.linear_projection(decoder_hidden_context)
+        with section(profiler, 'linear_projection'):
+            decoder_output = self._project(decoder_hidden_context, static_terms)
         # B x (D_decoder_rnn + (self.r * self.frame_dim))
-        stopnet_input = torch.cat((self.decoder_hidden, decoder_output), dim=1)
-        if self.separate_stopnet:
-            stop_token = self.stopnet(stopnet_input.detach())
-        else:
-            stop_token = self.stopnet(stopnet_input)
+        with section(profiler, 'stopnet'):
+            stopnet_input = torch.cat((state.decoder_hidden, decoder_output), dim=1)
+            if self.separate_stopnet:
+                stop_token = self.stopnet(stopnet_input.detach())
+            else:
+                stop_token = self.stopnet(stopnet_input)
         # select outputs for the reduction rate self.r
         decoder_output = decoder_output[:, :self.r * self.frame_dim]
-        return decoder_output, self.attention.attention_weights, stop_token
+        return decoder_output, state.attention.attention_weights, stop_token
 
     def forward(self, inputs, memories, mask, speaker_embeddings=None):
         memory = self.get_go_frame(inputs).unsqueeze(0)
@@ -255,13 +502,12 @@ class Decoder(nn.Module):
             memories = torch.cat([memories, speaker_embeddings], dim=-1)
         memories = self.prenet(memories)
 
-        self._init_states(inputs, mask=mask)
-        self.attention.init_states(inputs)
+        state = self.init_state(inputs, mask=mask)
 
         outputs, stop_tokens, alignments = [], [], []
         while len(outputs) < memories.size(0) - 1:
             memory = memories[len(outputs)]
-            decoder_output, attention_weights, stop_token = self.decode(memory)
+            decoder_output, attention_weights, stop_token = self.decode(memory, state)
             outputs += [decoder_output.squeeze(1)]
             stop_tokens += [stop_token.squeeze(1)]
             alignments += [attention_weights]
@@ -270,55 +516,107 @@ class Decoder(nn.Module):
             outputs, stop_tokens, alignments)
         return outputs, alignments, stop_tokens
 
-    def inference(self, inputs, speaker_embeddings=None):
+    def inference(self, inputs, speaker_embeddings=None, static_inputs=None, num_steps=None,
+                  return_alignments=True, alignment_top_k=None, return_stop_tokens=True,
+                  expected_steps=None, max_decoder_steps=None, cancel_event=None):
+        """
+        shapes:
+            - inputs: B x T_in x D_en
+            - static_inputs: B x D_static speaker and style embeddings that
+              belong to every input frame. They are only concatenated to
+              ``inputs`` if the layers cannot be split.
+            - num_steps: run exactly this many decoder steps and ignore the
+              stop tokens, e.g. to benchmark models with random weights.
+            - return_alignments: collect the B x T_decoder x T_in alignments.
+              If False, ``alignment_top_k`` keeps only the k largest weights
+              of every step as (values, indices), both B x T_decoder x k.
+              Otherwise None is returned in their place.
+            - return_stop_tokens: collect the B x T_decoder x 1 stop tokens,
+              None is returned otherwise.
+            - expected_steps: initial capacity of the output buffers.
+            - max_decoder_steps: step limit of this call, at most
+              ``self.max_decoder_steps``, e.g. from a duration estimate.
+            - cancel_event: threading.Event, decoding stops with
+              ``DecodingCancelled`` at the next step once it is set.
+        """
+        inputs, static_inputs = self.prepare_static_inputs(inputs, static_inputs)
         memory = self.get_go_frame(inputs)
         memory = self._update_memory(memory)
 
-        self._init_states(inputs, mask=None)
-        self.attention.init_states(inputs)
-
-        outputs, stop_tokens, alignments, t = [], [], [], 0
+        state = self.init_state(inputs, mask=None, static_inputs=static_inputs)
+        if self.step_profiler is not None:
+            self.step_profiler.begin_utterance(inputs.size(1), describe_attention(self.attention))
+
+        if expected_steps is None:
+            # roughly 6 frames per input token
+            expected_steps = inputs.size(1) * 6 // self.r + 16
+        max_steps = min(max_decoder_steps or self.max_decoder_steps, self.max_decoder_steps)
+        capacity = num_steps or min(expected_steps, max_steps)
+        outputs = GrowableBuffer(capacity)
+        stop_tokens = GrowableBuffer(capacity) if return_stop_tokens else None
+        alignments = GrowableBuffer(capacity) if return_alignments else None
+        top_k_values, top_k_indices = None, None
+        if alignment_top_k and not return_alignments:
+            top_k = min(alignment_top_k, inputs.size(1))
+            top_k_values, top_k_indices = GrowableBuffer(capacity), GrowableBuffer(capacity)
+        t = 0
         while True:
-            memory = self.prenet(memory)
-            if speaker_embeddings is not None:
-                memory = torch.cat([memory, speaker_embeddings], dim=-1)
-            decoder_output, alignment, stop_token = self.decode(memory)
-            stop_token = torch.sigmoid(stop_token.data)
-            outputs += [decoder_output.squeeze(1)]
-            stop_tokens += [stop_token]
-            alignments += [alignment]
-
-            if stop_token > 0.7 and t > inputs.shape[0] / 2:
+            if cancel_event is not None and cancel_event.is_set():
+                raise DecodingCancelled()
+            with self._step_section():
+                with section(self.step_profiler, 'prenet'):
+                    memory = self.prenet(memory)
+                if speaker_embeddings is not None:
+                    memory = torch.cat([memory, speaker_embeddings], dim=-1)
+                decoder_output, alignment, stop_token = self.decode(memory, state)
+                stop_token = torch.sigmoid(stop_token.data)
+            outputs.append(decoder_output)
+            if stop_tokens is not None:
+                stop_tokens.append(stop_token)
+            if alignments is not None:
+                alignments.append(alignment)
+            elif top_k_values is not None:
+                values, indices = alignment.topk(top_k, dim=1)
+                top_k_values.append(values)
+                top_k_indices.append(indices)
+
+            if num_steps is not None:
+                if outputs.length == num_steps:
+                    break
+            elif stop_token > 0.7 and t > inputs.shape[0] / 2:
                 break
-            if len(outputs) == self.max_decoder_steps:
-                print("   | > Decoder stopped with 'max_decoder_steps")
+            elif outputs.length == max_steps:
+                logger.warning("   | > Decoder stopped with 'max_decoder_steps")
                 break
 
             memory = self._update_memory(decoder_output)
             t += 1
 
-        outputs, stop_tokens, alignments = self._parse_outputs(
-            outputs, stop_tokens, alignments)
-
+        # B x T_decoder x (r * frame_dim) -> B x frame_dim x T_out
+        outputs = outputs.get().reshape(inputs.size(0), -1, self.frame_dim).transpose(1, 2)
+        if stop_tokens is not None:
+            stop_tokens = stop_tokens.get()
+        if alignments is not None:
+            alignments = alignments.get()
+        elif top_k_values is not None:
+            alignments = (top_k_values.get(), top_k_indices.get())
         return outputs, alignments, stop_tokens
 
-    def inference_truncated(self, inputs):
+    def inference_truncated(self, inputs, state=None):
         """
-        Preserve decoder states for continuous inference
+        Preserve decoder states for continuous inference. Pass the returned
+        state to the next call to continue decoding.
         """
-        if self.memory_truncated is None:
-            self.memory_truncated = self.get_go_frame(inputs)
-            self._init_states(inputs, mask=None, keep_states=False)
+        if state is None:
+            state = self.init_state(inputs, mask=None)
+            state.memory = self._update_memory(self.get_go_frame(inputs))
         else:
-            self._init_states(inputs, mask=None, keep_states=True)
+            state = self.init_state(inputs, mask=None, state=state)
 
-        self.attention.init_win_idx()
-        self.attention.init_states(inputs)
         outputs, stop_tokens, alignments, t = [], [], [], 0
-        stop_flags = [True, False, False]
         while True:
-            memory = self.prenet(self.memory_truncated)
-            decoder_output, alignment, stop_token = self.decode(memory)
+            memory = self.prenet(state.memory)
+            decoder_output, alignment, stop_token = self.decode(memory, state)
             stop_token = torch.sigmoid(stop_token.data)
             outputs += [decoder_output.squeeze(1)]
             stop_tokens += [stop_token]
@@ -327,27 +625,27 @@ class Decoder(nn.Module):
             if stop_token > 0.7:
                 break
             if len(outputs) == self.max_decoder_steps:
-                print("   | > Decoder stopped with 'max_decoder_steps")
+                logger.warning("   | > Decoder stopped with 'max_decoder_steps")
                 break
 
-            self.memory_truncated = decoder_output
+            state.memory = self._update_memory(decoder_output)
             t += 1
 
         outputs, stop_tokens, alignments = self._parse_outputs(
             outputs, stop_tokens, alignments)
 
-        return outputs, alignments, stop_tokens
+        return outputs, alignments, stop_tokens, state
 
-    def inference_step(self, inputs, t, memory=None):
+    def inference_step(self, inputs, t, memory=None, state=None):
         """
         For debug purposes
         """
         if t == 0:
             memory = self.get_go_frame(inputs)
-            self._init_states(inputs, mask=None)
+            state = self.init_state(inputs, mask=None)
 
         memory = self.prenet(memory)
-        decoder_output, stop_token, alignment = self.decode(memory)
+        decoder_output, stop_token, alignment = self.decode(memory, state)
         stop_token = torch.sigmoid(stop_token.data)
         memory = decoder_output
-        return decoder_output, stop_token, alignment
+        return decoder_output, stop_token, alignment, state
@@ -5,6 +5,7 @@ from torch import nn
 from TTS_lib.layers.tacotron2 import Encoder, Decoder, Postnet
 from TTS_lib.utils.generic_utils import sequence_mask
 from TTS_lib.layers.gst_layers import GST
+from TTS_lib.utils.metrics import metrics
 import random
 
 
@@ -83,6 +84,12 @@ class Tacotron2(nn.Module):
         return mel_outputs, mel_outputs_postnet, alignments
 
     def compute_gst(self, inputs, style_input):
+        gst_outputs = self.compute_style_embedding(inputs, style_input)
+        embedded_gst = gst_outputs.repeat(1, inputs.size(1), 1)
+        #inputs = self._add_speaker_embedding(inputs, embedded_gst)
+        return inputs, embedded_gst
+
+    def compute_style_embedding(self, inputs, style_input):
         if isinstance(style_input, dict):
             device = inputs.device
             query = torch.zeros(1, 1, 256).to(device)
@@ -96,9 +103,24 @@ class Tacotron2(nn.Module):
 
         else:
             gst_outputs = self.gst_layer(style_input)
-        embedded_gst = gst_outputs.repeat(1, inputs.size(1), 1)
-        #inputs = self._add_speaker_embedding(inputs, embedded_gst)
-        return inputs, embedded_gst
+        return gst_outputs
+
+    def compute_static_embeddings(self, encoder_outputs, speaker_ids=None, input_style=None):
+        """Speaker and style embeddings that are constant over the input time axis.
+
+        Returns a B x (D_gst + D_speaker) tensor in the order they are
+        concatenated to the encoder outputs, or None if the model uses neither.
+        """
+        B = encoder_outputs.size(0)
+        static_embeddings = []
+        if hasattr(self, 'gst') and input_style is not None:
+            gst_outputs = self.compute_style_embedding(encoder_outputs, input_style)
+            static_embeddings.append(gst_outputs.view(-1, gst_outputs.size(-1)).expand(B, -1))
+        if self.num_speakers > 1:
+            static_embeddings.append(self.speaker_embedding(speaker_ids).view(B, -1))
+        if not static_embeddings:
+            return None
+        return torch.cat(static_embeddings, dim=-1)
 
     def forward(self, text, text_lengths, mel_specs=None, speaker_ids=None):
         self._init_states()
@@ -138,69 +160,85 @@ class Tacotron2(nn.Module):
         return decoder_outputs, postnet_outputs, alignments, stop_tokens
 
     @torch.no_grad()
-    def inference(self, text, speaker_ids=None, input_style=None):
-        embedded_inputs = self.embedding(text).transpose(1, 2)
-        encoder_outputs = self.encoder.inference(embedded_inputs)
+    def encode(self, text):
+        """Run the embedding and the encoder for the given token ids.
 
-        if self.num_speakers > 1:
-            embedded_speakers = self.speaker_embedding(speaker_ids)[:, None]
-            embedded_speakers = embedded_speakers.repeat(1, encoder_outputs.size(1), 1)
-            if hasattr(self, 'gst') and input_style is not None:
-                # B x gst_dim
-                encoder_outputs, embedded_gst = self.compute_gst(encoder_outputs, input_style)
-                encoder_outputs = torch.cat([encoder_outputs, embedded_gst, embedded_speakers], dim=-1)
-                #encoder_outputs = encoder_outputs + embedded_gst
-            else:
-                encoder_outputs = torch.cat([encoder_outputs, embedded_speakers], dim=-1)
+        The result depends only on the token sequence, so it can be cached and
+        passed to ``inference()`` for other speakers and styles.
+        """
+        embedded_inputs = self.embedding(text).transpose(1, 2)
+        return self.encoder.inference(embedded_inputs)
 
-        else:
-            if hasattr(self, 'gst') and input_style is not None:
-                # B x gst_dim
-                encoder_outputs, embedded_gst = self.compute_gst(encoder_outputs, input_style)
-                encoder_outputs = torch.cat([encoder_outputs, embedded_gst], dim=-1)
-                #encoder_outputs = encoder_outputs + embedded_gst
+    @torch.no_grad()
+    def inference(self, text, speaker_ids=None, input_style=None, encoder_outputs=None,
+                  decompose_static_inputs=True, return_alignments=True, alignment_top_k=None,
+                  return_stop_tokens=True, max_decoder_steps=None, cancel_event=None):
+        """
+        Args:
+            encoder_outputs (Tensor): precomputed outputs of ``encode(text)``.
+            decompose_static_inputs (bool): pass speaker and style embeddings to
+                the decoder separately so their contribution is projected once
+                instead of being repeated over every encoder frame.
+            return_alignments, alignment_top_k, return_stop_tokens: select the
+                collected decoder outputs, see ``Decoder.inference``. Outputs
+                that are not collected are returned as None.
+            max_decoder_steps (int): step limit of this call.
+            cancel_event (threading.Event): stops the decoder at the next step
+                with ``DecodingCancelled`` once set.
+        """
+        if encoder_outputs is None:
+            encoder_outputs = self.encode(text)
+        static_embeddings = self.compute_static_embeddings(
+            encoder_outputs, speaker_ids, input_style)
 
-        mel_outputs, alignments, stop_tokens = self.decoder.inference(
-            encoder_outputs)
-        mel_outputs_postnet = self.postnet(mel_outputs)
-        mel_outputs_postnet = mel_outputs + mel_outputs_postnet
+        num_tokens = encoder_outputs.size(1)
+        outputs = dict(return_alignments=return_alignments, alignment_top_k=alignment_top_k,
+                       return_stop_tokens=return_stop_tokens, max_decoder_steps=max_decoder_steps,
+                       cancel_event=cancel_event)
+        with metrics.stage('decoder', tokens=num_tokens) as info:
+            if decompose_static_inputs:
+                mel_outputs, alignments, stop_tokens = self.decoder.inference(
+                    encoder_outputs, static_inputs=static_embeddings, **outputs)
+            else:
+                encoder_outputs = self._concat_static_embeddings(encoder_outputs, static_embeddings)
+                mel_outputs, alignments, stop_tokens = self.decoder.inference(
+                    encoder_outputs, **outputs)
+            info['steps'] = mel_outputs.size(2) // self.decoder.r
+        metrics.observe('tts_decoder_steps', info['steps'])
+        metrics.observe('tts_decoder_steps_per_token', info['steps'] / num_tokens)
+        with metrics.stage('postnet', frames=mel_outputs.size(2)):
+            mel_outputs_postnet = self.postnet(mel_outputs)
+            mel_outputs_postnet = mel_outputs + mel_outputs_postnet
         mel_outputs, mel_outputs_postnet, alignments = self.shape_outputs(
             mel_outputs, mel_outputs_postnet, alignments)
         return mel_outputs, mel_outputs_postnet, alignments, stop_tokens
 
-    def inference_truncated(self, text, speaker_ids=None, input_style=None):
+    def inference_truncated(self, text, speaker_ids=None, input_style=None, decoder_state=None):
         """
-        Preserve model states for continuous inference
+        Preserve model states for continuous inference. The returned decoder
+        state continues decoding when passed to the next call.
         """
         embedded_inputs = self.embedding(text).transpose(1, 2)
-        encoder_outputs = self.encoder.inference_truncated(embedded_inputs)
-        
-        if self.num_speakers > 1:
-            embedded_speakers = self.speaker_embedding(speaker_ids)[:, None]
-            embedded_speakers = embedded_speakers.repeat(1, encoder_outputs.size(1), 1)
-            if hasattr(self, 'gst') and input_style is not None:
-                # B x gst_dim
-                encoder_outputs, embedded_gst = self.compute_gst(encoder_outputs, input_style)
-                encoder_outputs = torch.cat([encoder_outputs, embedded_gst, embedded_speakers], dim=-1)
-                #encoder_outputs = encoder_outputs + embedded_gst
-            else:
-                encoder_outputs = torch.cat([encoder_outputs, embedded_speakers], dim=-1)
-
-        else:
-            if hasattr(self, 'gst') and input_style is not None:
-                # B x gst_dim
-                encoder_outputs, embedded_gst = self.compute_gst(encoder_outputs, input_style)
-                encoder_outputs = torch.cat([encoder_outputs, embedded_gst], dim=-1)
-                #encoder_outputs = encoder_outputs + embedded_gst
+        encoder_outputs = self.encoder.inference(embedded_inputs)
+        static_embeddings = self.compute_static_embeddings(
+            encoder_outputs, speaker_ids, input_style)
+        encoder_outputs = self._concat_static_embeddings(encoder_outputs, static_embeddings)
 
-        mel_outputs, alignments, stop_tokens = self.decoder.inference_truncated(
-            encoder_outputs)
+        mel_outputs, alignments, stop_tokens, decoder_state = self.decoder.inference_truncated(
+            encoder_outputs, decoder_state)
         mel_outputs_postnet = self.postnet(mel_outputs)
         mel_outputs_postnet = mel_outputs + mel_outputs_postnet
         mel_outputs, mel_outputs_postnet, alignments = self.shape_outputs(
             mel_outputs, mel_outputs_postnet, alignments)
-        return mel_outputs, mel_outputs_postnet, alignments, stop_tokens
+        return mel_outputs, mel_outputs_postnet, alignments, stop_tokens, decoder_state
 
+    @staticmethod
+    def _concat_static_embeddings(encoder_outputs, static_embeddings):
+        if static_embeddings is None:
+            return encoder_outputs
+        static_embeddings = static_embeddings.unsqueeze(1).expand(
+            -1, encoder_outputs.size(1), -1)
+        return torch.cat([encoder_outputs, static_embeddings], dim=-1)
 
     def _backward_inference(self, mel_specs, encoder_outputs, mask):
         decoder_outputs_b, alignments_b, _ = self.decoder_backward(
@@ -0,0 +1,310 @@
+"""Headless rendering of large sentence files.
+
+    python -m TTS_lib.render_file --project projects/Diego --sentence_file lines.txt \
+        --speakers_json projects/Diego/speakers.json --speaker_name Diego
+
+The file is read lazily in chunks of lines, which are rendered in length
+bucketed batches. Every finished or failed line is written to a progress
+journal in the output folder, so a restarted render skips the finished
+lines and retries the failed ones. A failing batch is rendered again line
+by line, so a bad line only fails itself. Progress, throughput and an ETA
+are logged after every chunk. With ``--archive`` the outputs are packed
+into ``<out_path>/archive``, see ``TTS_lib.utils.archive``. ``--export``
+resamples, loudness normalizes and encodes them in worker processes while
+the next chunk is rendered, see ``TTS_lib.utils.export``.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import itertools
+import functools
+from concurrent.futures import Future
+from pathlib import Path
+from datetime import timedelta
+
+from TTS_lib.utils.journal import ProgressJournal, text_hash
+from TTS_lib.utils.archive import AudioArchive, WavFolder, CODECS
+from TTS_lib.utils.export import Exporter
+from TTS_lib.utils.logger import get_logger, setup_logger
+from TTS_lib.synthesize import get_synthesizer, output_file_name, split_into_sentences
+
+logger = get_logger('render_file')
+
+
+def iter_lines(path):
+    """Yield (line number, text) of the non empty lines of ``path``, numbered from 1."""
+    with open(path, 'r', encoding='utf8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if line:
+                yield line_no, line
+
+
+def count_lines(path):
+    """Number of non empty lines and their characters, for the ETA."""
+    num_lines, num_chars = 0, 0
+    for _, line in iter_lines(path):
+        num_lines += 1
+        num_chars += len(line)
+    return num_lines, num_chars
+
+
+def synthesize_isolated(synthesizer, lines, speaker_id=None, style_input=None, batch_size=8):
+    """Waveforms of cleaned ``lines``, or the exception of every failed line.
+    A failing batch is rendered again line by line."""
+    try:
+        return synthesizer.synthesize_lines(lines, speaker_id, style_input, batch_size)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning(" [!] Batch failed (%s), rendering its lines one by one", e)
+    results = []
+    for line in lines:
+        try:
+            results.append(synthesizer.synthesize_line(line, speaker_id, style_input))
+        except Exception as e:  # pylint: disable=broad-except
+            results.append(e)
+    return results
+
+
+def format_seconds(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+
+def add_output_arguments(parser):
+    parser.add_argument('--archive', type=str, default=None, choices=CODECS,
+                        help='write a packed archive to <out_path>/archive with pcm16 or flac frames '
+                             'instead of wav files')
+    parser.add_argument('--export', type=str, default=None,
+                        help='export formats instead of plain wavs, e.g. wav,flac,ogg')
+    parser.add_argument('--export_sample_rate', type=int, default=None,
+                        help='resample the exported files, default is the model sample rate')
+    parser.add_argument('--loudness', type=float, default=None,
+                        help='normalize the exported files to this loudness in LUFS, e.g. -23')
+    parser.add_argument('--export_workers', type=int, default=None,
+                        help='export processes, default is the number of cpus')
+
+
+def setup_output_store(parser, args, out_path):
+    """Output store of the ``add_output_arguments`` options."""
+    if args.archive and args.export:
+        parser.error('use either --archive or --export')
+    if args.export:
+        return Exporter(out_path, formats=args.export.split(','), sample_rate=args.export_sample_rate,
+                        target_lufs=args.loudness, num_workers=args.export_workers)
+    if args.export_sample_rate or args.loudness is not None:
+        parser.error('--export_sample_rate and --loudness need --export')
+    if args.archive:
+        return AudioArchive(os.path.join(out_path, 'archive'), codec=args.archive)
+    return WavFolder(out_path)
+
+
+def output_settings(store):
+    """Settings of ``store`` that change the written files, part of the
+    build input hash. Plain wav files have none."""
+    if isinstance(store, Exporter):
+        return {'export': list(store.formats), 'sample_rate': store.sample_rate,
+                'loudness': store.target_lufs, 'peak_db': store.peak_db}
+    if isinstance(store, AudioArchive):
+        return {'archive': store.codec}
+    return {}
+
+
+class PendingWrites():
+    """Outputs of a store that writes in the background, e.g. the ``Exporter``.
+    ``on_done`` or ``on_error(exception)`` is called by ``poll`` in the
+    calling thread once the write finished, right away for synchronous stores."""
+    def __init__(self):
+        self.pending = []
+
+    def add(self, result, on_done, on_error):
+        if isinstance(result, Future):
+            self.pending.append((result, on_done, on_error))
+        else:
+            on_done()
+
+    def poll(self, wait=False):
+        remaining = []
+        for future, on_done, on_error in self.pending:
+            if not wait and not future.done():
+                remaining.append((future, on_done, on_error))
+                continue
+            error = future.exception()
+            if error is None:
+                on_done()
+            else:
+                on_error(error)
+        self.pending = remaining
+
+
+class FileRenderer():
+    """Renders the lines of a sentence file into ``store``.
+
+    Args:
+        synthesizer (TTS_lib.synthesize.Synthesizer): loaded project.
+        store (TTS_lib.utils.archive.WavFolder, AudioArchive or
+            TTS_lib.utils.export.Exporter): output wavs.
+        journal (TTS_lib.utils.journal.ProgressJournal): progress of the file.
+        speaker_id, style_input: passed to the synthesizer.
+        batch_size (int): sentences decoded together.
+        chunk_size (int): lines read and rendered at once.
+    """
+    def __init__(self, synthesizer, store, journal, speaker_id=None, style_input=None,
+                 batch_size=8, chunk_size=64):
+        # pylint: disable=import-outside-toplevel
+        from TTS_lib.utils.text.text_cleaning import clean_sentence
+        self.clean_sentence = clean_sentence
+        self.synthesizer = synthesizer
+        self.store = store
+        self.writes = PendingWrites()
+        self.journal = journal
+        self.speaker_id = speaker_id
+        self.style_input = style_input
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.total_lines, self.total_chars = 0, 0
+        self.processed_lines, self.processed_chars = 0, 0
+        self.rendered_chars = 0
+        self.audio_seconds = 0.0
+        self.start_time = None
+        # line number -> hash of the lines failed in this render, the journal
+        # also holds failures of lines edited or removed since
+        self.failed = {}
+
+    def render(self, sentence_file):
+        """Render all unfinished lines. Returns the number of failed lines."""
+        self.total_lines, self.total_chars = count_lines(sentence_file)
+        self.start_time = time.perf_counter()
+        self.failed = {}
+        lines = iter_lines(sentence_file)
+        while True:
+            chunk = list(itertools.islice(lines, self.chunk_size))
+            if not chunk:
+                break
+            self.render_chunk(chunk)
+            self.report()
+        self.writes.poll(wait=True)
+        if self.failed:
+            logger.warning(" [!] %d lines failed: %s", len(self.failed), list(self.failed)[:20])
+        return len(self.failed)
+
+    def _clean(self, line_no, line, line_hash):
+        try:
+            cleaned = self.clean_sentence(line)
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(line_no, line, line_hash, e)
+            return None
+        if not split_into_sentences(cleaned):
+            self.journal.record(line_no, line_hash, 'skipped')
+            return None
+        return cleaned
+
+    def _fail(self, line_no, line, line_hash, error):
+        logger.error(" [!] Line %d failed: %s", line_no, error)
+        self.journal.record(line_no, line_hash, 'failed', text=line, error=repr(error))
+        self.failed[line_no] = line_hash
+
+    def render_chunk(self, chunk):
+        pending = []
+        for line_no, line in chunk:
+            line_hash = text_hash(line)
+            self.processed_lines += 1
+            self.processed_chars += len(line)
+            if self.journal.is_done(line_no, line_hash):
+                continue
+            cleaned = self._clean(line_no, line, line_hash)
+            if cleaned is not None:
+                pending.append((line_no, line, line_hash, cleaned))
+        if not pending:
+            return
+        results = synthesize_isolated(self.synthesizer, [cleaned for _, _, _, cleaned in pending],
+                                      self.speaker_id, self.style_input, self.batch_size)
+        ap = self.synthesizer.ap
+        for (line_no, line, line_hash, cleaned), wav in zip(pending, results):
+            self.rendered_chars += len(line)
+            if isinstance(wav, Exception):
+                self._fail(line_no, line, line_hash, wav)
+                continue
+            file_name = output_file_name(cleaned, '{:06d}'.format(line_no))
+            try:
+                result = self.store.write(file_name, wav, ap.sample_rate)
+            except Exception as e:  # pylint: disable=broad-except
+                self._fail(line_no, line, line_hash, e)
+                continue
+            audio_seconds = len(wav) / ap.sample_rate
+            self.audio_seconds += audio_seconds
+            # a line is done once its output is written
+            self.writes.add(result,
+                            functools.partial(self.journal.record, line_no, line_hash, 'done', path=file_name,
+                                              audio_seconds=round(audio_seconds, 3)),
+                            functools.partial(self._fail, line_no, line, line_hash))
+        self.writes.poll()
+        self.synthesizer.duration_estimator.save()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start_time
+        message = " > {}/{} lines, {} failed".format(self.processed_lines, self.total_lines,
+                                                     len(self.failed))
+        if self.rendered_chars > 0 and elapsed > 0:
+            remaining = (self.total_chars - self.processed_chars) * elapsed / self.rendered_chars
+            message += ", {:.0f} chars/s, {:.2f}x real time, ETA {}".format(
+                self.rendered_chars / elapsed, self.audio_seconds / elapsed, format_seconds(remaining))
+        logger.info(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a sentence file without the gui, resumable.')
+    parser.add_argument('--project', type=str, required=True, help='path to the project folder')
+    parser.add_argument('--sentence_file', type=str, required=True, help='file with one line per output')
+    parser.add_argument('--speakers_json', type=str, default='', help='path to speakers.json')
+    parser.add_argument('--speaker_name', type=str, default='Default', help='name of the speaker')
+    parser.add_argument('--vocoder', type=str, default='GriffinLim', help='GriffinLim, WaveRNN or MelGAN')
+    parser.add_argument('--use_cuda', action='store_true', help='run on the gpu')
+    parser.add_argument('--style', type=str, default=None,
+                        help='style wav or json GST weights, e.g. {"0": 0.2}; default is the style of '
+                             'the interrupted run or a random wav of the speaker')
+    parser.add_argument('--no_gst', action='store_true', help='do not use a style input')
+    parser.add_argument('--out_path', type=str, default=None,
+                        help='output folder, default <project>/output/<speaker>/<sentence file name>')
+    parser.add_argument('--journal', type=str, default=None, help='progress journal, default <out_path>/progress.jsonl')
+    parser.add_argument('--batch_size', type=int, default=8, help='sentences decoded together')
+    add_output_arguments(parser)
+    parser.add_argument('--chunk_size', type=int, default=64, help='lines read and rendered at once')
+    parser.add_argument('--log_level', type=str, default=None, help='DEBUG, INFO, WARNING or ERROR')
+    args = parser.parse_args()
+    setup_logger(args.log_level)
+
+    out_path = args.out_path or str(Path(args.project, 'output', args.speaker_name,
+                                         Path(args.sentence_file).stem))
+    os.makedirs(out_path, exist_ok=True)
+    journal_path = args.journal or os.path.join(out_path, 'progress.jsonl')
+
+    synthesizer = get_synthesizer(args.project, args.use_cuda, args.vocoder, args.speakers_json)
+    speaker_id = synthesizer.get_speaker_id(args.speaker_name)
+    store = setup_output_store(parser, args, out_path)
+    with store, ProgressJournal(journal_path) as journal:
+        style_input = args.style
+        if style_input is not None and style_input.lstrip().startswith('{'):
+            style_input = json.loads(style_input)
+        if style_input is None and journal.settings.get('speaker_name') == args.speaker_name:
+            # keep the voice of the interrupted run
+            style_input = journal.settings.get('style_input')
+        if style_input is None:
+            style_input = synthesizer.get_style_input(not args.no_gst, None, args.speaker_name)
+        if args.no_gst:
+            style_input = None
+        journal.start(project=args.project, sentence_file=args.sentence_file,
+                      speaker_name=args.speaker_name, style_input=style_input, vocoder=args.vocoder)
+        if journal.num_done:
+            logger.info(" > Resuming, %d lines are already done", journal.num_done)
+        logger.info(" > Using style input: %s", style_input)
+        renderer = FileRenderer(synthesizer, store, journal, speaker_id=speaker_id,
+                                style_input=style_input, batch_size=args.batch_size,
+                                chunk_size=args.chunk_size)
+        num_failed = renderer.render(args.sentence_file)
+    logger.info(" > Saved the outputs to %s", out_path)
+    sys.exit(1 if num_failed else 0)
+
+
+if __name__ == '__main__':
+    main()
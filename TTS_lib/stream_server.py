@@ -0,0 +1,216 @@
+"""Local WebSocket service streaming synthesized audio for live previews.
+
+    python -m TTS_lib.stream_server --project projects/Xardas --speakers_json speakers.json --port 8765
+
+Clients send JSON text messages:
+
+    {"type": "synthesize", "id": "line-12", "text": "Hallo. Was willst du?",
+     "speaker": "Diego", "style": {"0": 0.1}, "format": "s16", "timeout": 30}
+    {"type": "cancel", "id": "line-12"}
+
+``style`` is a dict of GST weights or the file name of a wav of the speaker
+in the dataset, e.g. ``"DIA_Diego_Hallo_11_01.wav"``, other paths are
+rejected. A ``synthesize`` with the id of a running request replaces it,
+e.g. when the line was edited, ``cancel`` without id cancels all requests
+of the connection. The server answers with JSON text messages:
+
+    {"type": "start", "id": ..., "sample_rate": 22050, "format": "s16"}
+    {"type": "chunk", "id": ..., "seq": 0, "start_sample": 0, "samples": 48225,
+     "elapsed": 0.82}
+    {"type": "done", "id": ..., "chunks": 2, "audio_seconds": 6.4,
+     "time_to_first_audio": 0.82, "elapsed": 1.9}
+    {"type": "cancelled", "id": ...}
+    {"type": "error", "id": ..., "message": ...}
+
+Every chunk message is directly followed by a binary message with its audio,
+one chunk per sentence: 16 bit little endian PCM (``s16``), every chunk
+scaled to its own peak so none of them clips, or 32 bit floats (``f32``).
+``elapsed`` is measured from the arrival of the request. The decoder of a
+cancelled request stops at its next step.
+
+Browser pages may only connect from localhost or the origins given with
+``--allow_origin``, see ``TTS_lib.utils.websocket``.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+from TTS_lib.async_synthesize import AsyncSynthesizer
+from TTS_lib.utils.websocket import serve, ConnectionClosed
+from TTS_lib.utils.logger import get_logger, setup_logger
+from TTS_lib.utils.metrics import metrics
+
+logger = get_logger('stream_server')
+
+FORMATS = ('s16', 'f32')
+
+
+def encode_chunk(chunk, audio_format):
+    if audio_format == 'f32':
+        return chunk.astype('<f4').tobytes()
+    # the peaks of later sentences are unknown when the first one is sent
+    scale = 1.0 / max(0.01, float(np.max(np.abs(chunk)))) if chunk.size else 1.0
+    return (np.clip(chunk * scale, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+def resolve_style(synthesizer, speaker, style):
+    """Style input of a request, GST weights or the path of the style wav
+    named by the client. Clients cannot make the server read other files."""
+    if style is None:
+        return None
+    if isinstance(style, dict):
+        try:
+            return {str(int(token)): float(weight) for token, weight in style.items()}
+        except (TypeError, ValueError):
+            raise ValueError('style weights must map token numbers to numbers')
+    if not isinstance(style, str) or os.path.basename(style) != style:
+        raise ValueError('style must be GST weights or the file name of a style wav')
+    name = style if style.lower().endswith('.wav') else style + '.wav'
+    for path in synthesizer.style_wavs(speaker or 'Default'):
+        if os.path.basename(path) == name:
+            return path
+    raise ValueError('no style wav {} of speaker {}'.format(style, speaker))
+
+
+class PreviewSession():
+    """Requests of one WebSocket connection."""
+    def __init__(self, synthesizer, socket):
+        self.synthesizer = synthesizer
+        self.socket = socket
+        self.tasks = {}
+        # a chunk message and its audio are sent back to back, no other
+        # message of the connection gets in between
+        self._chunk_lock = asyncio.Lock()
+
+    async def send(self, **message):
+        async with self._chunk_lock:
+            await self.socket.send(json.dumps(message))
+
+    async def send_chunk(self, audio, **message):
+        # the lock is not reentrant, so send() is not used here
+        async with self._chunk_lock:
+            await self.socket.send(json.dumps(dict(type='chunk', **message)))
+            await self.socket.send(audio)
+
+    async def run(self):
+        try:
+            while True:
+                message = await self.socket.recv()
+                if message is None:
+                    break
+                if not isinstance(message, str):
+                    await self.send(type='error', id=None, message='expected a JSON text message')
+                    continue
+                try:
+                    message = json.loads(message)
+                except ValueError:
+                    await self.send(type='error', id=None, message='invalid JSON')
+                    continue
+                if message.get('type') == 'synthesize':
+                    await self.start(message)
+                elif message.get('type') == 'cancel':
+                    await self.cancel(message.get('id'))
+                else:
+                    await self.send(type='error', id=message.get('id'),
+                                    message='unknown type {}'.format(message.get('type')))
+        finally:
+            await self.cancel(None)
+
+    async def start(self, message):
+        request_id = message.get('id')
+        # the edited line replaces the running preview
+        await self.cancel(request_id)
+        self.tasks[request_id] = asyncio.ensure_future(self.render(request_id, message, time.perf_counter()))
+
+    async def cancel(self, request_id):
+        tasks = list(self.tasks.values()) if request_id is None else \
+            [self.tasks[request_id]] if request_id in self.tasks else []
+        for task in tasks:
+            task.cancel()
+        # wait, so the cancelled message is sent before the next start
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def render(self, request_id, message, start_time):
+        audio_format = message.get('format', 's16')
+        sample_rate = self.synthesizer.sample_rate
+        try:
+            if audio_format not in FORMATS:
+                raise ValueError('unknown format {}, use one of {}'.format(audio_format, FORMATS))
+            if not message.get('text', '').strip():
+                raise ValueError('no text')
+            # globs the dataset, off the event loop
+            style_input = await asyncio.get_running_loop().run_in_executor(
+                None, resolve_style, self.synthesizer.synthesizer, message.get('speaker'), message.get('style'))
+            await self.send(type='start', id=request_id, sample_rate=sample_rate, format=audio_format)
+            seq, start_sample, first_audio = 0, 0, None
+            async for chunk in self.synthesizer.stream(message['text'], speaker=message.get('speaker'),
+                                                       style_input=style_input, timeout=message.get('timeout')):
+                elapsed = time.perf_counter() - start_time
+                if first_audio is None:
+                    first_audio = elapsed
+                    metrics.observe('tts_time_to_first_audio_seconds', first_audio)
+                await self.send_chunk(encode_chunk(chunk, audio_format), id=request_id, seq=seq,
+                                      start_sample=start_sample, samples=len(chunk), elapsed=round(elapsed, 3))
+                seq += 1
+                start_sample += len(chunk)
+            await self.send(type='done', id=request_id, chunks=seq,
+                            audio_seconds=round(start_sample / sample_rate, 3),
+                            time_to_first_audio=round(first_audio, 3) if first_audio is not None else None,
+                            elapsed=round(time.perf_counter() - start_time, 3))
+        except asyncio.CancelledError:
+            await self._send_quietly(type='cancelled', id=request_id)
+        except asyncio.TimeoutError:
+            await self._send_quietly(type='error', id=request_id, message='timeout')
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(" [!] Preview %s failed: %s", request_id, e)
+            await self._send_quietly(type='error', id=request_id, message=str(e))
+        finally:
+            if self.tasks.get(request_id) is asyncio.current_task():
+                del self.tasks[request_id]
+
+    async def _send_quietly(self, **message):
+        try:
+            await self.send(**message)
+        except (ConnectionError, ConnectionClosed):
+            pass
+
+
+async def run_server(args):
+    synthesizer = await AsyncSynthesizer.load(args.project, args.use_cuda, args.vocoder, args.speakers_json,
+                                              max_concurrency=args.max_concurrency)
+    async with synthesizer:
+        server = await serve(lambda socket: PreviewSession(synthesizer, socket).run(), args.host, args.port,
+                             allowed_origins=args.allow_origin)
+        logger.info(" > Streaming previews on ws://%s:%d", args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream synthesized audio over WebSocket for live previews.')
+    parser.add_argument('--project', type=str, required=True, help='path to the project folder')
+    parser.add_argument('--speakers_json', type=str, default='', help='path to speakers.json')
+    parser.add_argument('--vocoder', type=str, default='GriffinLim', help='GriffinLim, WaveRNN or MelGAN')
+    parser.add_argument('--use_cuda', action='store_true', help='run on the gpu')
+    parser.add_argument('--host', type=str, default='localhost', help='interface to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+    parser.add_argument('--allow_origin', action='append', default=[],
+                        help='web page origin allowed to connect besides localhost, e.g. https://tools.example.org; '
+                             'can be repeated')
+    parser.add_argument('--max_concurrency', type=int, default=1, help='sentences synthesized at the same time')
+    parser.add_argument('--log_level', type=str, default=None, help='DEBUG, INFO, WARNING or ERROR')
+    args = parser.parse_args()
+    setup_logger(args.log_level)
+    try:
+        asyncio.run(run_server(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
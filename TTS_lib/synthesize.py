@@ -1,26 +1,43 @@
 import os
 import time
-import torch
 import json
 from datetime import datetime, date
 import string
 from glob import glob
 import numpy as np
-import re
 from pathlib import Path
 import sys
-import yaml
 import random
-
-
-from TTS_lib.utils.synthesis import synthesis
-from TTS_lib.utils.generic_utils import setup_model
-from TTS_lib.utils.io import load_config, load_checkpoint
-from TTS_lib.utils.text.symbols import make_symbols, symbols, phonemes
-from TTS_lib.utils.audio import AudioProcessor
-from TTS_lib.utils.text.text_cleaning import clean_sentence
-
-from TTS_lib.vocoder.utils.generic_utils import setup_generator 
+import argparse
+import threading
+from collections import OrderedDict, Counter
+
+# torch, librosa, phonemizer and the vocoder package are imported by the code
+# paths that need them, so importing this module is cheap
+from TTS_lib.utils.cache import EncoderCache
+from TTS_lib.utils.profiling import StartupProfiler, null_stage
+from TTS_lib.utils.logger import get_logger, setup_logger
+from TTS_lib.utils.metrics import metrics, JsonLinesExporter, start_http_server
+from TTS_lib.utils.job_scheduler import JobScheduler, PRIORITIES
+from TTS_lib.utils.pipeline import Pipeline, Stage
+from TTS_lib.utils.backends import BACKENDS
+
+logger = get_logger('synthesize')
+
+# encoder outputs are shared between speakers, styles and runs of the same project
+encoder_cache = EncoderCache()
+metrics.register_gauge('tts_encoder_cache_hit_rate', encoder_cache.hit_rate)
+metrics.register_gauge('tts_encoder_cache_bytes', lambda: encoder_cache.num_bytes)
+# results of the int8 quality check per checkpoint
+quantization_checks = {}
+# loaded synthesizers, the most recently used ones are kept so jobs of
+# different projects can run side by side
+synthesizers = OrderedDict()
+max_synthesizers = 2
+synthesizers_lock = threading.Lock()
+# shared by all runs, see get_job_scheduler()
+job_scheduler = None
+job_scheduler_lock = threading.Lock()
 
 
 def tts(model,
@@ -34,27 +51,30 @@ def tts(model,
         batched_vocoder,
         speaker_id=None,
         style_input=None,
-        figures=False):
+        figures=False,
+        model_key=None,
+        lean=False,
+        frontend=None,
+        max_decoder_steps=None):
+    # pylint: disable=import-outside-toplevel
+    from TTS_lib.utils.synthesis import synthesis
     use_vocoder_model = vocoder_model is not None
 
     waveform, alignment, _, postnet_output, stop_tokens, _ = synthesis(
         model, text, C, use_cuda, ap, speaker_id, style_input=style_input,
         truncated=False, enable_eos_bos_chars=C.enable_eos_bos_chars,
-        use_griffin_lim=(not use_vocoder_model), do_trim_silence=True)
+        use_griffin_lim=(not use_vocoder_model), do_trim_silence=True,
+        encoder_cache=encoder_cache, model_key=model_key, lean=lean, frontend=frontend,
+        max_decoder_steps=max_decoder_steps)
 
 
     if C.model == "Tacotron" and use_vocoder_model:
         postnet_output = ap.out_linear_to_mel(postnet_output.T).T
     # correct if there is a scale difference b/w two models
-    
+
     if use_vocoder_model:
-        vocoder_input = torch.FloatTensor(postnet_output.T).unsqueeze(0)
-        waveform = vocoder_model.inference(vocoder_input)
-        if use_cuda:
-            waveform = waveform.cpu()
-        waveform = waveform.detach().numpy()
-        waveform = waveform.flatten()
-        
+        waveform = run_vocoder_model(vocoder_model, postnet_output, use_cuda)
+
 
     # if use_vocoder_model:
     #     postnet_output = ap._denormalize(postnet_output)
@@ -69,13 +89,34 @@ def tts(model,
     return alignment, postnet_output, stop_tokens, waveform
 
 
+def run_vocoder_model(vocoder_model, postnet_output, use_cuda):
+    """Waveform of a T_out x C mel from a neural vocoder."""
+    # pylint: disable=import-outside-toplevel
+    import torch
+    with metrics.stage('vocoder', vocoder=type(vocoder_model).__name__, frames=postnet_output.shape[0]):
+        vocoder_input = torch.FloatTensor(postnet_output.T).unsqueeze(0)
+        waveform = vocoder_model.inference(vocoder_input)
+        if use_cuda:
+            waveform = waveform.cpu()
+        waveform = waveform.detach().numpy()
+        return waveform.flatten()
+
+
 def load_melgan(lib_path, model_file, model_config, use_cuda):
     sys.path.append(lib_path) # set this if ParallelWaveGAN is not installed globally
     #pylint: disable=import-outside-toplevel
+    import torch
+    from TTS_lib.utils.io import load_config
+    from TTS_lib.utils.audio import AudioProcessor
+    from TTS_lib.utils.slim_checkpoint import is_slim_checkpoint, load_slim_checkpoint, load_state_dict
+    from TTS_lib.vocoder.utils.generic_utils import setup_generator
     C = load_config(model_config)
     model_gen = setup_generator(C)
-    checkpoint = torch.load(model_file, map_location='cpu')
-    model_gen.load_state_dict(checkpoint['model'])
+    if is_slim_checkpoint(model_file):
+        load_state_dict(model_gen, load_slim_checkpoint(model_file)['model'])
+    else:
+        checkpoint = torch.load(model_file, map_location='cpu')
+        model_gen.load_state_dict(checkpoint['model'])
     ap_vocoder = AudioProcessor(**C.audio)
 
     return model_gen.eval(), ap_vocoder
@@ -90,8 +131,357 @@ def split_into_sentences(text):
     return sentences
 
 
+def output_file_name(tts_sentence, prefix):
+    """Wav file name of a line, ``prefix`` and its first ten words without punctuation."""
+    file_name = "_".join([str(prefix), ' '.join(tts_sentence.split(" ")[:10])])
+    return file_name.translate(str.maketrans('', '', string.punctuation.replace('_', ''))) + '.wav'
+
+
+def find_speaker_id(speakers, speaker_name):
+    """Id of the first speaker of the speakers.json dict whose name contains ``speaker_name``."""
+    if not speakers:
+        return None
+    #get the speaker id for selected speaker
+    return [id for speaker, id in speakers.items() if speaker_name in speaker][0]
+
+
+def find_model_file(project):
+    """Find the tts model file in the project folder, prefer slim inference checkpoints."""
+    tts_model_file = glob(str(Path(project + '/*.slim'))) or glob(str(Path(project + '/*.pth.tar')))
+    if not tts_model_file:
+        raise FileNotFoundError('[!] TTS Model not found in path: "{}"'.format(project))
+    return tts_model_file[0]
+
+
+class Synthesizer():
+    """Loads config, audio processor, TTS model and vocoder of a project once,
+    so they can be used for many sentences and speakers.
+
+    Args:
+        project (str): path to the project folder.
+        use_cuda (bool): run the models on the gpu.
+        vocoder_type (str): GriffinLim, MelGAN or WaveRNN.
+        speakers_json (str): path to the speakers file, '' for single speaker models.
+        profiler (StartupProfiler): records the time of every loading stage.
+        backend (str): acoustic model runtime, torch, torchscript or
+            onnxruntime (reads the ONNX export in ``<project>/onnx`` or the
+            config key ``onnx_path``), default is the config key ``backend``
+            or torch.
+    """
+    def __init__(self, project, use_cuda=False, vocoder_type='GriffinLim', speakers_json='', profiler=None,
+                 backend=None):
+        # pylint: disable=import-outside-toplevel
+        stage = profiler.stage if profiler is not None else null_stage
+        self.project = project
+        self.use_cuda = use_cuda
+        self.vocoder_type = vocoder_type
+        self.batched_vocoder = True
+
+        with stage('config'):
+            from TTS_lib.utils.io import load_config
+            from TTS_lib.utils.text import TextFrontend
+            # load the config
+            self.C = load_config(Path(project + "/config.json"))
+            #C.forward_attn_mask = True
+            # cleaners and vocabulary of this model, shared by all threads
+            self.frontend = TextFrontend.from_config(self.C)
+            num_chars = self.frontend.num_chars
+
+        with stage('audio_processor'):
+            from TTS_lib.utils.audio import AudioProcessor
+            # load the audio processor
+            self.ap = AudioProcessor(**self.C.audio)
+            from TTS_lib.utils.duration import DurationEstimator
+            # output lengths of this project, refitted with every rendered sentence
+            self.duration_estimator = DurationEstimator.for_model(
+                self.C, self.ap, path=str(Path(project, 'duration_model.json')))
+
+        # load speakers
+        self.speakers = {}
+        if speakers_json != '':
+            with open(speakers_json, 'r') as f:
+                self.speakers = json.load(f)
+
+        with stage('checkpoint'):
+            from TTS_lib.utils.generic_utils import setup_model
+            from TTS_lib.utils.io import load_checkpoint
+            from TTS_lib.utils.quantization import setup_quantized_model
+            model_path = find_model_file(project)
+            # identifies the loaded weights for the encoder cache
+            self.model_key = (os.path.abspath(model_path), os.path.getmtime(model_path), use_cuda)
+            # load the model
+            model = setup_model(num_chars, len(self.speakers), self.C)
+            model, _ = load_checkpoint(model, model_path, use_cuda=use_cuda)
+            model.decoder.max_decoder_steps = 2000
+            model.eval()
+            self.backend_name = backend or self.C.get('backend', 'torch')
+            # use a dynamically quantized model on CPU if enabled in the config
+            if not use_cuda and self.backend_name == 'torch':
+                check_speaker_id = next(iter(self.speakers.values())) if self.speakers else None
+                check_style = {'0': 0.0} if self.C.use_gst else None
+                model, quantization_checks[self.model_key] = setup_quantized_model(
+                    model, self.C, check_speaker_id, check_style,
+                    check_results=quantization_checks.get(self.model_key))
+            self.model = model
+            # other runtimes get the model or its ONNX export, see TTS_lib.utils.backends
+            self.backend = 'torch'
+            if self.backend_name != 'torch':
+                from TTS_lib.utils.backends import load_backend
+                self.backend = load_backend(self.backend_name, model, self.C, use_cuda=use_cuda,
+                                            onnx_path=str(Path(project, self.C.get('onnx_path', 'onnx'))))
+            logger.info(" > Backend: %s", self.backend_name)
+
+        with stage('vocoder'):
+            self.vocoder, self.ap_vocoder = self._load_vocoder(vocoder_type)
+        logger.info(" > Vocoder: %s", vocoder_type)
+
+    def _load_vocoder(self, vocoder_type):
+        project = self.project
+        if vocoder_type == 'MelGAN':
+            model_file = glob(str(Path("/media/alexander/LinuxFS/Documents/PycharmProjects/GothicTTS/TTS_lib/vocoder/Trainings/multiband-melgan-rwd-Juni-15-2020_02+07-9d7cb1e/*.pth.tar")))
+            if not model_file:
+                raise FileNotFoundError('[!] Vocoder Model not found in path: "{}"'.format(project))
+            logger.info(model_file[0])
+            return load_melgan(str(Path('TTS_lib')),
+                               str(model_file[0]),
+                               str("/media/alexander/LinuxFS/Documents/PycharmProjects/GothicTTS/TTS_lib/vocoder/Trainings/multiband-melgan-rwd-Juni-15-2020_02+07-9d7cb1e/config.json"),
+                               self.use_cuda)
+        if vocoder_type == 'WaveRNN':
+            model_file = glob(str(Path(project + '/*.pkl')))
+            if not model_file:
+                raise FileNotFoundError('[!] Vocoder Model not found in path: "{}"'.format(project))
+            return load_melgan(str(Path('TTS_lib')), str(model_file[0]), str(Path(project + '/config.yml')), self.use_cuda)
+        return None, None
+
+    def get_speaker_id(self, speaker_name):
+        return find_speaker_id(self.speakers, speaker_name)
+
+    def style_wavs(self, speaker_name):
+        """Wavs of ``speaker_name`` in the dataset, of all speakers for 'Default'."""
+        if speaker_name != 'Default':
+            return glob(str(Path(self.C.datasets[0]['path']+speaker_name+'/*/*.wav')))
+        return glob(str(Path(self.C.datasets[0]['path']+'/*/*.wav')))
+
+    def get_style_input(self, use_gst, style_dict, speaker_name):
+        if not use_gst:
+            return None
+        if style_dict is not None:
+            return style_dict
+        prosody_waves = self.style_wavs(speaker_name)
+        if not prosody_waves:
+            logger.warning(" [!] No style wavs of %s in the dataset, using the neutral style", speaker_name)
+            return {'0': 0.0}
+        style_wav_id = random.randrange(0, len(prosody_waves), 1)
+        return prosody_waves[style_wav_id]
+
+    def decode(self, sentence, speaker_id=None, style_input=None, tokens=None, cancel_event=None):
+        """Postnet output (T_out x C) of a single sentence, ``tokens`` are
+        its ids from ``encode`` if already computed. Setting ``cancel_event``
+        stops the decoder at its next step with ``DecodingCancelled``."""
+        # pylint: disable=import-outside-toplevel
+        from TTS_lib.utils.synthesis import synthesis
+        r = self.model.decoder.r
+        max_decoder_steps = self.duration_estimator.step_limit(
+            sentence, r, style_input=style_input, speaker=speaker_id,
+            max_steps=self.model.decoder.max_decoder_steps)
+        # the vocoder runs separately, see vocode()
+        _, _, _, postnet_output, _, _ = synthesis(
+            self.model, sentence, self.C, self.use_cuda, self.ap, speaker_id, style_input=style_input,
+            truncated=False, enable_eos_bos_chars=self.C.enable_eos_bos_chars, use_griffin_lim=False,
+            backend=self.backend, encoder_cache=encoder_cache, model_key=self.model_key, lean=True,
+            frontend=self.frontend, max_decoder_steps=max_decoder_steps, tokens=tokens, cancel_event=cancel_event)
+        frames = postnet_output.shape[0]
+        # outputs cut by the step limit would bias the estimate
+        if frames < max_decoder_steps * r:
+            self.duration_estimator.update(sentence, frames, style_input=style_input,
+                                           speaker=speaker_id)
+        return postnet_output
+
+    def tts(self, sentence, speaker_id=None, style_input=None):
+        """Synthesize a single sentence and return the waveform."""
+        return self.vocode(self.decode(sentence, speaker_id=speaker_id, style_input=style_input))
+
+    def synthesize_line(self, tts_sentence, speaker_id=None, style_input=None):
+        """Synthesize a cleaned line which may contain several sentences."""
+        start_time = time.perf_counter()
+        return self.vocode_line(self.decode_line(tts_sentence, speaker_id, style_input), start_time)
+
+    def encode(self, sentence):
+        """Token ids of a sentence."""
+        with metrics.stage('phonemization' if self.C.use_phonemes else 'text_to_sequence', chars=len(sentence)):
+            return self.frontend.encode(sentence)
+
+    def decode_line(self, tts_sentence, speaker_id=None, style_input=None, tokens=None, cancel_event=None):
+        """Postnet outputs of the sentences of a cleaned line. ``tokens`` are
+        the ids of its sentences from ``encode`` if already computed."""
+        # if sentence was split in sub-sentences -> iterate over them
+        sentences = split_into_sentences(tts_sentence)
+        if tokens is None:
+            tokens = [None] * len(sentences)
+        return [self.decode(sentence, speaker_id=speaker_id, style_input=style_input, tokens=sentence_tokens,
+                            cancel_event=cancel_event)
+                for sentence, sentence_tokens in zip(sentences, tokens)]
+
+    def vocode_line(self, postnet_outputs, start_time=None):
+        """Waveform of a line from the ``decode_line`` outputs. ``start_time``
+        (perf_counter) of the line is used for the real time factor."""
+        wav_list = []
+        for postnet_output in postnet_outputs:
+            # join sub-sentences back together and add a filler between them
+            wav_list += list(self.vocode(postnet_output))
+            wav_list += [0] * 10000
+        audio_seconds = len(wav_list) / self.ap.sample_rate
+        if start_time is not None and audio_seconds > 0:
+            metrics.observe('tts_real_time_factor', (time.perf_counter() - start_time) / audio_seconds)
+        metrics.inc('tts_audio_seconds_total', audio_seconds)
+        metrics.inc('tts_lines_total')
+        return np.array(wav_list)
+
+    @property
+    def supports_batching(self):
+        # batches are decoded by the eager torch model
+        return self.backend == 'torch' and not getattr(self.model.decoder.attention, 'windowing', False)
+
+    def vocode(self, postnet_output):
+        """Waveform of a T_out x C postnet output."""
+        # pylint: disable=import-outside-toplevel
+        from TTS_lib.utils.synthesis import inv_spectrogram, trim_silence
+        if self.vocoder is not None:
+            if self.C.model == "Tacotron":
+                postnet_output = self.ap.out_linear_to_mel(postnet_output.T).T
+            return run_vocoder_model(self.vocoder, postnet_output, self.use_cuda)
+        with metrics.stage('vocoder', vocoder='GriffinLim', frames=postnet_output.shape[0]):
+            return trim_silence(inv_spectrogram(postnet_output, self.ap, self.C), self.ap)
+
+    def resolve_style_input(self, style_input):
+        """Compute the mel of a style wav once for all sentences of a batch render."""
+        # pylint: disable=import-outside-toplevel
+        from TTS_lib.utils.synthesis import compute_style_mel
+        if not self.C.use_gst or style_input is None or isinstance(style_input, dict):
+            return style_input if self.C.use_gst else None
+        return compute_style_mel(style_input, self.ap, cuda=self.use_cuda)
+
+    def form_batches(self, lines, speaker_id=None, style_input=None, batch_size=8):
+        """Tokenize the sentences of cleaned ``lines`` and group them into
+        batches of about equal predicted length.
+        Returns the list of BatchItem (keyed by line) and the batches."""
+        # pylint: disable=import-outside-toplevel
+        from TTS_lib.utils.batching import BatchItem, form_batches
+        items = []
+        for line_idx, line in enumerate(lines):
+            for sentence in split_into_sentences(line):
+                tokens = self.encode(sentence)
+                frames = self.duration_estimator.predict_frames(
+                    sentence, style_input=style_input, speaker=speaker_id)
+                items.append(BatchItem(len(items), sentence, tokens, frames, key=line_idx))
+        return items, form_batches(items, max_batch_size=batch_size, use_cuda=self.use_cuda)
+
+    def synthesize_batch(self, batch, speaker_id=None, style_input=None, style_mel=None):
+        """Decode the sentences of ``batch`` together and return their
+        waveforms in batch order. Finished sentences are vocoded while the
+        rest of the batch decodes. ``style_mel`` is the result of
+        ``resolve_style_input(style_input)``."""
+        # pylint: disable=import-outside-toplevel
+        import torch
+        from TTS_lib.utils.continuous_batching import ContinuousBatchingScheduler
+        r = self.model.decoder.r
+        max_steps = self.model.decoder.max_decoder_steps
+        scheduler = ContinuousBatchingScheduler(self.model, max_batch_size=len(batch), vocoder=self.vocode,
+                                                encoder_cache=encoder_cache, model_key=self.model_key)
+        try:
+            requests = []
+            for item in batch:
+                inputs = torch.as_tensor(item.tokens, dtype=torch.long).unsqueeze(0)
+                if self.use_cuda:
+                    inputs = inputs.cuda()
+                step_limit = self.duration_estimator.step_limit(
+                    item.text, r, style_input=style_input, speaker=speaker_id, max_steps=max_steps)
+                requests.append(scheduler.submit(inputs, speaker_id=speaker_id, style_input=style_mel,
+                                                 max_decoder_steps=step_limit))
+            with metrics.stage('acoustic_model', batch_size=len(batch)):
+                scheduler.run_until_idle()
+            for item, request in zip(batch, requests):
+                if request.num_steps < request.max_decoder_steps:
+                    self.duration_estimator.update(item.text, request.num_steps * r,
+                                                   style_input=style_input, speaker=speaker_id)
+            return [request.result() for request in requests]
+        finally:
+            # also shuts down the vocoder threads of a failed batch
+            scheduler.stop(wait=False)
+
+    def join_lines(self, items, wavs, num_lines, start_time=None):
+        """Join the sentence waveforms of ``items`` back into ``num_lines``
+        lines in their original order. ``start_time`` (perf_counter) of the
+        render is used for the real time factor."""
+        wav_lists = [[] for _ in range(num_lines)]
+        for item, wav in zip(items, wavs):
+            # add a filler between sub-sentences, as synthesize_line does
+            wav_lists[item.key] += list(wav)
+            wav_lists[item.key] += [0] * 10000
+        audio_seconds = sum(len(wav_list) for wav_list in wav_lists) / self.ap.sample_rate
+        if start_time is not None and audio_seconds > 0:
+            metrics.observe('tts_real_time_factor', (time.perf_counter() - start_time) / audio_seconds)
+        metrics.inc('tts_audio_seconds_total', audio_seconds)
+        metrics.inc('tts_lines_total', num_lines)
+        return [np.array(wav_list) for wav_list in wav_lists]
+
+    def join_line(self, wavs):
+        """Waveform of a line from the waveforms of its sentences."""
+        filler = np.zeros(10000)
+        wav = np.concatenate([part for sentence_wav in wavs for part in (sentence_wav, filler)])
+        metrics.inc('tts_audio_seconds_total', len(wav) / self.ap.sample_rate)
+        metrics.inc('tts_lines_total')
+        return wav
+
+    def synthesize_lines(self, lines, speaker_id=None, style_input=None, batch_size=8):
+        """Synthesize cleaned ``lines`` in length bucketed batches."""
+        # pylint: disable=import-outside-toplevel
+        from TTS_lib.utils.batching import restore_order
+        if not self.supports_batching:
+            return [self.synthesize_line(line, speaker_id, style_input) for line in lines]
+        start_time = time.perf_counter()
+        items, batches = self.form_batches(lines, speaker_id, style_input, batch_size)
+        style_mel = self.resolve_style_input(style_input)
+        batch_wavs = [self.synthesize_batch(batch, speaker_id, style_input, style_mel)
+                      for batch in batches]
+        return self.join_lines(items, restore_order(batches, batch_wavs), len(lines), start_time)
+
+    def warm_up(self, text='Hallo.'):
+        speaker_id = next(iter(self.speakers.values())) if self.speakers else None
+        style_input = {'0': 0.0} if self.C.use_gst else None
+        self.tts(text, speaker_id=speaker_id, style_input=style_input)
+
+
+def get_synthesizer(project, use_cuda, vocoder_type, speakers_json, profiler=None, backend=None):
+    """Return a loaded Synthesizer, reusing the last one loaded with the same settings."""
+    model_path = find_model_file(project)
+    key = (str(project), use_cuda, vocoder_type, str(speakers_json), backend,
+           os.path.abspath(model_path), os.path.getmtime(model_path))
+    with synthesizers_lock:
+        if key not in synthesizers:
+            while len(synthesizers) >= max_synthesizers:
+                synthesizers.popitem(last=False)
+            synthesizers[key] = Synthesizer(project, use_cuda, vocoder_type, speakers_json, profiler=profiler,
+                                            backend=backend)
+        synthesizers.move_to_end(key)
+        return synthesizers[key]
+
+
+def get_job_scheduler():
+    """Scheduler shared by all runs of this process. The number of workers
+    is read from the ``TTS_NUM_WORKERS`` environment variable, default 2."""
+    global job_scheduler  # pylint: disable=global-statement
+    with job_scheduler_lock:
+        if job_scheduler is None:
+            # costs are predicted audio seconds, so this starts at real time
+            job_scheduler = JobScheduler(num_workers=int(os.environ.get('TTS_NUM_WORKERS', 2)),
+                                         seconds_per_cost=1.0)
+        return job_scheduler
+
+
 def main(**kwargs):
-    global symbols, phonemes
+    # pylint: disable=import-outside-toplevel
+    from TTS_lib.utils.text.text_cleaning import clean_sentence
     current_date = date.today()
     current_date = current_date.strftime("%B %d %Y")
     start_time = time.time()
@@ -101,112 +491,31 @@ def main(**kwargs):
     use_cuda = kwargs['use_cuda']                   # if gpu exists default is true
     project = kwargs['project']                     # path to project folder
     vocoder_type = kwargs['vocoder']                # vocoder type, default is GL
-    vocoder_model_file = ""                         # path to vocoder model file
-    vocoder_config = ""                             # path to vocoder config file
     use_gst = kwargs['use_gst']                     # use style_wave for prosody
     style_dict = kwargs['style_input']              # use style_wave for prosody
     speakers_json = kwargs['speaker_config']        # has to be the speakers file
     speaker_name = kwargs['speaker_name']           # name of the selected speaker
     sentence_file = kwargs['sentence_file']         # path to file if generate from file
-    
-    
-    batched_vocoder = True
-    
+    profiler = kwargs.get('profiler')               # StartupProfiler to time the loading stages
+    priority = kwargs.get('priority')               # interactive, batch or background
+    job_callback = kwargs.get('job_callback')       # called with the scheduler and every queued job
+    batch_size = kwargs.get('batch_size', 8)        # sentences decoded together, 1 renders line by line
+    vocoder_workers = kwargs.get('vocoder_workers', 2)  # vocoder threads of a pipelined sentence file
+    acoustic_threads = kwargs.get('acoustic_threads')   # torch threads of a pipelined sentence file
+    queue_size = kwargs.get('queue_size', 4)        # lines buffered between the pipeline stages
+    backend = kwargs.get('backend')                 # torch, torchscript or onnxruntime, default from the config
+    if priority is None:
+        priority = 'interactive' if sentence_file == '' else 'batch'
+
     # create output directory if it doesn't exist
     out_path = str(Path(project, 'output', speaker_name, current_date))
     os.makedirs(out_path, exist_ok=True)
-    
-    # load the config
-    config_path = Path(project + "/config.json")
-    C = load_config(config_path)
-    #C.forward_attn_mask = True
 
-    if use_gst: 
-        if style_dict is not None:
-            style_input = style_dict
-        else:
-            if speaker_name != 'Default':
-                prosody_waves = glob(str(Path(C.datasets[0]['path']+speaker_name+'/*/*.wav')))
-            else:
-                prosody_waves = glob(str(Path(C.datasets[0]['path']+'/*/*.wav')))
-            style_wav_id = random.randrange(0, len(prosody_waves), 1)
-            style_input = prosody_waves[style_wav_id]
-    else:
-        style_input = None
-
-    # load the audio processor
-    ap = AudioProcessor(**C.audio)
-
-    # if the vocabulary was passed, replace the default
-    if 'characters' in C.keys():
-        symbols, phonemes = make_symbols(**C.characters)
-
-
-    # load speakers
-    speaker_id = None
-    if speakers_json != '':
-        speakers = json.load(open(speakers_json, 'r'))
-        num_speakers = len(speakers)
-        #get the speaker id for selected speaker
-        speaker_id = [id for speaker, id in speakers.items() if speaker_name in speaker][0]
-    else:
-        num_speakers = 0
-
-    # find the tts model file in project folder
-    try:
-        tts_model_file = glob(str(Path(project + '/*.pth.tar')))
-        if not tts_model_file:
-            raise FileNotFoundError('[!] TTS Model not found in path: "{}"'.format(project))
-        model_path = tts_model_file[0]
-    except FileNotFoundError:
-        raise
-
-    # load the model
-    num_chars = len(phonemes) if C.use_phonemes else len(symbols)
-    model = setup_model(num_chars, num_speakers, C)
-
-    # if gpu is not available use cpu
-    model, _ = load_checkpoint(model, model_path, use_cuda=use_cuda)
-    # if not use_cuda:
-    #     cp = torch.load(model_path, map_location=torch.device('cpu'))
-    # else:
-    #     cp = torch.load(model_path)
-
-    # model.load_state_dict(cp['model'])
-    #print(model)
-    model.decoder.max_decoder_steps = 2000
-    
-    model.eval()
-    # if use_cuda:
-    #     model.cuda()
-    # model.decoder.set_r(cp['r'])
-
-    # load vocoder
-    if vocoder_type is 'MelGAN':
-        try:
-            model_file = glob(str(Path("/media/alexander/LinuxFS/Documents/PycharmProjects/GothicTTS/TTS_lib/vocoder/Trainings/multiband-melgan-rwd-Juni-15-2020_02+07-9d7cb1e/*.pth.tar")))
-            if not model_file:
-                raise FileNotFoundError('[!] Vocoder Model not found in path: "{}"'.format(project))
-            print(model_file[0])
-            vocoder, ap_vocoder = load_melgan(str(Path('TTS_lib')), 
-            str(model_file[0]), 
-            str("/media/alexander/LinuxFS/Documents/PycharmProjects/GothicTTS/TTS_lib/vocoder/Trainings/multiband-melgan-rwd-Juni-15-2020_02+07-9d7cb1e/config.json"), 
-            use_cuda)
-        except FileNotFoundError:
-            raise
-            
-    elif vocoder_type is 'WaveRNN':
-        try:
-            model_file = glob(str(Path(project + '/*.pkl')))
-            if not model_file:
-                raise FileNotFoundError('[!] Vocoder Model not found in path: "{}"'.format(project))
-            vocoder, ap_vocoder = load_melgan(str(Path('TTS_lib')), str(model_file[0]), str(Path(project + '/config.yml')), use_cuda)
-        except FileNotFoundError:
-            raise
-    else:
-        vocoder, ap_vocoder = None, None
-
-    print(" > Vocoder: {}".format(vocoder_type))
+    synthesizer = get_synthesizer(project, use_cuda, vocoder_type, speakers_json, profiler=profiler,
+                                  backend=backend)
+    # models without GST have no style input
+    style_input = synthesizer.get_style_input(use_gst and synthesizer.C.use_gst, style_dict, speaker_name)
+    speaker_id = synthesizer.get_speaker_id(speaker_name)
 
     # if files with sentences was passed -> read them
     if sentence_file != '':
@@ -215,52 +524,227 @@ def main(**kwargs):
     else:
         list_of_sentences = [text.strip()]
 
-    print(' > Using style input: {}\n'.format(style_input))
+    logger.info(' > Using style input: %s\n', style_input)
 
 
-    # iterate over every passed sentence and synthesize
-    for _, tts_sentence in enumerate(list_of_sentences):
-        wav_list = []
+    def clean_line(tts_sentence):
         # remove character which are not alphanumerical or contain ',. '
-        tts_sentence = clean_sentence(tts_sentence) 
-        print(" > Text: {}".format(tts_sentence))
+        with metrics.stage('text_normalization', chars=len(tts_sentence)):
+            tts_sentence = clean_sentence(tts_sentence)
+        logger.info(" > Text: %s", tts_sentence)
+        return tts_sentence
+
+    def save_line(tts_sentence, wav):
         # build filename
         current_time = datetime.now().strftime("%H%M%S")
-        file_name = ' '.join(tts_sentence.split(" ")[:10])
-        # if multiple sentences in one line -> split them
-        tts_sentence = split_into_sentences(tts_sentence)
-        
-        # if sentence was split in sub-sentences -> iterate over them
-        for sentence in tts_sentence:
-            
-            # synthesize voice
-            _, _, _, wav = tts(model,
-                               vocoder,
-                               C,
-                               None,
-                               sentence,
-                               ap,
-                               ap_vocoder,
-                               use_cuda,
-                               batched_vocoder,
-                               speaker_id=speaker_id,
-                               style_input=style_input,
-                               figures=False)
-
-            # join sub-sentences back together and add a filler between them
-            wav_list += list(wav)
-            wav_list += [0] * 10000
-
-        wav = np.array(wav_list)
-
-        # finalize filename
-        file_name = "_".join([str(current_time), file_name])
-        file_name = file_name.translate(
-            str.maketrans('', '', string.punctuation.replace('_', ''))) + '.wav'
-        file_out_path = os.path.join(out_path, file_name)
+        file_out_path = os.path.join(out_path, output_file_name(tts_sentence, current_time))
 
         # save generated wav to disk
-        ap.save_wav(wav, file_out_path)
+        with metrics.stage('io', path=file_out_path):
+            synthesizer.ap.save_wav(wav, file_out_path)
         end_time = time.time()
-        print(" > Run-time: {}".format(end_time - start_time))
-        print(" > Saving output to {}\n".format(out_path))
+        logger.info(" > Run-time: %s", end_time - start_time)
+        logger.info(" > Saving output to %s\n", out_path)
+        return file_out_path
+
+    def render_line(tts_sentence):
+        tts_sentence = clean_line(tts_sentence)
+        wav = synthesizer.synthesize_line(tts_sentence, speaker_id=speaker_id, style_input=style_input)
+        return save_line(tts_sentence, wav)
+
+    scheduler = get_job_scheduler()
+    estimator = synthesizer.duration_estimator
+
+    def encode_line(tts_sentence):
+        tts_sentence = clean_line(tts_sentence)
+        return tts_sentence, [synthesizer.encode(sentence) for sentence in split_into_sentences(tts_sentence)]
+
+    def decode_line(encoded):
+        # the model is shared with the other runs, every line is a job of the
+        # scheduler so their interactive lines still overtake the file
+        tts_sentence, tokens = encoded
+        job = scheduler.submit(
+            lambda line: (time.perf_counter(),
+                          synthesizer.decode_line(line, speaker_id, style_input, tokens=tokens)),
+            [tts_sentence], priority=priority, project=str(project), name=sentence_file,
+            costs=[estimator.predict_seconds(tts_sentence, style_input=style_input, speaker=speaker_id)])
+        if job_callback is not None:
+            job_callback(scheduler, job)
+        line_start_time, postnet_outputs = job.result()[0]
+        return tts_sentence, line_start_time, postnet_outputs
+
+    def vocode_line(decoded):
+        tts_sentence, line_start_time, postnet_outputs = decoded
+        return tts_sentence, synthesizer.vocode_line(postnet_outputs, line_start_time)
+
+    batched = sentence_file != '' and batch_size > 1 and synthesizer.supports_batching
+    if sentence_file != '' and not batched:
+        # text frontend, acoustic model, vocoder and writer of different
+        # lines run at the same time
+        pipeline = Pipeline([Stage('frontend', encode_line),
+                             Stage('acoustic_model', decode_line),
+                             Stage('vocoder', vocode_line, num_workers=vocoder_workers),
+                             Stage('writer', lambda vocoded: save_line(*vocoded))], queue_size=queue_size)
+        # the torch thread count is process wide, it applies to the decoder
+        # and the vocoder threads alike and is reset afterwards
+        import torch
+        num_threads = torch.get_num_threads()
+        if acoustic_threads:
+            torch.set_num_threads(acoustic_threads)
+        try:
+            return pipeline.run(list_of_sentences)
+        finally:
+            torch.set_num_threads(num_threads)
+            logger.debug(" > Pipeline busy seconds per worker: %s", pipeline.report())
+            estimator.save()
+    if batched:
+        # the sentences of the whole file are decoded in length bucketed
+        # batches, interactive lines of other runs are rendered between them
+        lines = [clean_line(line) for line in list_of_sentences]
+        items, batches = synthesizer.form_batches(lines, speaker_id, style_input, batch_size)
+        style_mel = synthesizer.resolve_style_input(style_input)
+        costs = [sum(estimator.frames_to_seconds(item.predicted_frames) for item in batch)
+                 for batch in batches]
+        # a line is saved as soon as the last of its sentences is vocoded
+        line_lock = threading.Lock()
+        open_items = Counter(item.key for item in items)
+        line_wavs = {}
+
+        def save_items(batch, wavs):
+            saved = []
+            with line_lock:
+                for item, wav in zip(batch, wavs):
+                    line_wavs.setdefault(item.key, {})[item.index] = wav
+                    open_items[item.key] -= 1
+                    if open_items[item.key] == 0:
+                        saved.append((item.key, line_wavs.pop(item.key)))
+            results = []
+            for line_idx, sentence_wavs in saved:
+                sentence_wavs = [sentence_wavs[index] for index in sorted(sentence_wavs)]
+                errors = [wav for wav in sentence_wavs if isinstance(wav, Exception)]
+                try:
+                    if errors:
+                        raise errors[0]
+                    results.append((line_idx, save_line(lines[line_idx], synthesizer.join_line(sentence_wavs))))
+                except Exception as e:  # pylint: disable=broad-except
+                    results.append((line_idx, e))
+            return results
+
+        def render_batch(batch):
+            try:
+                wavs = synthesizer.synthesize_batch(batch, speaker_id, style_input, style_mel)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning(" [!] Batch failed (%s), rendering its sentences one by one", e)
+                wavs = []
+                for item in batch:
+                    try:
+                        wavs.append(synthesizer.vocode(synthesizer.decode(
+                            item.text, speaker_id=speaker_id, style_input=style_input, tokens=item.tokens)))
+                    except Exception as e:  # pylint: disable=broad-except
+                        wavs.append(e)
+            return save_items(batch, wavs)
+
+        job = scheduler.submit(render_batch, batches, priority=priority, project=str(project), costs=costs,
+                               name=sentence_file)
+    else:
+        # a single --text line
+        costs = [estimator.predict_seconds(line, style_input=style_input, speaker=speaker_id)
+                 for line in list_of_sentences]
+        job = scheduler.submit(render_line, list_of_sentences, priority=priority, project=str(project),
+                               costs=costs, name=speaker_name)
+    if job_callback is not None:
+        job_callback(scheduler, job)
+    try:
+        if not batched:
+            return job.result()
+        results = [None] * len(lines)
+        for batch_results in job.result():
+            for line_idx, result in batch_results:
+                results[line_idx] = result
+        failed = [(line, result) for line, result in zip(lines, results) if isinstance(result, Exception)]
+        for line, error in failed:
+            logger.error(" [!] Line failed: %s (%s)", line, error)
+        if failed:
+            raise RuntimeError(" [!] {} of {} lines failed, the others are saved in {}".format(
+                len(failed), len(open_items), out_path)) from failed[0][1]
+        # lines without a sentence are not saved
+        return [result for result in results if result is not None]
+    finally:
+        estimator.save()
+
+
+def main_cli():
+    profiler = StartupProfiler.from_argv(sys.argv)
+    parser = argparse.ArgumentParser(description='Synthesize speech with a GothicTTS project.')
+    parser.add_argument('--project', type=str, required=True, help='path to the project folder')
+    parser.add_argument('--text', type=str, default='', help='text to synthesize')
+    parser.add_argument('--sentence_file', type=str, default='', help='file with one line per output')
+    parser.add_argument('--speakers_json', type=str, default='', help='path to speakers.json')
+    parser.add_argument('--speaker_name', type=str, default='Default', help='name of the speaker')
+    parser.add_argument('--vocoder', type=str, default='GriffinLim', help='GriffinLim, WaveRNN or MelGAN')
+    parser.add_argument('--use_cuda', action='store_true', help='run on the gpu')
+    parser.add_argument('--backend', type=str, default=None, choices=BACKENDS,
+                        help='acoustic model runtime, default is the backend of the config or torch; '
+                             'compare them with python -m TTS_lib.utils.benchmark --backends')
+    parser.add_argument('--style', type=str, default=None,
+                        help='style wav or json GST weights, e.g. {"0": 0.2}; default is a random style wav '
+                             'of the speaker')
+    parser.add_argument('--no_gst', action='store_true', help='do not use a style input')
+    parser.add_argument('--priority', type=str, default=None, choices=PRIORITIES,
+                        help='scheduling class, default interactive for --text and batch for --sentence_file')
+    parser.add_argument('--batch_size', type=int, default=8,
+                        help='sentences of a --sentence_file decoded together, 1 renders line by line')
+    parser.add_argument('--vocoder_workers', type=int, default=2,
+                        help='vocoder threads when the lines of a --sentence_file are rendered one by one')
+    parser.add_argument('--acoustic_threads', type=int, default=None,
+                        help='torch threads while the lines of a --sentence_file are rendered one by one, '
+                             'process wide, default is the torch default')
+    parser.add_argument('--queue_size', type=int, default=4, help='lines buffered between the pipeline stages')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='load the models, run a warm-up sentence and report import and stage times')
+    parser.add_argument('--profile_output', type=str, default=None, help='save the startup profile as json')
+    parser.add_argument('--log_level', type=str, default=None, help='DEBUG, INFO, WARNING or ERROR')
+    parser.add_argument('--metrics_jsonl', type=str, default=None, help='append stage timings and a final snapshot to this file')
+    parser.add_argument('--metrics_port', type=int, default=None, help='serve Prometheus metrics on this port')
+    args = parser.parse_args()
+    setup_logger(args.log_level)
+    exporter = None
+    if args.metrics_jsonl:
+        exporter = metrics.add_hook(JsonLinesExporter(args.metrics_jsonl))
+    if args.metrics_port is not None:
+        start_http_server(args.metrics_port)
+
+    if args.profile_startup:
+        synthesizer = get_synthesizer(args.project, args.use_cuda, args.vocoder, args.speakers_json,
+                                      profiler=profiler, backend=args.backend)
+        with profiler.stage('warm_up'):
+            synthesizer.warm_up()
+        profiler.uninstall()
+        profiler.report()
+        if args.profile_output:
+            profiler.save(args.profile_output)
+        return
+    style_input = args.style
+    if style_input is not None and style_input.lstrip().startswith('{'):
+        style_input = json.loads(style_input)
+    main(text=args.text,
+         use_cuda=args.use_cuda,
+         use_gst=not args.no_gst,
+         style_input=style_input,
+         project=args.project,
+         speaker_config=args.speakers_json,
+         speaker_name=args.speaker_name,
+         vocoder=args.vocoder,
+         sentence_file=args.sentence_file,
+         priority=args.priority,
+         batch_size=args.batch_size,
+         vocoder_workers=args.vocoder_workers,
+         acoustic_threads=args.acoustic_threads,
+         queue_size=args.queue_size,
+         backend=args.backend)
+    if exporter is not None:
+        exporter.write_snapshot()
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,325 @@
+"""Packed audio archive instead of one wav file per line.
+
+Audio is appended to large segment files, an SQLite index maps every name
+to its segment, offset, length and sample rate:
+
+    archive/
+        index.sqlite
+        segments/<writer>-00000.seg
+
+    with AudioArchive('build/archive') as archive:
+        archive.write('DIA_Diego_Hallo_11_01', wav, 22050)
+        pcm, sample_rate = archive.read('DIA_Diego_Hallo_11_01')
+
+Every ``AudioArchive`` object appends to its own segments, so render
+workers in several threads or processes can write to the same archive;
+SQLite serializes the index updates. Reads memory map the segments.
+Frames are stored as raw 16 bit PCM or compressed as FLAC. Rewriting or
+removing a name only updates the index, ``copy`` adds a name for the same
+frames. The frames no name refers to any more stay in their segments, so an
+archive that is rebuilt often grows; ``dead_bytes`` reports them and
+``compact`` reclaims them.
+
+``python -m TTS_lib.utils.archive extract build/archive out/`` writes the
+classic one wav per name layout, ``compact build/archive`` rewrites the
+segments.
+"""
+import io
+import os
+import sys
+import uuid
+import time
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+import scipy.io.wavfile
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('archive')
+
+CODECS = ('pcm16', 'flac')
+
+
+def to_pcm16(wav):
+    """16 bit PCM of a float waveform, normalized like ``AudioProcessor.save_wav``."""
+    wav = np.asarray(wav)
+    if wav.dtype == np.int16:
+        return wav
+    wav_norm = wav * (32767 / max(0.01, np.max(np.abs(wav)) if wav.size else 0.0))
+    return wav_norm.astype(np.int16)
+
+
+class AudioArchive():
+    """Appends audio to the segments of the archive folder ``path`` and reads it back.
+
+    Args:
+        path (str): archive folder, created if it does not exist.
+        codec (str): pcm16 or flac for new entries.
+        segment_size (int): bytes after which a new segment is started.
+        sync (bool): fsync the segment before every index update.
+    """
+    def __init__(self, path, codec='pcm16', segment_size=1 << 30, sync=False):
+        if codec not in CODECS:
+            raise ValueError(" [!] Unknown codec {}, use one of {}".format(codec, CODECS))
+        self.path = path
+        self.codec = codec
+        self.segment_size = segment_size
+        self.sync = sync
+        self.segment_dir = os.path.join(path, 'segments')
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(path, 'index.sqlite'), timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS entries (name TEXT PRIMARY KEY, segment TEXT, '
+                        'offset INTEGER, length INTEGER, sample_rate INTEGER, num_samples INTEGER, '
+                        'codec TEXT, created REAL)')
+        self.db.commit()
+        self.writer_id = '{}-{}'.format(os.getpid(), uuid.uuid4().hex[:8])
+        self._segment_index = 0
+        self._segment = None
+        self._segment_name = None
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return self.exists(name)
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment_name = '{}-{:05d}.seg'.format(self.writer_id, self._segment_index)
+        self._segment_index += 1
+        self._segment = open(os.path.join(self.segment_dir, self._segment_name), 'ab')
+
+    def _encode(self, pcm, sample_rate):
+        if self.codec == 'pcm16':
+            return pcm.tobytes()
+        import soundfile  # pylint: disable=import-outside-toplevel
+        buffer = io.BytesIO()
+        soundfile.write(buffer, pcm, sample_rate, format='FLAC', subtype='PCM_16')
+        return buffer.getvalue()
+
+    def write(self, name, wav, sample_rate):
+        """Append a float waveform (normalized like saved wavs) or int16 PCM as ``name``."""
+        pcm = to_pcm16(wav)
+        data = self._encode(pcm, sample_rate)
+        with self._lock:
+            if self._segment is None or self._segment.tell() + len(data) > self.segment_size:
+                self._open_segment()
+            offset = self._segment.tell()
+            self._segment.write(data)
+            self._segment.flush()
+            if self.sync:
+                os.fsync(self._segment.fileno())
+            self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (name, self._segment_name, offset, len(data), sample_rate, len(pcm),
+                             self.codec, time.time()))
+            self.db.commit()
+
+    def _entry(self, name):
+        with self._lock:
+            row = self.db.execute('SELECT segment, offset, length, sample_rate, codec FROM entries '
+                                  'WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row
+
+    def _map(self, segment, end):
+        with self._lock:
+            mapped = self._maps.get(segment)
+            # segments of running writers grow, map them again
+            if mapped is None or len(mapped) < end:
+                mapped = np.memmap(os.path.join(self.segment_dir, segment), dtype=np.uint8, mode='r')
+                self._maps[segment] = mapped
+            return mapped
+
+    def read(self, name):
+        """(int16 PCM, sample rate) of ``name``."""
+        segment, offset, length, sample_rate, codec = self._entry(name)
+        data = self._map(segment, offset + length)[offset:offset + length]
+        if codec == 'pcm16':
+            return data.view(np.int16), sample_rate
+        import soundfile  # pylint: disable=import-outside-toplevel
+        pcm, sample_rate = soundfile.read(io.BytesIO(data.tobytes()), dtype='int16')
+        return pcm, sample_rate
+
+    def exists(self, name):
+        with self._lock:
+            return self.db.execute('SELECT 1 FROM entries WHERE name = ?', (name,)).fetchone() is not None
+
+    def names(self):
+        with self._lock:
+            return [row[0] for row in self.db.execute('SELECT name FROM entries ORDER BY name')]
+
+    def copy(self, source, name):
+        """Add ``name`` for the frames of ``source`` without copying them."""
+        with self._lock:
+            self.db.execute('INSERT OR REPLACE INTO entries SELECT ?, segment, offset, length, sample_rate, '
+                            'num_samples, codec, ? FROM entries WHERE name = ?', (name, time.time(), source))
+            self.db.commit()
+
+    def remove(self, name):
+        with self._lock:
+            self.db.execute('DELETE FROM entries WHERE name = ?', (name,))
+            self.db.commit()
+
+    def _segment_names(self):
+        return [name for name in os.listdir(self.segment_dir) if name.endswith('.seg')]
+
+    def _segments_size(self):
+        return sum(os.path.getsize(os.path.join(self.segment_dir, name)) for name in self._segment_names())
+
+    def dead_bytes(self):
+        """Bytes of segment data no entry refers to, freed by ``compact``."""
+        with self._lock:
+            live = self.db.execute('SELECT COALESCE(SUM(length), 0) FROM '
+                                   '(SELECT DISTINCT segment, offset, length FROM entries)').fetchone()[0]
+        return self._segments_size() - live
+
+    def compact(self):
+        """Copy the frames of all entries to new segments and delete the old
+        segments. No other writer may use the archive meanwhile. Returns the
+        number of bytes freed."""
+        size = self._segments_size()
+        with self._lock:
+            frames = self.db.execute('SELECT DISTINCT segment, offset, length FROM entries '
+                                     'ORDER BY segment, offset').fetchall()
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            self._maps = {}
+            old_segments = self._segment_names()
+            moves = []
+            source, source_name = None, None
+            try:
+                for segment, offset, length in frames:
+                    if segment != source_name:
+                        if source is not None:
+                            source.close()
+                        source, source_name = open(os.path.join(self.segment_dir, segment), 'rb'), segment
+                    source.seek(offset)
+                    data = source.read(length)
+                    if self._segment is None or self._segment.tell() + len(data) > self.segment_size:
+                        self._sync_segment()
+                        self._open_segment()
+                    moves.append((self._segment_name, self._segment.tell(), segment, offset))
+                    self._segment.write(data)
+            finally:
+                if source is not None:
+                    source.close()
+            # the old frames are deleted, so the new ones have to be on disk first
+            self._sync_segment()
+            # copies share their frames, they move together
+            self.db.executemany('UPDATE entries SET segment = ?, offset = ? WHERE segment = ? AND offset = ?',
+                                moves)
+            self.db.commit()
+            for name in old_segments:
+                os.remove(os.path.join(self.segment_dir, name))
+        freed = size - self._segments_size()
+        logger.info(" > Compacted %s, %d frames in %d bytes, %d bytes freed", self.path, len(frames),
+                    size - freed, freed)
+        return freed
+
+    def _sync_segment(self):
+        if self._segment is not None:
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+
+    def extract(self, out_path, names=None):
+        """Write every entry (or ``names``) to ``out_path/<name>.wav``."""
+        names = self.names() if names is None else names
+        for name in names:
+            pcm, sample_rate = self.read(name)
+            file_path = os.path.join(out_path, name if name.lower().endswith('.wav') else name + '.wav')
+            os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+            scipy.io.wavfile.write(file_path, sample_rate, np.asarray(pcm))
+        return len(names)
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            self._maps = {}
+            self.db.close()
+
+
+class WavFolder():
+    """One wav file per name in ``path``, with the interface of ``AudioArchive``."""
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return self.exists(name)
+
+    def _file(self, name):
+        return os.path.join(self.path, name if name.lower().endswith('.wav') else name + '.wav')
+
+    def write(self, name, wav, sample_rate):
+        file_path = self._file(name)
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        # never leave a half written wav under the final name
+        tmp_path = file_path + '.tmp'
+        scipy.io.wavfile.write(tmp_path, sample_rate, to_pcm16(wav))
+        os.replace(tmp_path, file_path)
+
+    def read(self, name):
+        sample_rate, pcm = scipy.io.wavfile.read(self._file(name))
+        return pcm, sample_rate
+
+    def exists(self, name):
+        return os.path.exists(self._file(name))
+
+    def copy(self, source, name):
+        pcm, sample_rate = self.read(source)
+        self.write(name, pcm, sample_rate)
+
+    def remove(self, name):
+        if self.exists(name):
+            os.remove(self._file(name))
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List, extract or compact a packed audio archive.')
+    parser.add_argument('command', choices=['list', 'extract', 'compact'])
+    parser.add_argument('archive', type=str, help='archive folder')
+    parser.add_argument('out_path', type=str, nargs='?', default=None, help='folder of the extracted wavs')
+    parser.add_argument('--names', type=str, nargs='*', default=None, help='only these entries')
+    args = parser.parse_args()
+    with AudioArchive(args.archive) as archive:
+        if args.command == 'list':
+            for name in args.names or archive.names():
+                print(name)
+            return
+        if args.command == 'compact':
+            archive.compact()
+            return
+        if args.out_path is None:
+            parser.error('extract needs an output folder')
+        num_files = archive.extract(args.out_path, args.names)
+        logger.info(" > Extracted %d files to %s", num_files, args.out_path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,9 @@ import scipy.io
 import scipy.signal
 
 from TTS_lib.utils.data import StandardScaler
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('audio')
 
 
 class AudioProcessor(object):
@@ -33,7 +36,7 @@ class AudioProcessor(object):
                  stats_path=None,
                  **_):
 
-        print(" > Setting up Audio Processor...")
+        logger.debug(" > Setting up Audio Processor...")
         # setup class attributed
         self.sample_rate = sample_rate
         self.num_mels = num_mels
@@ -65,7 +68,7 @@ class AudioProcessor(object):
         assert min_level_db != 0.0, " [!] min_level_db is 0"
         members = vars(self)
         for key, value in members.items():
-            print(" | > {}:{}".format(key, value))
+            logger.debug(" | > %s:%s", key, value)
         # create spectrogram utils
         self.mel_basis = self._build_mel_basis()
         self.inv_mel_basis = np.linalg.pinv(self._build_mel_basis())
@@ -311,7 +314,7 @@ class AudioProcessor(object):
             try:
                 x = self.trim_silence(x)
             except ValueError:
-                print(f' [!] File cannot be trimmed for silence - {filename}')
+                logger.warning(' [!] File cannot be trimmed for silence - %s', filename)
         assert self.sample_rate == sr, "%s vs %s"%(self.sample_rate, sr)
         if self.do_sound_norm:
             x = self.sound_norm(x)
@@ -0,0 +1,298 @@
+import os
+import json
+import time
+
+import numpy as np
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('backends')
+
+BACKENDS = ('torch', 'torchscript', 'onnxruntime')
+
+
+class DecodingCancelled(Exception):
+    """Raised by ``Decoder.inference`` and the backend decoder loops at the
+    next step after their ``cancel_event`` was set."""
+
+
+def init_states(meta, B, T_in, zeros):
+    """Initial decoder states in the order of the decoder step inputs.
+
+    ``zeros`` is ``torch.zeros`` or ``np.zeros`` like.
+    """
+    dims = {'query': meta['query_dim'],
+            'attention_rnn_cell_state': meta['query_dim'],
+            'decoder_hidden': meta['decoder_rnn_dim'],
+            'decoder_cell': meta['decoder_rnn_dim'],
+            'context': meta['input_dim'],
+            'attention_weights': T_in,
+            'attention_weights_cum': T_in,
+            'alpha': T_in,
+            'u': 1}
+    states = []
+    for name in meta['decoder_states'] + meta['attention_states']:
+        state = zeros((B, dims[name]))
+        if name == 'alpha':
+            state[:, 0] = 1
+            state[:, 1:] = 1e-7
+        elif name == 'u':
+            state[:] = 0.5
+        states.append(state)
+    return states
+
+
+def get_io_names(meta):
+    state_names = meta['decoder_states'] + meta['attention_states']
+    return {
+        'encoder': (['text'], ['encoder_outputs']),
+        'attention_memory': (['inputs'], ['processed_inputs']),
+        'decoder_step': (['memory', 'inputs', 'processed_inputs'] + state_names,
+                         ['decoder_output', 'stop_token'] + ['next_' + name for name in state_names]),
+        'postnet': (['mel'], ['mel_postnet']),
+        'gst': (['style_weights'], ['gst_embedding']),
+    }
+
+
+class InferenceBackend():
+    """Interface of the runtimes ``synthesis()`` can dispatch to.
+
+    ``inference()`` takes the token ids as a 1 x T_in int64 array and returns
+    numpy arrays laid out like ``Tacotron2.inference()``:
+    decoder_output and postnet_output (B x T_out x frame_dim), alignments
+    (B x T_decoder x T_in) and stop_tokens (B x T_decoder x 1).
+    ``max_decoder_steps`` overrides the step limit of the model and setting
+    ``cancel_event`` raises ``DecodingCancelled`` at the next decoder step.
+    """
+    name = None
+
+    def inference(self, inputs, speaker_id=None, style_input=None, max_decoder_steps=None, cancel_event=None):
+        raise NotImplementedError
+
+
+class TorchBackend(InferenceBackend):
+    """Eager PyTorch inference with the full model."""
+    name = 'torch'
+
+    def __init__(self, model, CONFIG, use_cuda=False, encoder_cache=None, model_key=None):
+        self.model = model
+        self.CONFIG = CONFIG
+        self.use_cuda = use_cuda
+        self.encoder_cache = encoder_cache
+        self.model_key = model_key
+
+    def inference(self, inputs, speaker_id=None, style_input=None, max_decoder_steps=None, cancel_event=None):
+        # pylint: disable=import-outside-toplevel
+        import torch
+        from TTS_lib.utils.synthesis import run_model_torch, id_to_torch, numpy_to_torch
+        inputs = numpy_to_torch(inputs, torch.long, cuda=self.use_cuda)
+        if speaker_id is not None:
+            speaker_id = id_to_torch(speaker_id, cuda=self.use_cuda)
+        if style_input is not None and not isinstance(style_input, dict):
+            style_input = numpy_to_torch(style_input, torch.float, cuda=self.use_cuda)
+        outputs = run_model_torch(self.model, inputs, self.CONFIG, False, speaker_id, style_input,
+                                  encoder_cache=self.encoder_cache, model_key=self.model_key,
+                                  max_decoder_steps=max_decoder_steps, cancel_event=cancel_event)
+        return tuple(output.cpu().numpy() for output in outputs)
+
+
+class StagedBackend(InferenceBackend):
+    """Runs the exported Tacotron2 stages with an explicit decoder loop.
+
+    Subclasses implement ``run(stage_name, inputs)`` for their runtime. Style
+    inputs must be a dict of style token weights since the reference encoder
+    is not part of the exported stages.
+    """
+    def __init__(self, meta, speaker_embedding=None):
+        self.meta = meta
+        self.speaker_embedding = speaker_embedding
+        self.gate_threshold = 0.7
+
+    def run(self, stage_name, inputs):
+        raise NotImplementedError
+
+    def _static_embeddings(self, B, speaker_id, style_input):
+        static_embeddings = []
+        if self.meta['gst'] and style_input is not None:
+            if not isinstance(style_input, dict):
+                raise NotImplementedError(" [!] Only style token weights are supported by the '{}' backend.".format(self.name))
+            style_weights = np.zeros((B, self.meta['num_style_tokens']), dtype=np.float32)
+            for k_token, v_amplifier in style_input.items():
+                style_weights[:, int(k_token)] += v_amplifier
+            static_embeddings.append(self.run('gst', [style_weights])[0])
+        if self.meta['num_speakers'] > 1:
+            speaker_embedding = self.speaker_embedding[np.asarray(speaker_id).reshape(-1)]
+            static_embeddings.append(np.broadcast_to(speaker_embedding, (B, speaker_embedding.shape[-1])))
+        return static_embeddings
+
+    def inference(self, inputs, speaker_id=None, style_input=None, max_decoder_steps=None, cancel_event=None):
+        inputs = np.asarray(inputs, dtype=np.int64)
+        B, T_in = inputs.shape
+        frame_dim = self.meta['frame_dim']
+        encoder_outputs = self.run('encoder', [inputs])[0]
+        static_embeddings = self._static_embeddings(B, speaker_id, style_input)
+        if static_embeddings:
+            static_embeddings = np.concatenate(static_embeddings, axis=-1)[:, None]
+            static_embeddings = np.broadcast_to(static_embeddings, (B, T_in, static_embeddings.shape[-1]))
+            encoder_outputs = np.concatenate([encoder_outputs, static_embeddings], axis=-1)
+        encoder_outputs = np.ascontiguousarray(encoder_outputs, dtype=np.float32)
+        processed_inputs = self.run('attention_memory', [encoder_outputs])[0]
+
+        states = init_states(self.meta, B, T_in, lambda shape: np.zeros(shape, dtype=np.float32))
+        attention_idx = len(self.meta['decoder_states'])
+        memory = np.zeros((B, frame_dim), dtype=np.float32)
+        if max_decoder_steps is None:
+            max_decoder_steps = self.meta['max_decoder_steps']
+        outputs, stop_tokens, alignments, t = [], [], [], 0
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise DecodingCancelled()
+            step_outputs = self.run('decoder_step', [memory, encoder_outputs, processed_inputs] + states)
+            decoder_output, stop_token, states = step_outputs[0], step_outputs[1], list(step_outputs[2:])
+            outputs.append(decoder_output)
+            stop_tokens.append(stop_token)
+            alignments.append(states[attention_idx])
+            # same stopping criterion as Decoder.inference()
+            if np.all(stop_token > self.gate_threshold) and t > B / 2:
+                break
+            if len(outputs) >= max_decoder_steps:
+                logger.warning("   | > Decoder stopped with 'max_decoder_steps")
+                break
+            memory = decoder_output[:, frame_dim * (self.meta['r'] - 1):]
+            t += 1
+
+        decoder_output = np.stack(outputs, axis=1).reshape(B, -1, frame_dim)
+        postnet_output = self.run('postnet', [np.ascontiguousarray(decoder_output.transpose(0, 2, 1))])[0]
+        postnet_output = postnet_output.transpose(0, 2, 1)
+        alignments = np.stack(alignments, axis=1)
+        stop_tokens = np.stack(stop_tokens, axis=1)
+        return decoder_output, postnet_output, alignments, stop_tokens
+
+
+class TorchScriptBackend(StagedBackend):
+    """Traced TorchScript versions of the Tacotron2 stages."""
+    name = 'torchscript'
+
+    def __init__(self, stages, meta, speaker_embedding=None):
+        super(TorchScriptBackend, self).__init__(meta, speaker_embedding)
+        self.stages = stages
+
+    @classmethod
+    def from_model(cls, model):
+        # pylint: disable=import-outside-toplevel
+        import torch
+        from TTS_lib.utils.onnx_export import build_stages, get_example_inputs
+        model = model.cpu().eval()
+        stages, meta = build_stages(model)
+        example_inputs = get_example_inputs(meta, num_chars=model.embedding.num_embeddings)
+        with torch.no_grad():
+            traced_stages = {name: torch.jit.trace(stage, example_inputs[name], check_trace=False)
+                             for name, stage in stages.items()}
+        speaker_embedding = None
+        if model.num_speakers > 1:
+            speaker_embedding = model.speaker_embedding.weight.detach().numpy()
+        return cls(traced_stages, meta, speaker_embedding)
+
+    def run(self, stage_name, inputs):
+        # pylint: disable=import-outside-toplevel
+        import torch
+        with torch.no_grad():
+            outputs = self.stages[stage_name](*[torch.from_numpy(np.asarray(x)) for x in inputs])
+        if isinstance(outputs, torch.Tensor):
+            outputs = (outputs, )
+        return [output.numpy() for output in outputs]
+
+
+class OnnxBackend(StagedBackend):
+    """onnxruntime sessions for the graphs written by ``export_onnx()``.
+
+    Only needs numpy and onnxruntime, not PyTorch.
+    """
+    name = 'onnxruntime'
+
+    def __init__(self, export_path, providers=None, num_threads=None):
+        # pylint: disable=import-outside-toplevel
+        import onnxruntime as ort
+        with open(os.path.join(export_path, 'stages.json'), 'r') as f:
+            meta = json.load(f)
+        speaker_embedding = None
+        if meta['num_speakers'] > 1:
+            speaker_embedding = np.load(os.path.join(export_path, 'speaker_embedding.npy'))
+        super(OnnxBackend, self).__init__(meta, speaker_embedding)
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        providers = providers or ['CPUExecutionProvider']
+        self.input_names = {name: io[0] for name, io in get_io_names(meta).items()}
+        self.sessions = {}
+        for stage_name in self.input_names:
+            stage_path = os.path.join(export_path, stage_name + '.onnx')
+            if os.path.exists(stage_path):
+                self.sessions[stage_name] = ort.InferenceSession(stage_path, options, providers=providers)
+
+    def run(self, stage_name, inputs):
+        session = self.sessions[stage_name]
+        # graph inputs unused by the exported model are dropped by the exporter
+        graph_inputs = {graph_input.name for graph_input in session.get_inputs()}
+        feeds = {name: value for name, value in zip(self.input_names[stage_name], inputs)
+                 if name in graph_inputs}
+        return session.run(None, feeds)
+
+
+def load_backend(name, model, CONFIG, use_cuda=False, onnx_path=None, num_threads=None):
+    """InferenceBackend ``name`` (see ``BACKENDS``) of a loaded model.
+
+    Args:
+        name (str): torch, torchscript or onnxruntime.
+        model (TTS.models): the loaded torch model, traced for torchscript.
+        onnx_path (str): folder written by ``TTS_lib.utils.onnx_export``.
+        num_threads (int): intra op threads of onnxruntime.
+    """
+    if name not in BACKENDS:
+        raise ValueError(" [!] Unknown backend {}, use one of {}".format(name, BACKENDS))
+    if name == 'torch':
+        return TorchBackend(model, CONFIG, use_cuda=use_cuda)
+    if use_cuda:
+        raise ValueError(" [!] The '{}' backend runs on the cpu only.".format(name))
+    if name == 'torchscript':
+        return TorchScriptBackend.from_model(model)
+    if onnx_path is None or not os.path.exists(os.path.join(onnx_path, 'stages.json')):
+        raise FileNotFoundError(" [!] No ONNX export in {}, run python -m TTS_lib.utils.onnx_export "
+                                "first.".format(onnx_path))
+    return OnnxBackend(onnx_path, num_threads=num_threads)
+
+
+def benchmark_backends(backends, inputs_list, speaker_id=None, style_input=None, num_runs=3,
+                       max_decoder_steps=None):
+    """Measure the latency of each backend on the same token sequences.
+
+    Args:
+        backends (list): InferenceBackend instances.
+        inputs_list (list): 1 x T_in int64 arrays.
+        num_runs (int): repetitions after one warm-up run per input.
+        max_decoder_steps (list): step limit per input, e.g. for models
+            with random weights that do not predict stop tokens.
+
+    Returns:
+        dict: backend name -> mean and median latency in seconds per input and decoder steps per second.
+    """
+    results = {}
+    for backend in backends:
+        latencies, num_steps = [], 0
+        for idx, inputs in enumerate(inputs_list):
+            step_limit = max_decoder_steps[idx] if max_decoder_steps is not None else None
+            backend.inference(inputs, speaker_id, style_input, max_decoder_steps=step_limit)
+            for _ in range(num_runs):
+                start_time = time.perf_counter()
+                _, _, alignments, _ = backend.inference(inputs, speaker_id, style_input,
+                                                        max_decoder_steps=step_limit)
+                latencies.append(time.perf_counter() - start_time)
+                num_steps += alignments.shape[1]
+        results[backend.name] = {'mean': float(np.mean(latencies)),
+                                 'median': float(np.median(latencies)),
+                                 'steps_per_sec': num_steps / float(np.sum(latencies))}
+    print(" > {:<14} {:>10} {:>10} {:>12}".format('backend', 'mean (s)', 'median (s)', 'steps/sec'))
+    for name, result in results.items():
+        print(" | > {:<12} {:>10.4f} {:>10.4f} {:>12.1f}".format(
+            name, result['mean'], result['median'], result['steps_per_sec']))
+    return results
@@ -0,0 +1,122 @@
+"""Length bucketed batches for sentence file renders.
+
+All sentences are tokenized up front, sorted by their predicted output
+length and cut into batches under a padded token budget and a memory
+budget, so utterances decoded together are about equally long:
+
+    items = [BatchItem(idx, text, tokens, predicted_frames) for ...]
+    for batch in form_batches(items, max_batch_size=8):
+        ...
+    results = restore_order(batches, batch_results)
+
+The memory budget defaults to a fraction of the currently available
+(cuda) memory, so batch sizes shrink on loaded machines.
+"""
+import os
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('batching')
+
+
+class BatchItem():
+    """A sentence with its token ids and predicted number of mel frames.
+    ``index`` is the position in the input, ``key`` identifies e.g. its line."""
+    def __init__(self, index, text, tokens, predicted_frames, key=None):
+        self.index = index
+        self.text = text
+        self.tokens = tokens
+        self.predicted_frames = predicted_frames
+        self.key = key
+
+    @property
+    def num_tokens(self):
+        return len(self.tokens)
+
+
+def get_available_memory(use_cuda=False):
+    """Free bytes of the current cuda device or available system memory,
+    None if unknown."""
+    if use_cuda:
+        import torch  # pylint: disable=import-outside-toplevel
+        if torch.cuda.is_available():
+            free, _ = torch.cuda.mem_get_info()
+            return free
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if hasattr(os, 'sysconf'):
+        try:
+            return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError):
+            pass
+    return None
+
+
+def estimate_item_bytes(num_tokens, num_frames, encoder_dim=768, attention_dim=128,
+                        frame_dim=80, postnet_dim=512):
+    """Rough float32 memory of one utterance in a lean decoder batch: the
+    padded encoder outputs and their attention projection, the collected
+    frames and the postnet activations."""
+    return 4 * (num_tokens * (encoder_dim + attention_dim) + num_frames * (frame_dim + 2 * postnet_dim))
+
+
+def form_batches(items, max_batch_size=8, max_tokens=2048, memory_budget=None,
+                 memory_fraction=0.25, use_cuda=False, item_bytes=estimate_item_bytes):
+    """Group ``items`` into batches of about equal output length.
+
+    Args:
+        max_batch_size (int): utterances per batch.
+        max_tokens (int): padded input tokens per batch, batch size times
+            the longest input.
+        memory_budget (int): bytes per batch, defaults to ``memory_fraction``
+            of the available memory.
+        item_bytes (callable): memory of an utterance given its padded
+            tokens and predicted frames.
+    Returns:
+        list of lists of BatchItem, shortest batches first.
+    """
+    if memory_budget is None:
+        available = get_available_memory(use_cuda)
+        memory_budget = int(available * memory_fraction) if available else None
+    ordered = sorted(items, key=lambda item: (item.predicted_frames, item.num_tokens))
+    batches, batch = [], []
+    max_len, max_frames = 0, 0
+    for item in ordered:
+        new_len = max(max_len, item.num_tokens)
+        new_frames = max(max_frames, item.predicted_frames)
+        size = len(batch) + 1
+        fits = size <= max_batch_size and size * new_len <= max_tokens
+        if fits and memory_budget is not None:
+            fits = size * item_bytes(new_len, new_frames) <= memory_budget
+        if batch and not fits:
+            batches.append(batch)
+            batch, new_len, new_frames = [], item.num_tokens, item.predicted_frames
+        batch.append(item)
+        max_len, max_frames = new_len, new_frames
+    if batch:
+        batches.append(batch)
+    if batches:
+        logger.debug(" > %d items in %d batches, memory budget %s", len(ordered), len(batches),
+                     memory_budget)
+    return batches
+
+
+def padding_ratio(batches):
+    """Share of padded input tokens, e.g. to compare batch strategies."""
+    padded = sum(len(batch) * max(item.num_tokens for item in batch) for batch in batches)
+    used = sum(item.num_tokens for batch in batches for item in batch)
+    return 1.0 - used / padded if padded else 0.0
+
+
+def restore_order(batches, batch_results):
+    """Results of ``batches`` (one list per batch) in the original item order."""
+    results = {}
+    for batch, outputs in zip(batches, batch_results):
+        for item, output in zip(batch, outputs):
+            results[item.index] = output
+    return [results[index] for index in sorted(results)]
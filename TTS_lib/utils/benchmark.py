@@ -0,0 +1,386 @@
+"""End-to-end synthesis benchmark.
+
+Builds the model of a config with random weights, so no trained checkpoint
+is needed, and times every stage of ``synthesize.tts``: text cleaning, text
+to sequence (incl. phonemization), encoder, decoder, postnet, vocoder and
+WAV writing, over a sweep of sentence lengths, batch sizes and torch thread
+counts.
+
+Random weights do not predict stop tokens, so the decoder runs a fixed
+number of steps derived from the input length (``frames_per_char``).
+
+    python -m TTS_lib.utils.benchmark config.json --out results.json --baseline baseline.json
+
+With ``--backends`` the acoustic model runtimes of ``TTS_lib.utils.backends``
+are compared instead, on one sentence per sentence length:
+
+    python -m TTS_lib.utils.benchmark config.json --backends torch,torchscript,onnxruntime
+"""
+import os
+import sys
+import json
+import math
+import time
+import tempfile
+import platform
+import argparse
+from contextlib import contextmanager
+
+import numpy as np
+
+STAGES = ['clean_text', 'text_to_sequence', 'encoder', 'decoder', 'postnet', 'vocoder', 'write_wav']
+PERCENTILES = [50, 90, 95, 99]
+
+BENCHMARK_TEXT = ("Im Minental versammelt sich eine Armee des Bösen unter der Führung von Drachen. "
+                  "Wir müssen sie aufhalten, so lange wir noch können. Menschen sind wie Bücher, sagte er ruhig. "
+                  "Außen steht der Klappentext für den groben Überblick, und wenn man sie öffnet und hineinschaut, "
+                  "kann man sie gänzlich lesen. Aber glaubt mir, dass man Glück und Zuversicht selbst in Zeiten "
+                  "der Dunkelheit zu finden vermag. Man darf nur nicht vergessen ein Licht leuchten zu lassen.")
+
+
+def get_peak_rss():
+    """Peak resident set size of this process in MB, None if unknown."""
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Windows
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on linux
+    return peak_rss / 1024 ** 2 if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def make_sentences(num_words, batch_size):
+    """Return ``batch_size`` different sentences with ``num_words`` words each."""
+    words = BENCHMARK_TEXT.replace('.', '').replace(',', '').split()
+    sentences = []
+    for idx in range(batch_size):
+        offset = idx * 7
+        sentence = [words[(offset + i) % len(words)] for i in range(num_words)]
+        sentences.append(' '.join(sentence) + '.')
+    return sentences
+
+
+def summarize(values):
+    values = np.asarray(values, dtype=np.float64)
+    summary = {'mean': float(values.mean())}
+    for percentile in PERCENTILES:
+        summary['p{}'.format(percentile)] = float(np.percentile(values, percentile))
+    return summary
+
+
+class StageTimer():
+    """Collects the wall time of each stage over several runs."""
+    def __init__(self, use_cuda=False):
+        self.use_cuda = use_cuda
+        self.times = {}
+        self.current = {}
+
+    @contextmanager
+    def stage(self, name):
+        # pylint: disable=import-outside-toplevel
+        import torch
+        if self.use_cuda:
+            torch.cuda.synchronize()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.use_cuda:
+                torch.cuda.synchronize()
+            self.current[name] = self.current.get(name, 0.0) + time.perf_counter() - start_time
+
+    def next_run(self):
+        for name, seconds in self.current.items():
+            self.times.setdefault(name, []).append(seconds)
+        self.current = {}
+
+
+class Benchmark():
+    """Runs the synthesis stages of a model with random weights.
+
+    Args:
+        C (AttrDict): model config.
+        num_speakers (int): number of speakers of the model.
+        use_cuda (bool): run the model on the gpu.
+        vocoder_model: optional vocoder with ``inference(mel)``, Griffin-Lim if None.
+        frames_per_char (float): output frames per input character.
+        quantize (bool): benchmark the dynamically quantized model.
+        decompose_static_inputs (bool): see ``Tacotron2.inference``.
+        lean (bool): only collect the mel outputs like ``synthesize.tts``, no
+            alignments and stop tokens.
+    """
+    def __init__(self, C, num_speakers=0, use_cuda=False, vocoder_model=None, frames_per_char=5.5,
+                 quantize=False, decompose_static_inputs=True, lean=True, seed=0):
+        # pylint: disable=import-outside-toplevel
+        import torch
+        from TTS_lib.utils.audio import AudioProcessor
+        from TTS_lib.utils.generic_utils import setup_model
+        from TTS_lib.utils.quantization import quantize_model
+        from TTS_lib.utils.text import TextFrontend
+        self.C = C
+        self.use_cuda = use_cuda
+        self.vocoder_model = vocoder_model
+        self.frames_per_char = frames_per_char
+        self.decompose_static_inputs = decompose_static_inputs
+        self.lean = lean
+        self.num_speakers = num_speakers
+        self.frontend = TextFrontend.from_config(C)
+        num_chars = self.frontend.num_chars
+        self.ap = AudioProcessor(**C.audio)
+        torch.manual_seed(seed)
+        model = setup_model(num_chars, num_speakers, C)
+        model.eval()
+        if quantize and not use_cuda:
+            model = quantize_model(model)
+        if use_cuda:
+            model.cuda()
+        self.model = model
+        self.out_path = tempfile.mkdtemp(prefix='tts_benchmark_')
+
+    def num_decoder_steps(self, sentences):
+        num_chars = max(len(sentence) for sentence in sentences)
+        return max(1, int(math.ceil(num_chars * self.frames_per_char / self.model.decoder.r)))
+
+    def run(self, sentences, timer):
+        """Synthesize a batch of sentences and return the number of output frames per sentence."""
+        # pylint: disable=import-outside-toplevel
+        import torch
+        from TTS_lib.utils.synthesis import text_to_seqvec
+        from TTS_lib.utils.text.text_cleaning import clean_sentence
+        model = self.model
+        device = 'cuda' if self.use_cuda else 'cpu'
+        B = len(sentences)
+
+        with timer.stage('clean_text'):
+            sentences = [clean_sentence(sentence) for sentence in sentences]
+        with timer.stage('text_to_sequence'):
+            seqs = [text_to_seqvec(sentence, self.C, self.frontend) for sentence in sentences]
+        inputs = np.zeros((B, max(len(seq) for seq in seqs)), dtype=np.int64)
+        for idx, seq in enumerate(seqs):
+            inputs[idx, :len(seq)] = seq
+        inputs = torch.from_numpy(inputs).to(device)
+        speaker_ids = torch.zeros(B, dtype=torch.long, device=device) if self.num_speakers > 1 else None
+        style_input = {'0': 0.1} if self.C.use_gst else None
+        num_steps = self.num_decoder_steps(sentences)
+        outputs = dict(num_steps=num_steps, return_alignments=not self.lean,
+                       return_stop_tokens=not self.lean)
+
+        with torch.no_grad():
+            with timer.stage('encoder'):
+                encoder_outputs = model.encode(inputs)
+                static_embeddings = model.compute_static_embeddings(encoder_outputs, speaker_ids, style_input)
+            with timer.stage('decoder'):
+                if self.decompose_static_inputs:
+                    mel_outputs, _, _ = model.decoder.inference(
+                        encoder_outputs, static_inputs=static_embeddings, **outputs)
+                else:
+                    encoder_outputs = model._concat_static_embeddings(encoder_outputs, static_embeddings)  # pylint: disable=protected-access
+                    mel_outputs, _, _ = model.decoder.inference(encoder_outputs, **outputs)
+            with timer.stage('postnet'):
+                mel_outputs_postnet = mel_outputs + model.postnet(mel_outputs)
+                mel_outputs_postnet = mel_outputs_postnet.transpose(1, 2)
+            with timer.stage('vocoder'):
+                if self.vocoder_model is not None:
+                    waveforms = self.vocoder_model.inference(mel_outputs_postnet.transpose(1, 2))
+                    waveforms = [wav.flatten() for wav in waveforms.cpu().numpy()]
+                else:
+                    mel_outputs_postnet = mel_outputs_postnet.cpu().numpy()
+                    waveforms = [self.ap.inv_melspectrogram(mel.T) for mel in mel_outputs_postnet]
+        with timer.stage('write_wav'):
+            for idx, wav in enumerate(waveforms):
+                self.ap.save_wav(wav, os.path.join(self.out_path, '{}.wav'.format(idx)))
+        timer.next_run()
+        # mel_outputs: B x frame_dim x T_out
+        return mel_outputs.size(2)
+
+    def sweep(self, sentence_lengths, batch_sizes, thread_counts, num_runs=5, num_warmup=1):
+        """Benchmark every combination of sentence length (words), batch size and thread count."""
+        # pylint: disable=import-outside-toplevel
+        import torch
+        results = []
+        for num_threads in thread_counts:
+            torch.set_num_threads(num_threads)
+            for batch_size in batch_sizes:
+                for num_words in sentence_lengths:
+                    sentences = make_sentences(num_words, batch_size)
+                    timer = StageTimer(self.use_cuda)
+                    for _ in range(num_warmup):
+                        self.run(sentences, timer)
+                    timer = StageTimer(self.use_cuda)
+                    for _ in range(num_runs):
+                        num_frames = self.run(sentences, timer)
+                    # audio seconds of the whole batch
+                    audio_seconds = batch_size * num_frames * self.ap.hop_length / self.ap.sample_rate
+                    totals = np.sum([timer.times[name] for name in STAGES], axis=0)
+                    result = {
+                        'sentence_length': num_words,
+                        'batch_size': batch_size,
+                        'num_threads': num_threads,
+                        'num_chars': max(len(sentence) for sentence in sentences),
+                        'decoder_steps': self.num_decoder_steps(sentences),
+                        'audio_seconds': audio_seconds,
+                        'stages': {name: summarize(timer.times[name]) for name in STAGES},
+                        'total': summarize(totals),
+                        'rtf': summarize(totals / audio_seconds),
+                        'stage_rtf': {name: float(np.median(timer.times[name])) / audio_seconds for name in STAGES},
+                        'peak_rss_mb': get_peak_rss(),
+                    }
+                    results.append(result)
+                    print_result(result)
+        return results
+
+
+def print_result(result):
+    print(" > words: {sentence_length} batch: {batch_size} threads: {num_threads} "
+          "decoder steps: {decoder_steps} audio: {audio_seconds:.2f}s".format(**result))
+    for name in STAGES:
+        stage = result['stages'][name]
+        print(" | > {:<18} p50 {:>8.4f}s  p90 {:>8.4f}s  p99 {:>8.4f}s  RTF {:>7.4f}".format(
+            name, stage['p50'], stage['p90'], stage['p99'], result['stage_rtf'][name]))
+    peak_rss = result['peak_rss_mb']
+    print(" | > {:<18} p50 {:>8.4f}s  RTF {:.4f}  peak RSS {}".format(
+        'total', result['total']['p50'], result['rtf']['p50'],
+        '{:.0f} MB'.format(peak_rss) if peak_rss is not None else '-'))
+
+
+def get_environment():
+    # pylint: disable=import-outside-toplevel
+    import torch
+    return {'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'cuda': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None}
+
+
+def _result_key(result):
+    return (result['sentence_length'], result['batch_size'], result['num_threads'])
+
+
+def compare_results(results, baseline, tolerance=0.1, min_difference=0.005, metric='p50'):
+    """Compare stage latencies against a stored baseline.
+
+    Args:
+        results (list): results of ``Benchmark.sweep``.
+        baseline (dict): a result file written by ``save_results``.
+        tolerance (float): relative slowdown that counts as a regression.
+        min_difference (float): slowdowns below this many seconds are ignored,
+            so the timer noise of very short stages is not reported.
+
+    Returns:
+        list: (sentence_length, batch_size, num_threads, stage, ratio) of the regressions.
+    """
+    baseline_results = {_result_key(result): result for result in baseline['results']}
+    regressions = []
+    print(" > Comparison with baseline ({}, current / baseline):".format(metric))
+    for result in results:
+        key = _result_key(result)
+        if key not in baseline_results:
+            continue
+        base = baseline_results[key]
+        ratios = []
+        for name in STAGES + ['total']:
+            current = result['total'] if name == 'total' else result['stages'][name]
+            previous = base['total'] if name == 'total' else base['stages'][name]
+            ratio = current[metric] / max(previous[metric], 1e-9)
+            ratios.append('{}: {:.2f}x'.format(name, ratio))
+            if ratio > 1 + tolerance and current[metric] - previous[metric] > min_difference:
+                regressions.append(key + (name, ratio))
+        print(" | > words: {} batch: {} threads: {} | {}".format(*key, ', '.join(ratios)))
+    for regression in regressions:
+        print(" [!] Regression - words: {} batch: {} threads: {} stage: {} {:.2f}x slower".format(*regression))
+    return regressions
+
+
+def save_results(results, out_path, args=None):
+    with open(out_path, 'w') as f:
+        json.dump({'environment': get_environment(), 'args': args, 'results': results}, f, indent=4)
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def compare_backends(benchmark, names, sentence_lengths, num_runs=3):
+    """Latency of the inference backends ``names`` on the model of ``benchmark``,
+    see ``TTS_lib.utils.backends.benchmark_backends``."""
+    # pylint: disable=import-outside-toplevel
+    from TTS_lib.utils.backends import load_backend, benchmark_backends
+    from TTS_lib.utils.synthesis import text_to_seqvec
+    from TTS_lib.utils.text.text_cleaning import clean_sentence
+    sentences = [clean_sentence(make_sentences(num_words, 1)[0]) for num_words in sentence_lengths]
+    inputs_list = [text_to_seqvec(sentence, benchmark.C, benchmark.frontend)[None].astype(np.int64)
+                   for sentence in sentences]
+    speaker_id = 0 if benchmark.num_speakers > 1 else None
+    style_input = {'0': 0.1} if benchmark.C.use_gst else None
+    with tempfile.TemporaryDirectory(prefix='tts_onnx_') as onnx_path:
+        if 'onnxruntime' in names:
+            from TTS_lib.utils.onnx_export import export_onnx
+            export_onnx(benchmark.model, onnx_path)
+        backends = [load_backend(name, benchmark.model, benchmark.C, use_cuda=benchmark.use_cuda,
+                                 onnx_path=onnx_path)
+                    for name in names]
+        return benchmark_backends(backends, inputs_list, speaker_id, style_input, num_runs=num_runs,
+                                  max_decoder_steps=[benchmark.num_decoder_steps([s]) for s in sentences])
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from TTS_lib.utils.io import load_config
+    parser = argparse.ArgumentParser(description='Benchmark the synthesis stages with a random weight model.')
+    parser.add_argument('config_path', type=str, help='path to the model config.json')
+    parser.add_argument('--num_speakers', type=int, default=0, help='number of speakers of the model')
+    parser.add_argument('--sentence_lengths', type=_int_list, default=[5, 15, 40], help='words per sentence, e.g. 5,15,40')
+    parser.add_argument('--batch_sizes', type=_int_list, default=[1], help='e.g. 1,4')
+    parser.add_argument('--threads', type=_int_list, default=[1, os.cpu_count()], help='torch threads, e.g. 1,4')
+    parser.add_argument('--num_runs', type=int, default=5, help='timed runs per configuration')
+    parser.add_argument('--frames_per_char', type=float, default=5.5, help='output frames per input character')
+    parser.add_argument('--use_cuda', action='store_true', help='run the model on the gpu')
+    parser.add_argument('--quantize', action='store_true', help='use the dynamically quantized model')
+    parser.add_argument('--no_decompose', action='store_true', help='concatenate static embeddings to every encoder frame')
+    parser.add_argument('--full_outputs', action='store_true', help='collect alignments and stop tokens')
+    parser.add_argument('--out', type=str, default=None, help='write the results to this json file')
+    parser.add_argument('--baseline', type=str, default=None, help='compare with a stored result file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative slowdown reported as regression')
+    parser.add_argument('--profile_decoder', type=str, default=None,
+                        help='profile the decoder steps and write <prefix>.folded, .trace.json and .summary.json')
+    parser.add_argument('--backends', type=str, default=None,
+                        help='compare inference backends instead, e.g. torch,torchscript,onnxruntime')
+    args = parser.parse_args()
+
+    C = load_config(args.config_path)
+    benchmark = Benchmark(C, num_speakers=args.num_speakers, use_cuda=args.use_cuda,
+                          frames_per_char=args.frames_per_char, quantize=args.quantize,
+                          decompose_static_inputs=not args.no_decompose, lean=not args.full_outputs)
+    if args.backends:
+        # the ONNX export and tracing run on the cpu
+        results = compare_backends(benchmark, args.backends.split(','), args.sentence_lengths,
+                                   num_runs=args.num_runs)
+        if args.out:
+            save_results(results, args.out, vars(args))
+            print(" > Results saved to {}".format(args.out))
+        return
+    if args.profile_decoder:
+        from TTS_lib.utils.decoder_profiler import DecoderStepProfiler, profile_decoder
+        profiler = DecoderStepProfiler(cuda_sync=args.use_cuda)
+        with profile_decoder(benchmark.model, profiler):
+            results = benchmark.sweep(args.sentence_lengths, args.batch_sizes, args.threads, num_runs=args.num_runs)
+        profiler.report()
+        profiler.save_folded(args.profile_decoder + '.folded')
+        profiler.save_trace(args.profile_decoder + '.trace.json')
+        profiler.save_summary(args.profile_decoder + '.summary.json')
+    else:
+        results = benchmark.sweep(args.sentence_lengths, args.batch_sizes, args.threads, num_runs=args.num_runs)
+    if args.out:
+        save_results(results, args.out, vars(args))
+        print(" > Results saved to {}".format(args.out))
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
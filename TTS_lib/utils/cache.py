@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+
+class EncoderCache():
+    """LRU cache for encoder outputs.
+
+    Encoder outputs only depend on the token sequence, so they are shared
+    between speakers, styles, vocoders and retries of the same line.
+    Entries are keyed by a model key (anything that identifies the loaded
+    weights, e.g. checkpoint path and mtime), the device and the token ids.
+
+    Args:
+        max_bytes (int): upper bound for the memory held by cached tensors.
+            The least recently used entries are dropped beyond it.
+    """
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(model_key, inputs):
+        return (model_key, str(inputs.device), tuple(inputs.flatten().tolist()))
+
+    @staticmethod
+    def _sizeof(tensor):
+        return tensor.element_size() * tensor.nelement()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.num_bytes -= self._sizeof(self._entries.pop(key))
+            self._entries[key] = value
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                _, old_value = self._entries.popitem(last=False)
+                self.num_bytes -= self._sizeof(old_value)
+
+    def get_or_compute(self, model, inputs, model_key=None):
+        """Return cached encoder outputs for ``inputs`` or run ``model.encode``.
+
+        Args:
+            model (Tacotron2): model providing ``encode()``.
+            inputs (Tensor): token ids of shape 1 x T.
+            model_key (hashable): identity of the loaded weights. Defaults to
+                ``id(model)`` which is only valid while the model is alive.
+        """
+        if model_key is None:
+            model_key = id(model)
+        key = self.make_key(model_key, inputs)
+        encoder_outputs = self.get(key)
+        if encoder_outputs is None:
+            encoder_outputs = model.encode(inputs)
+            self.put(key, encoder_outputs)
+        return encoder_outputs
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,266 @@
+"""Continuous batching of Tacotron2 decoder steps.
+
+The scheduler keeps one live batch of decoder states. Requests run their
+encoder pass in the submitting thread and join the batch at the next step
+boundary. Finished utterances leave it on their stop token, the batch is
+compacted and their mels go to the postnet and vocoder in a separate
+thread while decoding continues.
+
+    scheduler = ContinuousBatchingScheduler(model, max_batch_size=8,
+                                            vocoder=lambda mel: ap.inv_melspectrogram(mel.T))
+    with scheduler:
+        requests = [scheduler.submit(inputs, speaker_id=0) for inputs in batch]
+        wavs = [request.result() for request in requests]
+
+Every utterance is decoded as it would be alone: shorter inputs are zero
+padded and masked out of the attention.
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import torch
+
+from TTS_lib.layers.tacotron2 import DecoderState, GrowableBuffer
+from TTS_lib.utils.logger import get_logger
+from TTS_lib.utils.metrics import metrics
+
+logger = get_logger('continuous_batching')
+
+
+class DecoderRequest():
+    """An utterance decoded by the ``ContinuousBatchingScheduler``.
+
+    ``result()`` blocks until the vocoder output, or the postnet mel
+    (T_out x frame_dim) if the scheduler has no vocoder, is available.
+    """
+    def __init__(self, state, num_tokens, max_decoder_steps, expected_steps):
+        self.state = state
+        self.num_tokens = num_tokens
+        self.max_decoder_steps = max_decoder_steps
+        self.outputs = GrowableBuffer(min(expected_steps, max_decoder_steps))
+        self.num_steps = 0
+        self.future = Future()
+        self.submit_time = time.perf_counter()
+        self.start_time = None
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+
+class ContinuousBatchingScheduler():
+    """Serve concurrent requests with one Tacotron2 decoder batch.
+
+    Args:
+        model (TTS_lib.models.tacotron2.Tacotron2): model in eval mode.
+        max_batch_size (int): upper bound of utterances decoded together.
+        vocoder (callable): applied to the T_out x frame_dim postnet mel of
+            every finished utterance, its return value is the request result.
+        stop_threshold (float): stop token probability ending an utterance.
+        max_decoder_steps (int): step limit per utterance, defaults to the
+            decoder's ``max_decoder_steps``.
+        num_vocoder_threads (int): threads running postnet and vocoder.
+        encoder_cache (TTS_lib.utils.cache.EncoderCache): reuse encoder outputs.
+        model_key (hashable): identity of the model weights for the cache.
+    """
+    def __init__(self, model, max_batch_size=8, vocoder=None, stop_threshold=0.7,
+                 max_decoder_steps=None, num_vocoder_threads=1, encoder_cache=None,
+                 model_key=None):
+        attention = model.decoder.attention
+        if getattr(attention, 'windowing', False):
+            raise NotImplementedError(" [!] Attention windowing cannot be batched.")
+        self.model = model
+        self.decoder = model.decoder
+        self.max_batch_size = max_batch_size
+        self.vocoder = vocoder
+        self.stop_threshold = stop_threshold
+        self.max_decoder_steps = max_decoder_steps or self.decoder.max_decoder_steps
+        self.encoder_cache = encoder_cache
+        self.model_key = model_key
+        self.pending = deque()
+        self.active = []
+        self.state = None
+        self.num_vocoder_threads = num_vocoder_threads
+        self.executor = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def num_pending(self):
+        return len(self.pending)
+
+    @property
+    def num_active(self):
+        return len(self.active)
+
+    @torch.no_grad()
+    def submit(self, inputs, speaker_id=None, style_input=None, max_decoder_steps=None):
+        """Run the encoder for ``inputs`` (1 x T_in token ids) and queue the
+        utterance for the next step boundary."""
+        model = self.model
+        if self.encoder_cache is not None:
+            encoder_outputs = self.encoder_cache.get_or_compute(model, inputs, self.model_key)
+        else:
+            encoder_outputs = model.encode(inputs)
+        if speaker_id is not None and not isinstance(speaker_id, torch.Tensor):
+            speaker_id = torch.tensor([speaker_id], device=inputs.device)
+        static_inputs = model.compute_static_embeddings(encoder_outputs, speaker_id, style_input)
+        encoder_outputs, static_inputs = self.decoder.prepare_static_inputs(
+            encoder_outputs, static_inputs)
+        state = self.decoder.init_state(encoder_outputs, mask=None, static_inputs=static_inputs)
+        state.memory = self.decoder._update_memory(  # pylint: disable=protected-access
+            self.decoder.get_go_frame(encoder_outputs))
+        num_tokens = encoder_outputs.size(1)
+        request = DecoderRequest(state, num_tokens,
+                                 min(max_decoder_steps or self.max_decoder_steps,
+                                     self.max_decoder_steps),
+                                 num_tokens * 6 // self.decoder.r + 16)
+        with self._condition:
+            self.pending.append(request)
+            self._condition.notify()
+        return request
+
+    def _admit(self):
+        """Merge pending requests into the live batch."""
+        admitted = []
+        with self._condition:
+            while self.pending and len(self.active) + len(admitted) < self.max_batch_size:
+                admitted.append(self.pending.popleft())
+        if not admitted:
+            return
+        states = ([self.state] if self.state is not None else []) + [r.state for r in admitted]
+        self.state = DecoderState.cat(states) if len(states) > 1 else states[0]
+        start_time = time.perf_counter()
+        for request in admitted:
+            # the live batch owns the states from now on
+            request.state = None
+            request.start_time = start_time
+            metrics.observe('tts_queue_seconds', start_time - request.submit_time)
+        self.active += admitted
+
+    def _evict(self, finished):
+        keep = [idx for idx in range(len(self.active)) if idx not in finished]
+        done = [self.active[idx] for idx in finished]
+        if keep:
+            self.active = [self.active[idx] for idx in keep]
+            indices = torch.tensor(keep, device=self.state.query.device)
+            max_len = max(request.num_tokens for request in self.active)
+            self.state.index_select(indices, max_len)
+        else:
+            self.active = []
+            self.state = None
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.num_vocoder_threads,
+                                               thread_name_prefix='tts_vocoder')
+        for request in done:
+            self.executor.submit(self._finish, request)
+
+    @torch.no_grad()
+    def _finish(self, request):
+        try:
+            outputs = request.outputs.get()
+            # 1 x T_decoder x (r * frame_dim) -> 1 x frame_dim x T_out
+            mel_outputs = outputs.reshape(1, -1, self.decoder.frame_dim).transpose(1, 2)
+            with metrics.stage('postnet', frames=mel_outputs.size(2)):
+                mel_outputs = mel_outputs + self.model.postnet(mel_outputs)
+            result = mel_outputs[0].transpose(0, 1).cpu().numpy()
+            if self.vocoder is not None:
+                with metrics.stage('vocoder', frames=result.shape[0]):
+                    result = self.vocoder(result)
+            request.future.set_result(result)
+        except Exception as e:  # pylint: disable=broad-except
+            request.future.set_exception(e)
+
+    @torch.no_grad()
+    def step(self):
+        """Admit pending requests, run one decoder step for the live batch
+        and evict the finished utterances. Returns the batch size."""
+        self._admit()
+        if not self.active:
+            return 0
+        decoder = self.decoder
+        state = self.state
+        B = len(self.active)
+        metrics.observe('tts_batch_size', B)
+        memory = decoder.prenet(state.memory)
+        decoder_output, _, stop_token = decoder.decode(memory, state)
+        stop_token = torch.sigmoid(stop_token).view(-1).tolist()
+        state.memory = decoder._update_memory(decoder_output)  # pylint: disable=protected-access
+        finished = []
+        for idx, request in enumerate(self.active):
+            request.outputs.append(decoder_output[idx:idx + 1])
+            request.num_steps += 1
+            if stop_token[idx] > self.stop_threshold and request.num_steps > 1:
+                finished.append(idx)
+            elif request.num_steps == request.max_decoder_steps:
+                logger.warning("   | > Decoder stopped with 'max_decoder_steps")
+                finished.append(idx)
+        if finished:
+            for idx in finished:
+                metrics.observe('tts_decoder_steps', self.active[idx].num_steps)
+            self._evict(finished)
+        return B
+
+    def run_until_idle(self):
+        """Decode in the calling thread until no request is left."""
+        while self.step():
+            pass
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while self._running and not self.pending and not self.active:
+                    self._condition.wait()
+                if not self._running:
+                    break
+            try:
+                self.step()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(" [!] Decoder step failed: %s", e)
+                self._fail_all(e)
+
+    def _fail_all(self, error):
+        with self._condition:
+            requests = self.active + list(self.pending)
+            self.pending.clear()
+        self.active = []
+        self.state = None
+        for request in requests:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    def start(self):
+        """Decode in a background thread."""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name='tts_decoder', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """Finish the queued requests, stop the background thread and the
+        vocoder threads."""
+        if self._thread is not None:
+            if wait:
+                while self.pending or self.active:
+                    time.sleep(0.005)
+            with self._condition:
+                self._running = False
+                self._condition.notify_all()
+            self._thread.join()
+            self._thread = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
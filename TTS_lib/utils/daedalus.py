@@ -0,0 +1,176 @@
+"""Dialogue lines of Gothic Daedalus scripts.
+
+Parses the output units of ``.d`` files,
+
+    INSTANCE DIA_Diego_Hallo (C_INFO)
+    {
+        npc         = PC_Thief;
+        information = DIA_Diego_Hallo_Info;
+    };
+    FUNC VOID DIA_Diego_Hallo_Info()
+    {
+        AI_Output (other, self, "DIA_Diego_Hallo_15_00"); //Hallo.
+        AI_Output (self, other, "DIA_Diego_Hallo_11_01"); //Was willst du?
+    };
+
+and resolves the speaker of every unit: ``self`` is the npc of the dialog
+instance, ``other`` the hero and other names are global npc variables. Functions that are not the information of an
+instance (e.g. choices) belong to the instance with the longest matching
+name prefix. Speakers are mapped to speakers.json names by an explicit map
+(npc instance, npc name or voice number -> speaker) or by their names.
+"""
+import os
+import re
+from glob import glob
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('daedalus')
+
+_BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_INSTANCE_RE = re.compile(r'^\s*instance\s+(\w+)\s*\(\s*c_info\s*\)', re.IGNORECASE)
+_FIELD_RE = re.compile(r'^\s*(npc|information)\s*=\s*(\w+)\s*;', re.IGNORECASE)
+_FUNC_RE = re.compile(r'^\s*func\s+\w+\s+(\w+)\s*\(', re.IGNORECASE)
+_OUTPUT_RE = re.compile(r'^\s*AI_Output\s*\(\s*(\w+)\s*,\s*(\w+)\s*,\s*"(\w+)"\s*\)\s*;\s*//(.*)$',
+                        re.IGNORECASE)
+_VOICE_RE = re.compile(r'_(\d+)_\d+$')
+HERO = 'hero'
+
+
+class DialogueLine():
+    """An output unit: the wav ``name`` the game plays, its text and speaker.
+    ``npc`` is the npc instance or ``hero``, ``voice`` the voice number of the name
+    and ``function`` the dialog function of ``self`` outputs."""
+    def __init__(self, name, text, npc, voice, source, line_no, function=None):
+        self.name = name
+        self.text = text
+        self.npc = npc
+        self.function = function
+        self.voice = voice
+        self.source = source
+        self.line_no = line_no
+        self.speaker = None
+
+    def __repr__(self):
+        return 'DialogueLine({!r}, {!r}, npc={!r})'.format(self.name, self.text, self.npc)
+
+
+def _strip_block_comments(script):
+    # keep the line breaks for the line numbers
+    return _BLOCK_COMMENT_RE.sub(lambda match: '\n' * match.group(0).count('\n'), script)
+
+
+def parse_script(script, source=None, instances=None):
+    """Output units of the text of a ``.d`` file. ``instances`` collects the
+    npc of every dialog instance and information function, pass the same
+    dict for all files of a mod and call ``resolve_npcs`` afterwards."""
+    if instances is None:
+        instances = {}
+    lines = []
+    instance, function = None, None
+    for line_no, line in enumerate(_strip_block_comments(script).split('\n'), 1):
+        match = _INSTANCE_RE.match(line)
+        if match:
+            instance = instances.setdefault(match.group(1).lower(), {})
+            continue
+        match = _FIELD_RE.match(line)
+        if match and instance is not None:
+            instance[match.group(1).lower()] = match.group(2).lower()
+            continue
+        match = _FUNC_RE.match(line)
+        if match:
+            function, instance = match.group(1).lower(), None
+            continue
+        match = _OUTPUT_RE.match(line)
+        if match is None:
+            continue
+        speaker_var, _, name, text = match.groups()
+        text = text.strip()
+        if not text:
+            logger.warning(" [!] %s has no text (%s:%d)", name, source, line_no)
+            continue
+        voice = _VOICE_RE.search(name)
+        voice = voice.group(1) if voice else None
+        speaker_var = speaker_var.lower()
+        if speaker_var == 'self':
+            # resolved from the instance of the function by resolve_npcs
+            lines.append(DialogueLine(name, text, None, voice, source, line_no, function=function))
+        elif speaker_var in ('other', HERO):
+            lines.append(DialogueLine(name, text, HERO, voice, source, line_no))
+        else:
+            # a global npc variable, e.g. Xardas
+            lines.append(DialogueLine(name, text, speaker_var, voice, source, line_no))
+    return lines
+
+
+def resolve_npcs(lines, instances):
+    """Replace the function of ``self`` outputs by the npc of its dialog instance."""
+    function_npcs = {fields['information']: fields['npc'] for fields in instances.values()
+                     if 'information' in fields and 'npc' in fields}
+    instance_npcs = sorted(((name, fields['npc']) for name, fields in instances.items() if 'npc' in fields),
+                           key=lambda item: -len(item[0]))
+    for line in lines:
+        if line.function is None:
+            continue
+        npc = function_npcs.get(line.function)
+        if npc is None:
+            npc = next((npc for name, npc in instance_npcs if line.function.startswith(name)), None)
+        line.npc = npc
+
+
+def parse_scripts(paths, encoding='cp1252'):
+    """Output units of ``.d`` files and folders (searched recursively), in file order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob(os.path.join(path, '**', '*.[dD]'), recursive=True))
+        else:
+            files.append(path)
+    instances, lines = {}, []
+    for path in files:
+        with open(path, 'r', encoding=encoding, errors='replace') as f:
+            lines += parse_script(f.read(), source=path, instances=instances)
+    resolve_npcs(lines, instances)
+    logger.info(" > %d output units in %d scripts", len(lines), len(files))
+    return lines
+
+
+def npc_name(npc):
+    """Name part of an npc instance, e.g. Xardas of NONE_100_Xardas."""
+    return npc.split('_')[-1] if npc else None
+
+
+def resolve_speakers(lines, speakers, speaker_map=None):
+    """Set the speakers.json name of every line. ``speaker_map`` maps npc
+    instances, npc names, voice numbers or ``hero`` to speaker names. Lines
+    of single speaker models get the speaker ``Default``.
+    Returns the lines without speaker."""
+    names = {name.lower(): name for name in speakers}
+    speaker_map = {str(key).lower(): value for key, value in (speaker_map or {}).items()}
+    for value in speaker_map.values():
+        if speakers and value.lower() not in names:
+            raise ValueError(" [!] Speaker {} of the speaker map is not in speakers.json".format(value))
+    speaker_map = {key: names.get(value.lower(), value) for key, value in speaker_map.items()}
+    unresolved = []
+    for line in lines:
+        line.speaker = None
+        if not speakers:
+            line.speaker = 'Default'
+            continue
+        for key in (line.npc, npc_name(line.npc), line.voice):
+            if key is None:
+                continue
+            key = str(key).lower()
+            if key in speaker_map:
+                line.speaker = speaker_map[key]
+                break
+            if key in names:
+                line.speaker = names[key]
+                break
+        if line.speaker is None:
+            unresolved.append(line)
+    if unresolved:
+        npcs = sorted({str(line.npc) for line in unresolved})
+        logger.warning(" [!] %d output units without speaker, add their npcs to the speaker map: %s",
+                       len(unresolved), ', '.join(npcs[:20]))
+    return unresolved
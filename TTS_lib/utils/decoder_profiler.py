@@ -0,0 +1,192 @@
+"""Opt-in profiler for the sub-operations of a decoder step.
+
+    profiler = DecoderStepProfiler()
+    with profile_decoder(model, profiler):
+        model.inference(...)
+    profiler.report()
+    profiler.save_folded('decoder.folded')  # flamegraph.pl / speedscope
+    profiler.save_trace('decoder.trace.json')  # chrome://tracing / perfetto
+
+Timings are aggregated per encoder length bucket. Without a profiler the
+decoder only pays for entering a shared ``nullcontext`` per section.
+"""
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+NULL_SECTION = nullcontext()
+
+
+def section(profiler, name):
+    """Timed section of ``profiler`` or a no-op context if profiling is off."""
+    if profiler is None:
+        return NULL_SECTION
+    return profiler.section(name)
+
+
+def describe_attention(attention):
+    """Short label of the attention configuration, e.g. ``original+location+windowing``."""
+    if type(attention).__name__ == 'GravesAttention':
+        return 'graves'
+    label = ['original']
+    for flag, name in [('location_attention', 'location'), ('windowing', 'windowing'),
+                       ('forward_attn', 'forward'), ('trans_agent', 'trans_agent')]:
+        if getattr(attention, flag, False):
+            label.append(name)
+    return '+'.join(label)
+
+
+class _Section():
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._push(self.name)  # pylint: disable=protected-access
+
+    def __exit__(self, *exc):
+        self.profiler._pop()  # pylint: disable=protected-access
+
+
+class DecoderStepProfiler():
+    """Records the time of nested decoder sections for every step.
+
+    Args:
+        bucket_size (int): width of the encoder length buckets in tokens.
+        cuda_sync (bool): synchronize cuda around every section, required for
+            meaningful gpu timings but slows the decoder down.
+        max_events (int): number of raw section events kept for the trace
+            export, 0 disables the trace.
+    """
+    def __init__(self, bucket_size=25, cuda_sync=False, max_events=200000):
+        self.bucket_size = bucket_size
+        self.cuda_sync = cuda_sync
+        self.max_events = max_events
+        self.label = None
+        self.bucket = None
+        # bucket -> stack path -> [total seconds, self seconds, calls]
+        self.stats = {}
+        # bucket -> [utterances, steps]
+        self.counts = {}
+        self.events = []
+        self._sections = {}
+        self._stack = []
+        self._start_time = time.perf_counter()
+
+    def section(self, name):
+        if name not in self._sections:
+            self._sections[name] = _Section(self, name)
+        return self._sections[name]
+
+    def _sync(self):
+        if self.cuda_sync:
+            import torch  # pylint: disable=import-outside-toplevel
+            torch.cuda.synchronize()
+
+    def begin_utterance(self, num_tokens, label=None):
+        """Select the bucket for the following steps."""
+        low = (num_tokens // self.bucket_size) * self.bucket_size
+        self.bucket = '{}-{}'.format(low, low + self.bucket_size - 1)
+        self.label = label or self.label
+        self.counts.setdefault(self.bucket, [0, 0])[0] += 1
+
+    def step(self):
+        """Section around a complete decoder step."""
+        if self.bucket is None:
+            self.begin_utterance(0)
+        self.counts[self.bucket][1] += 1
+        return self.section('step')
+
+    def _push(self, name):
+        self._sync()
+        # name, start time, time spent in child sections
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _pop(self):
+        self._sync()
+        end_time = time.perf_counter()
+        name, start_time, child_time = self._stack.pop()
+        elapsed = end_time - start_time
+        path = ';'.join([frame[0] for frame in self._stack] + [name])
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        stats = self.stats.setdefault(self.bucket, {})
+        if path not in stats:
+            stats[path] = [0.0, 0.0, 0]
+        entry = stats[path]
+        entry[0] += elapsed
+        entry[1] += elapsed - child_time
+        entry[2] += 1
+        if len(self.events) < self.max_events:
+            self.events.append((path, start_time, elapsed, self.bucket))
+
+    def reset(self):
+        self.stats = {}
+        self.counts = {}
+        self.events = []
+        self.bucket = None
+
+    def summary(self):
+        """Per bucket: utterances, steps and total / per step time and share of every section."""
+        summary = {}
+        for bucket, stats in sorted(self.stats.items(), key=lambda x: int(x[0].split('-')[0])):
+            num_utterances, num_steps = self.counts.get(bucket, [0, 0])
+            step_time = stats.get('step', [0.0])[0]
+            sections = {}
+            for path, (total, self_time, calls) in sorted(stats.items()):
+                sections[path] = {'total': total, 'self': self_time, 'calls': calls,
+                                  'per_step_us': total / max(num_steps, 1) * 1e6,
+                                  'share': total / step_time if step_time else 0.0}
+            summary[bucket] = {'utterances': num_utterances, 'steps': num_steps, 'sections': sections}
+        return summary
+
+    def report(self):
+        print(" > Decoder step profile{}".format(' ({})'.format(self.label) if self.label else ''))
+        for bucket, result in self.summary().items():
+            print(" | > encoder length {}: {} utterances, {} steps".format(
+                bucket, result['utterances'], result['steps']))
+            for path, stats in result['sections'].items():
+                depth = path.count(';')
+                name = '  ' * depth + path.split(';')[-1]
+                print(" | > {:<32} {:>10.1f} us/step {:>6.1f}%".format(
+                    name, stats['per_step_us'], 100 * stats['share']))
+
+    def to_folded(self):
+        """Collapsed stacks with self time in microseconds, one bucket per root frame."""
+        lines = []
+        for bucket, stats in sorted(self.stats.items()):
+            for path, (_, self_time, _) in sorted(stats.items()):
+                lines.append('T_in={};{} {}'.format(bucket, path, int(round(self_time * 1e6))))
+        return '\n'.join(lines) + '\n'
+
+    def save_folded(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_folded())
+
+    def save_trace(self, path):
+        """Chrome trace event file of the recorded sections."""
+        events = [{'name': event_path.split(';')[-1], 'cat': bucket, 'ph': 'X', 'pid': 0, 'tid': 0,
+                   'ts': (start_time - self._start_time) * 1e6, 'dur': elapsed * 1e6}
+                  for event_path, start_time, elapsed, bucket in self.events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'label': self.label}}, f)
+
+    def save_summary(self, path):
+        with open(path, 'w') as f:
+            json.dump({'label': self.label, 'bucket_size': self.bucket_size,
+                       'buckets': self.summary()}, f, indent=4)
+
+
+@contextmanager
+def profile_decoder(model, profiler=None):
+    """Attach a step profiler to the decoder of ``model`` for the duration of the block."""
+    profiler = profiler or DecoderStepProfiler()
+    decoder = model.decoder
+    decoder.set_step_profiler(profiler)
+    try:
+        yield profiler
+    finally:
+        decoder.set_step_profiler(None)
@@ -0,0 +1,179 @@
+"""Output length prediction before decoding.
+
+``DurationEstimator`` predicts the number of mel frames of an utterance
+from its input and is refitted online from the frames of finished renders.
+The prediction drives length bucketing, ETAs and per utterance decoder
+step limits.
+
+The model is a ridge regression of the frames on
+
+    1, tokens, words, pauses (,;:-), sentence ends (.!?),
+    GST token weight * tokens for every style token
+
+pulled towards a prior of ``frames_per_token`` frames per token, times a
+per speaker rate correction. It is saved as json, one file per model.
+"""
+import os
+import re
+import json
+import math
+import threading
+
+import numpy as np
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('duration')
+
+_PAUSE_RE = re.compile(r'[,;:\-]')
+_SENTENCE_END_RE = re.compile(r'[.!?]+')
+FEATURE_NAMES = ['bias', 'tokens', 'words', 'pauses', 'sentence_ends']
+
+
+class DurationEstimator():
+    """Predicts decoder frames and audio seconds of an utterance.
+
+    Args:
+        num_style_tokens (int): GST tokens with their own speed feature.
+        frames_per_token (float): prior frames per input token.
+        prior_weight (float): strength of the prior, in utterances.
+        hop_length (int), sample_rate (int): convert frames to seconds.
+        path (str): json file used by ``save()``.
+    """
+    def __init__(self, num_style_tokens=10, frames_per_token=5.5, prior_weight=5.0,
+                 hop_length=256, sample_rate=22050, path=None):
+        self.num_style_tokens = num_style_tokens
+        self.frames_per_token = frames_per_token
+        self.prior_weight = prior_weight
+        self.hop_length = hop_length
+        self.sample_rate = sample_rate
+        self.path = path
+        num_features = len(FEATURE_NAMES) + num_style_tokens
+        self.prior = np.zeros(num_features)
+        self.prior[FEATURE_NAMES.index('tokens')] = frames_per_token
+        # normal equations of the observed utterances
+        self.xtx = np.zeros((num_features, num_features))
+        self.xty = np.zeros(num_features)
+        self.num_updates = 0
+        # speaker -> [sum of actual frames, sum of predicted frames]
+        self.speaker_rates = {}
+        self._weights = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_model(cls, C, ap=None, path=None):
+        """Estimator matching the config (and audio processor) of a model,
+        loaded from ``path`` if it exists."""
+        kwargs = dict(num_style_tokens=10 if C.get('use_gst', False) else 0,
+                      hop_length=ap.hop_length if ap is not None else 256,
+                      sample_rate=ap.sample_rate if ap is not None else C.audio['sample_rate'])
+        if path is not None and os.path.exists(path):
+            try:
+                return cls.load(path, **kwargs)
+            except (ValueError, KeyError) as e:
+                logger.warning(" [!] Ignoring the duration model %s: %s", path, e)
+        return cls(path=path, **kwargs)
+
+    def features(self, text, num_tokens=None, style_input=None):
+        """Feature vector of ``text``. ``num_tokens`` defaults to the number
+        of characters, pass the length of the encoded input if available."""
+        if num_tokens is None:
+            num_tokens = len(text)
+        x = np.zeros(len(self.prior))
+        x[0] = 1.0
+        x[1] = num_tokens
+        x[2] = len(text.split())
+        x[3] = len(_PAUSE_RE.findall(text))
+        x[4] = len(_SENTENCE_END_RE.findall(text))
+        if isinstance(style_input, dict):
+            for token, weight in style_input.items():
+                token = int(token)
+                if token < self.num_style_tokens:
+                    x[len(FEATURE_NAMES) + token] = weight * num_tokens
+        return x
+
+    def _get_weights(self):
+        if self._weights is None:
+            # argmin |X w - y|^2 + prior_weight * mean(tokens^2) * |w - prior|^2
+            scale = self.prior_weight * max(1.0, self.xtx[1, 1] / max(self.num_updates, 1))
+            a = self.xtx + scale * np.eye(len(self.prior))
+            b = self.xty + scale * self.prior
+            self._weights = np.linalg.solve(a, b)
+        return self._weights
+
+    def speaker_rate(self, speaker):
+        actual, predicted = self.speaker_rates.get(str(speaker), (0.0, 0.0))
+        # shrink towards 1 while there are few frames
+        return (actual + 500.0) / (predicted + 500.0)
+
+    def predict_frames(self, text, num_tokens=None, style_input=None, speaker=None):
+        with self._lock:
+            x = self.features(text, num_tokens, style_input)
+            frames = float(np.dot(self._get_weights(), x))
+            if speaker is not None:
+                frames *= self.speaker_rate(speaker)
+        return max(1.0, frames)
+
+    def predict_seconds(self, text, num_tokens=None, style_input=None, speaker=None):
+        return self.frames_to_seconds(self.predict_frames(text, num_tokens, style_input, speaker))
+
+    def frames_to_seconds(self, frames):
+        return frames * self.hop_length / self.sample_rate
+
+    def step_limit(self, text, r, num_tokens=None, style_input=None, speaker=None,
+                   margin=3.0, min_steps=20, max_steps=None):
+        """Decoder step limit for an utterance, ``margin`` times the prediction."""
+        frames = self.predict_frames(text, num_tokens, style_input, speaker)
+        steps = int(math.ceil(frames * margin / r)) + min_steps
+        return min(steps, max_steps) if max_steps else steps
+
+    def update(self, text, frames, num_tokens=None, style_input=None, speaker=None):
+        """Add the actual output ``frames`` of a finished utterance."""
+        with self._lock:
+            x = self.features(text, num_tokens, style_input)
+            if speaker is not None:
+                rates = self.speaker_rates.setdefault(str(speaker), [0.0, 0.0])
+                rates[0] += frames
+                rates[1] += max(1.0, float(np.dot(self._get_weights(), x)))
+                # fit the shared weights on speaker normalized frames
+                frames = frames / self.speaker_rate(speaker)
+            self.xtx += np.outer(x, x)
+            self.xty += x * frames
+            self.num_updates += 1
+            self._weights = None
+
+    def to_dict(self):
+        with self._lock:
+            return {'num_style_tokens': self.num_style_tokens,
+                    'frames_per_token': self.frames_per_token,
+                    'prior_weight': self.prior_weight,
+                    'xtx': self.xtx.tolist(),
+                    'xty': self.xty.tolist(),
+                    'num_updates': self.num_updates,
+                    'speaker_rates': self.speaker_rates}
+
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path, 'r') as f:
+            state = json.load(f)
+        kwargs.update(num_style_tokens=state['num_style_tokens'],
+                      frames_per_token=state['frames_per_token'],
+                      prior_weight=state['prior_weight'])
+        estimator = cls(path=path, **kwargs)
+        xtx = np.array(state['xtx'])
+        if xtx.shape != estimator.xtx.shape:
+            raise ValueError('feature size mismatch')
+        estimator.xtx = xtx
+        estimator.xty = np.array(state['xty'])
+        estimator.num_updates = state['num_updates']
+        estimator.speaker_rates = {k: list(v) for k, v in state['speaker_rates'].items()}
+        return estimator
@@ -0,0 +1,216 @@
+"""Export stage after synthesis: resample, loudness normalize and encode.
+
+    exporter = Exporter('build', formats=('wav', 'ogg'), sample_rate=44100, target_lufs=-23.0)
+    future = exporter.write('DIA_Diego_Hallo_11_01', wav, 22050)
+    ...
+    exporter.close()
+
+Outputs are processed in a process pool while synthesis continues. The
+loudness is the integrated loudness of ITU-R BS.1770 (K-weighting, 400 ms
+blocks, absolute and relative gate), normalized outputs are scaled down
+if their peak would exceed ``peak_db``. Resampling uses a polyphase filter.
+Without a loudness target outputs are peak normalized like
+``AudioProcessor.save_wav``. ``Exporter`` has the interface of
+``TTS_lib.utils.archive.WavFolder``, except that ``write`` returns a future.
+"""
+import os
+import math
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.signal
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('export')
+
+# soundfile format and subtype of the export formats
+FORMATS = {'wav': ('WAV', 'PCM_16'), 'flac': ('FLAC', 'PCM_16'), 'ogg': ('OGG', 'VORBIS')}
+
+
+def k_weighting_filters(sample_rate):
+    """Coefficients of the pre filter and the RLB high pass of BS.1770 for
+    any sample rate, they match the tables of the standard at 48 kHz."""
+    # high shelf
+    fc, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    K = math.tan(math.pi * fc / sample_rate)
+    Vh = 10 ** (gain_db / 20.0)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1.0 + K / q + K * K
+    shelf = (np.array([Vh + Vb * K / q + K * K, 2.0 * (K * K - Vh), Vh - Vb * K / q + K * K]) / a0,
+             np.array([1.0, 2.0 * (K * K - 1.0) / a0, (1.0 - K / q + K * K) / a0]))
+    # high pass
+    fc, q = 38.13547087602444, 0.5003270373238773
+    K = math.tan(math.pi * fc / sample_rate)
+    a0 = 1.0 + K / q + K * K
+    high_pass = (np.array([1.0, -2.0, 1.0]),
+                 np.array([1.0, 2.0 * (K * K - 1.0) / a0, (1.0 - K / q + K * K) / a0]))
+    return shelf, high_pass
+
+
+def k_weighting(wav, sample_rate):
+    for b, a in k_weighting_filters(sample_rate):
+        wav = scipy.signal.lfilter(b, a, wav)
+    return wav
+
+
+def loudness(wav, sample_rate, block_seconds=0.4, overlap=0.75):
+    """Integrated loudness of a mono waveform in LUFS, -inf for silence."""
+    weighted = k_weighting(np.asarray(wav, dtype=np.float64), sample_rate)
+    block = int(round(block_seconds * sample_rate))
+    step = max(1, int(round(block * (1 - overlap))))
+    # mean square of all blocks from the cumulative sum of the squares
+    energy = np.concatenate([[0.0], np.cumsum(weighted ** 2)])
+    if len(weighted) <= block:
+        z = np.array([energy[-1] / max(1, len(weighted))])
+    else:
+        starts = np.arange(0, len(weighted) - block + 1, step)
+        z = (energy[starts + block] - energy[starts]) / block
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(z)
+    gated = z[block_loudness > -70.0]
+    if not gated.size:
+        return -float('inf')
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+    gated = z[(block_loudness > -70.0) & (block_loudness > relative_gate)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def normalize_loudness(wav, sample_rate, target_lufs=-23.0, peak_db=-1.0):
+    """Scale ``wav`` to ``target_lufs``, or less if the peak would exceed ``peak_db``."""
+    current = loudness(wav, sample_rate)
+    if not np.isfinite(current):
+        return wav
+    gain = 10 ** ((target_lufs - current) / 20.0)
+    peak = np.max(np.abs(wav)) * gain
+    limit = 10 ** (peak_db / 20.0)
+    if peak > limit:
+        gain *= limit / peak
+    return wav * gain
+
+
+def peak_normalize(wav):
+    """Full scale like ``AudioProcessor.save_wav``."""
+    return wav / max(0.01, np.max(np.abs(wav))) if wav.size else wav
+
+
+def resample(wav, orig_sr, target_sr):
+    if orig_sr == target_sr:
+        return wav
+    divisor = math.gcd(orig_sr, target_sr)
+    return scipy.signal.resample_poly(wav, target_sr // divisor, orig_sr // divisor)
+
+
+def export_file(base_path, wav, sample_rate, formats=('wav',), target_sr=None, target_lufs=None,
+                peak_db=-1.0):
+    """Write ``base_path.<format>`` for all ``formats``. Returns the exported seconds."""
+    import soundfile  # pylint: disable=import-outside-toplevel
+    wav = np.asarray(wav)
+    if np.issubdtype(wav.dtype, np.integer):
+        wav = wav / 32768.0
+    wav = wav.astype(np.float64)
+    target_sr = target_sr or sample_rate
+    wav = resample(wav, sample_rate, target_sr)
+    if target_lufs is not None:
+        wav = normalize_loudness(wav, target_sr, target_lufs, peak_db)
+    else:
+        wav = peak_normalize(wav)
+    wav = np.clip(wav, -1.0, 32767 / 32768)
+    os.makedirs(os.path.dirname(base_path) or '.', exist_ok=True)
+    for fmt in formats:
+        file_format, subtype = FORMATS[fmt]
+        file_path = '{}.{}'.format(base_path, fmt)
+        # never leave a half written file under the final name
+        tmp_path = '{}.tmp.{}'.format(base_path, fmt)
+        soundfile.write(tmp_path, wav, target_sr, format=file_format, subtype=subtype)
+        os.replace(tmp_path, file_path)
+    return len(wav) / target_sr
+
+
+class Exporter():
+    """Exports waveforms to ``path/<name>.<format>`` in worker processes.
+
+    Args:
+        path (str): output folder.
+        formats (list): wav, flac and/or ogg.
+        sample_rate (int): output sample rate, default is the input rate.
+        target_lufs (float): integrated loudness of every output, None to
+            peak normalize.
+        peak_db (float): peak limit of loudness normalized outputs in dBFS.
+        num_workers (int): worker processes, default is the number of cpus.
+    """
+    def __init__(self, path, formats=('wav',), sample_rate=None, target_lufs=None, peak_db=-1.0,
+                 num_workers=None):
+        for fmt in formats:
+            if fmt not in FORMATS:
+                raise ValueError(" [!] Unknown export format {}, use {}".format(fmt, list(FORMATS)))
+        self.path = path
+        self.formats = tuple(formats)
+        self.sample_rate = sample_rate
+        self.target_lufs = target_lufs
+        self.peak_db = peak_db
+        self.num_workers = num_workers
+        self.executor = None
+        self.pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return self.exists(name)
+
+    def _base_path(self, name):
+        if name.lower().endswith('.wav'):
+            name = name[:-len('.wav')]
+        return os.path.join(self.path, name)
+
+    def write(self, name, wav, sample_rate):
+        """Queue the export of ``name``, returns a future of the exported seconds."""
+        if self.executor is None:
+            # spawn, the workers should not inherit the torch threads of a fork
+            self.executor = ProcessPoolExecutor(self.num_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        future = self.executor.submit(export_file, self._base_path(name), np.asarray(wav), sample_rate,
+                                      self.formats, self.sample_rate, self.target_lufs, self.peak_db)
+        self.pending[name] = future
+        future.add_done_callback(lambda f: self._done(name, f))
+        return future
+
+    def _done(self, name, future):
+        if self.pending.get(name) is future:
+            del self.pending[name]
+
+    def _wait(self, name):
+        future = self.pending.get(name)
+        if future is not None:
+            future.exception()
+
+    def exists(self, name):
+        self._wait(name)
+        base_path = self._base_path(name)
+        return all(os.path.exists('{}.{}'.format(base_path, fmt)) for fmt in self.formats)
+
+    def copy(self, source, name):
+        self._wait(source)
+        source_path, base_path = self._base_path(source), self._base_path(name)
+        os.makedirs(os.path.dirname(base_path) or '.', exist_ok=True)
+        for fmt in self.formats:
+            shutil.copyfile('{}.{}'.format(source_path, fmt), '{}.{}'.format(base_path, fmt))
+
+    def remove(self, name):
+        self._wait(name)
+        base_path = self._base_path(name)
+        for fmt in self.formats:
+            if os.path.exists('{}.{}'.format(base_path, fmt)):
+                os.remove('{}.{}'.format(base_path, fmt))
+
+    def close(self):
+        """Wait for the queued exports."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
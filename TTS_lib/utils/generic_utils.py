@@ -8,6 +8,10 @@ import importlib
 import numpy as np
 from collections import Counter
 
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger()
+
 
 def get_git_branch():
     try:
@@ -138,7 +142,7 @@ def set_init_dict(model_dict, checkpoint, c):
 
 
 def setup_model(num_chars, num_speakers, c):
-    print(" > Using model: {}".format(c.model))
+    logger.info(" > Using model: %s", c.model)
     MyModel = importlib.import_module('TTS_lib.models.' + c.model.lower())
     MyModel = getattr(MyModel, c.model)
     if c.model.lower() in "tacotron":
@@ -37,12 +37,18 @@ def copy_config_file(config_file, out_path, new_fields):
 
 
 def load_checkpoint(model, checkpoint_path, use_cuda=False):
-    state = torch.load(checkpoint_path, map_location=torch.device('cpu'))
-    model.load_state_dict(state['model'])
+    # pylint: disable=import-outside-toplevel
+    from TTS_lib.utils.slim_checkpoint import is_slim_checkpoint, load_slim_checkpoint, load_state_dict
+    if is_slim_checkpoint(checkpoint_path):
+        state = load_slim_checkpoint(checkpoint_path)
+        load_state_dict(model, state['model'])
+    else:
+        state = torch.load(checkpoint_path, map_location=torch.device('cpu'))
+        model.load_state_dict(state['model'])
     if use_cuda:
         model.cuda()
     # set model stepsize
-    if 'r' in state.keys():
+    if state.get('r') is not None:
         model.decoder.set_r(state['r'])
     return model, state
 
@@ -0,0 +1,251 @@
+"""Priority scheduling of synthesis jobs.
+
+A job is a list of items (e.g. the lines of a sentence file) processed by
+one function. Workers pick the next item across all jobs, so a job only
+holds a worker for one item at a time and higher priority jobs overtake
+running bulk jobs at the next item boundary.
+
+    scheduler = JobScheduler(num_workers=2)
+    job = scheduler.submit(render_line, lines, priority='batch', project='Xardas')
+    scheduler.status(job)  # {'position': ..., 'eta': ..., 'progress': ...}
+    wavs = job.result()
+
+Priority classes are served in the order of ``PRIORITIES``. Every class has
+a limit of concurrently running items and ``reserve_interactive`` workers
+only run interactive items, so single GUI lines never wait for a full
+batch. Within a class the projects with the fewest running items take
+turns.
+"""
+import time
+import itertools
+import threading
+from concurrent.futures import Future
+
+from TTS_lib.utils.logger import get_logger
+from TTS_lib.utils.metrics import metrics
+
+logger = get_logger('job_scheduler')
+
+PRIORITIES = ('interactive', 'batch', 'background')
+
+
+def default_cost(item):
+    """Relative cost of an item, the number of characters for text."""
+    return max(1, len(item)) if isinstance(item, str) else 1
+
+
+class Job():
+    """Items processed by ``fn`` at one priority, see ``JobScheduler.submit``."""
+    _ids = itertools.count()
+
+    def __init__(self, fn, items, priority='batch', project=None, costs=None, name=None):
+        if priority not in PRIORITIES:
+            raise ValueError(" [!] Unknown priority {}, use one of {}".format(priority, PRIORITIES))
+        self.id = next(self._ids)
+        self.fn = fn
+        self.items = list(items)
+        self.priority = priority
+        self.project = project
+        self.name = name
+        self.costs = list(costs) if costs is not None else [default_cost(item) for item in self.items]
+        self.results = [None] * len(self.items)
+        self.future = Future()
+        self.next_index = 0
+        self.num_running = 0
+        self.num_done = 0
+        self.submit_time = time.perf_counter()
+        self.start_time = None
+        self.end_time = None
+        self.cancelled = False
+
+    @property
+    def queued(self):
+        return not self.cancelled and self.next_index < len(self.items)
+
+    @property
+    def progress(self):
+        return self.num_done / len(self.items) if self.items else 1.0
+
+    @property
+    def remaining_cost(self):
+        return sum(self.costs[self.next_index:])
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+
+class JobScheduler():
+    """Runs the items of the submitted jobs on a pool of worker threads.
+
+    Args:
+        num_workers (int): worker threads.
+        limits (dict): maximum running items per priority class, defaults to
+            all workers that are not reserved for interactive jobs.
+        reserve_interactive (int): workers kept free for interactive jobs,
+            defaults to one if there are several workers.
+        seconds_per_cost (float): initial estimate of the processing time
+            per cost unit for the ETA, updated with every finished item.
+    """
+    def __init__(self, num_workers=2, limits=None, reserve_interactive=None, seconds_per_cost=0.05):
+        if reserve_interactive is None:
+            reserve_interactive = 1 if num_workers > 1 else 0
+        self.num_workers = num_workers
+        self.reserve_interactive = min(reserve_interactive, num_workers - 1)
+        bulk_workers = num_workers - self.reserve_interactive
+        self.limits = {'interactive': num_workers, 'batch': bulk_workers, 'background': bulk_workers}
+        self.limits.update(limits or {})
+        self.seconds_per_cost = seconds_per_cost
+        self.jobs = []
+        self.running = {priority: 0 for priority in PRIORITIES}
+        self.project_running = {}
+        self.project_last_served = {}
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._workers = [threading.Thread(target=self._work, name='tts_job_worker_{}'.format(idx),
+                                          daemon=True)
+                         for idx in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn, items, priority='batch', project=None, costs=None, name=None):
+        """Queue ``fn(item)`` for every item. ``job.result()`` returns the list of results."""
+        job = Job(fn, items, priority=priority, project=project, costs=costs, name=name)
+        if not job.items:
+            job.future.set_result([])
+            return job
+        with self._condition:
+            self.jobs.append(job)
+            self._condition.notify_all()
+        return job
+
+    def _bulk_running(self):
+        return sum(count for priority, count in self.running.items() if priority != 'interactive')
+
+    def _can_run(self, priority):
+        if self.running[priority] >= self.limits[priority]:
+            return False
+        if priority != 'interactive':
+            return self._bulk_running() < self.num_workers - self.reserve_interactive
+        return True
+
+    def _next_item(self):
+        """Select the next (job, index) or None. Called with the lock held."""
+        for priority in PRIORITIES:
+            if not self._can_run(priority):
+                continue
+            jobs = [job for job in self.jobs if job.priority == priority and job.queued]
+            if not jobs:
+                continue
+            # fair share between projects, then first come first served
+            project = min({job.project for job in jobs},
+                          key=lambda p: (self.project_running.get(p, 0),
+                                         self.project_last_served.get(p, 0.0)))
+            job = next(job for job in jobs if job.project == project)
+            index = job.next_index
+            job.next_index += 1
+            job.num_running += 1
+            if job.start_time is None:
+                job.start_time = time.perf_counter()
+                metrics.observe('tts_job_wait_seconds', job.start_time - job.submit_time,
+                                priority=priority)
+            self.running[priority] += 1
+            self.project_running[project] = self.project_running.get(project, 0) + 1
+            self.project_last_served[project] = time.perf_counter()
+            return job, index
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                selected = self._next_item()
+                while selected is None:
+                    if self._shutdown:
+                        return
+                    self._condition.wait()
+                    selected = self._next_item()
+            job, index = selected
+            start_time = time.perf_counter()
+            error = None
+            try:
+                job.results[index] = job.fn(job.items[index])
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(" [!] Job %s failed at item %d: %s", job.name or job.id, index, e)
+                error = e
+            seconds = time.perf_counter() - start_time
+            with self._condition:
+                self.seconds_per_cost = 0.9 * self.seconds_per_cost + 0.1 * seconds / job.costs[index]
+                self.running[job.priority] -= 1
+                self.project_running[job.project] -= 1
+                job.num_running -= 1
+                job.num_done += 1
+                if error is not None and not job.future.done():
+                    job.cancelled = True
+                    job.future.set_exception(error)
+                if job.num_running == 0 and not job.queued:
+                    self._complete(job)
+                self._condition.notify_all()
+
+    def _complete(self, job):
+        job.end_time = time.perf_counter()
+        if job in self.jobs:
+            self.jobs.remove(job)
+        if job.future.done():
+            return
+        if job.cancelled:
+            job.future.cancel()
+        else:
+            job.future.set_result(job.results)
+
+    def cancel(self, job):
+        """Skip the items of ``job`` that did not start yet."""
+        with self._condition:
+            job.cancelled = True
+            if job.num_running == 0:
+                self._complete(job)
+
+    def queue_position(self, job):
+        """Queued items of higher priority or submitted earlier at the same
+        priority. Fair sharing between projects can only move ``job`` ahead."""
+        with self._condition:
+            if not job.queued:
+                return 0
+            rank = PRIORITIES.index(job.priority)
+            return sum(len(other.items) - other.next_index for other in self.jobs
+                       if other.queued and other is not job
+                       and (PRIORITIES.index(other.priority), other.id) < (rank, job.id))
+
+    def eta(self, job):
+        """Estimated seconds until ``job`` is done."""
+        with self._condition:
+            if job.done():
+                return 0.0
+            rank = PRIORITIES.index(job.priority)
+            cost_ahead = sum(other.remaining_cost for other in self.jobs
+                             if other.queued and other is not job
+                             and (PRIORITIES.index(other.priority), other.id) < (rank, job.id))
+            num_workers = self.limits[job.priority]
+            if job.priority != 'interactive':
+                num_workers = min(num_workers, self.num_workers - self.reserve_interactive)
+            return (cost_ahead + job.remaining_cost) * self.seconds_per_cost / max(1, num_workers)
+
+    def status(self, job):
+        return {'id': job.id, 'name': job.name, 'priority': job.priority, 'project': job.project,
+                'position': self.queue_position(job), 'eta': self.eta(job),
+                'progress': job.progress, 'done': job.done()}
+
+    def shutdown(self, wait=True):
+        """Stop the workers after the queued items, or skip them if not ``wait``."""
+        with self._condition:
+            if not wait:
+                for job in list(self.jobs):
+                    job.cancelled = True
+                    if job.num_running == 0:
+                        self._complete(job)
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
@@ -0,0 +1,103 @@
+"""Append only progress journal of a sentence file render.
+
+Every processed line is recorded as one json line, e.g.
+
+    {"status": "done", "line": 12, "hash": "9f86d081884c7d65", "path": "000012_Hallo.wav", ...}
+    {"status": "failed", "line": 13, "hash": "e3b0c44298fc1c14", "error": "..."}
+
+so a restarted render skips the lines that are already done. A line is
+only skipped if its text is unchanged. The settings of a run, e.g. the
+chosen style wav, are recorded with the status "start" and reused on resume.
+A truncated last record after a crash is ignored.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('journal')
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf8')).hexdigest()[:16]
+
+
+class ProgressJournal():
+    """Status of the lines of a render, persisted in ``path``.
+
+    Args:
+        path (str): json lines file, created if it does not exist.
+        sync (bool): fsync after every record, so a power loss keeps them.
+    """
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.sync = sync
+        # line number -> last record
+        self.entries = {}
+        self.settings = {}
+        complete = True
+        if os.path.exists(path):
+            complete = self._load()
+        self._file = open(path, 'a', encoding='utf8')
+        if not complete:
+            # end the record cut off by a crash, the next one starts on its own line
+            self._file.write('\n')
+
+    def _load(self):
+        """Read the records, returns False if the last one is cut off."""
+        line = '\n'
+        with open(self.path, 'r', encoding='utf8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(" [!] Skipping a broken record in %s", self.path)
+                    continue
+                if record.get('status') == 'start':
+                    self.settings = record.get('settings', {})
+                elif 'line' in record:
+                    self.entries[record['line']] = record
+        return line.endswith('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def num_done(self):
+        return sum(1 for record in self.entries.values() if record['status'] == 'done')
+
+    @property
+    def num_failed(self):
+        return sum(1 for record in self.entries.values() if record['status'] == 'failed')
+
+    def is_done(self, line, line_hash):
+        record = self.entries.get(line)
+        return record is not None and record['status'] in ('done', 'skipped') \
+            and record['hash'] == line_hash
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    def start(self, **settings):
+        """Record the settings of a (resumed) run."""
+        self.settings = settings
+        self._write({'status': 'start', 'time': datetime.now().isoformat(timespec='seconds'),
+                     'settings': settings})
+
+    def record(self, line, line_hash, status, **info):
+        """Record the ``status`` (done, failed or skipped) of a line."""
+        record = dict(status=status, line=line, hash=line_hash, **info)
+        self.entries[line] = record
+        self._write(record)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
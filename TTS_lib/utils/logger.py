@@ -0,0 +1,35 @@
+import os
+import sys
+import logging
+
+LOGGER_NAME = 'TTS_lib'
+
+
+def setup_logger(level=None):
+    """Configure the ``TTS_lib`` logger.
+
+    Messages keep the console format of the former prints (`` > ...``).
+    The level defaults to the ``TTS_LOG_LEVEL`` environment variable or INFO;
+    DEBUG also shows details like every audio processor attribute.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    if level is None:
+        level = os.environ.get('TTS_LOG_LEVEL', 'INFO')
+    if isinstance(level, str):
+        level = level.upper()
+    logger.setLevel(level)
+    return logger
+
+
+def get_logger(name=None):
+    """Return the ``TTS_lib`` logger or one of its children, e.g. ``get_logger('synthesis')``."""
+    if not logging.getLogger(LOGGER_NAME).handlers:
+        setup_logger()
+    if name is None:
+        return logging.getLogger(LOGGER_NAME)
+    return logging.getLogger(LOGGER_NAME + '.' + name)
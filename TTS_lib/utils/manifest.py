@@ -0,0 +1,100 @@
+"""SQLite manifest of the outputs of a voice pack build.
+
+Every output wav is recorded with the hash of everything that produced it
+(cleaned text, speaker, style, checkpoint, config, vocoder), so a build only
+renders the entries whose inputs changed and removes the outputs that are
+no longer part of the pack:
+
+    with BuildManifest('build/manifest.sqlite') as manifest:
+        if not manifest.is_current('Diego/DIA_Diego_Hallo_11_00.wav', digest, store):
+            ...
+            manifest.record('Diego/DIA_Diego_Hallo_11_00.wav', digest, inputs)
+
+Paths are relative to the build folder or names in an archive. File hashes, e.g. of the
+checkpoint, are cached by size and modification time.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+
+def input_hash(inputs):
+    """Hash of a json serializable dict of inputs."""
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode('utf8')).hexdigest()
+
+
+class BuildManifest():
+    """Outputs and their input hashes, stored in an SQLite database at ``path``."""
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS outputs (path TEXT PRIMARY KEY, input_hash TEXT, '
+                        'inputs TEXT, audio_seconds REAL, created REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outputs_input_hash ON outputs (input_hash)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, size INTEGER, '
+                        'mtime REAL, sha1 TEXT)')
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file_hash(self, path):
+        """sha1 of a file, recomputed only if its size or mtime changed."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.db.execute('SELECT size, mtime, sha1 FROM file_hashes WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        digest = sha1.hexdigest()
+        self.db.execute('INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)',
+                        (path, stat.st_size, stat.st_mtime, digest))
+        self.db.commit()
+        return digest
+
+    def get(self, path):
+        row = self.db.execute('SELECT input_hash, inputs, audio_seconds, created FROM outputs WHERE path = ?',
+                              (path,)).fetchone()
+        if row is None:
+            return None
+        return {'path': path, 'input_hash': row[0], 'inputs': json.loads(row[1]),
+                'audio_seconds': row[2], 'created': row[3]}
+
+    def is_current(self, path, digest, store):
+        """True if ``path`` was built from inputs with hash ``digest`` and
+        still exists in ``store``, a ``TTS_lib.utils.archive.WavFolder`` or
+        ``AudioArchive``."""
+        row = self.db.execute('SELECT input_hash FROM outputs WHERE path = ?', (path,)).fetchone()
+        return row is not None and row[0] == digest and store.exists(path)
+
+    def find(self, digest, store):
+        """Path of an existing output built from inputs with hash ``digest``, or None."""
+        for (path,) in self.db.execute('SELECT path FROM outputs WHERE input_hash = ?', (digest,)).fetchall():
+            if store.exists(path):
+                return path
+        return None
+
+    def record(self, path, digest, inputs, audio_seconds=None):
+        self.db.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?)',
+                        (path, digest, json.dumps(inputs, sort_keys=True), audio_seconds, time.time()))
+
+    def paths(self):
+        return [row[0] for row in self.db.execute('SELECT path FROM outputs')]
+
+    def remove(self, path):
+        self.db.execute('DELETE FROM outputs WHERE path = ?', (path,))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
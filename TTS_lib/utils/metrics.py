@@ -0,0 +1,229 @@
+"""Metrics of the synthesis pipeline.
+
+Stages are timed with ``with metrics.stage('decoder'):``. Every stage feeds
+the ``tts_stage_seconds`` histogram and calls the registered hooks, which
+receive ``on_stage_start(stage, info)`` and ``on_stage_end(stage, seconds, info)``.
+Besides the stages the pipeline records:
+
+    tts_decoder_steps               decoder steps per input
+    tts_decoder_steps_per_token     decoder steps / input tokens
+    tts_real_time_factor            synthesis time / audio duration per line
+    tts_audio_seconds_total         generated audio
+    tts_lines_total                 synthesized lines
+    tts_batch_size                  utterances per continuous batching step
+    tts_queue_seconds               wait of a request before joining the batch
+    tts_job_wait_seconds            wait of a job before its first item, per priority
+
+Exporters: ``JsonLinesExporter`` (hook writing one json line per stage) and
+``to_prometheus()`` / ``start_http_server()`` for the Prometheus text format.
+"""
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('metrics')
+
+# seconds, decoder steps and ratios share one set of buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0,
+                   50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=None):
+    labels = list(labels) + (list(extra.items()) if extra else [])
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels) + '}'
+
+
+class Histogram():
+    """Cumulative bucket histogram like the Prometheus one."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum,
+                'mean': self.sum / self.count if self.count else 0.0,
+                'buckets': dict(zip([str(b) for b in self.buckets], self.counts))}
+
+
+class MetricsHook():
+    """Base class of the callbacks fired around every pipeline stage."""
+    def on_stage_start(self, stage, info):
+        pass
+
+    def on_stage_end(self, stage, seconds, info):
+        pass
+
+
+class MetricsRegistry():
+    """Thread-safe counters, histograms, gauges and stage hooks."""
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def register_gauge(self, name, callback, **labels):
+        """Export the value returned by ``callback()``, e.g. a cache hit rate."""
+        with self._lock:
+            self.gauges[(name, _labels_key(labels))] = callback
+
+    @contextmanager
+    def stage(self, name, **info):
+        """Time a pipeline stage. ``info`` is passed to the hooks, e.g. the input length."""
+        for hook in self.hooks:
+            hook.on_stage_start(name, info)
+        start_time = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - start_time
+            self.observe('tts_stage_seconds', seconds, stage=name)
+            for hook in self.hooks:
+                hook.on_stage_end(name, seconds, info)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def _gauge_values(self):
+        values = {}
+        for key, callback in list(self.gauges.items()):
+            try:
+                values[key] = float(callback())
+            except Exception as e:  # pylint: disable=broad-except
+                logger.debug(" [!] Gauge %s failed: %s", key[0], e)
+        return values
+
+    def to_dict(self):
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in self.counters.items()]
+            histograms = [dict(name=name, labels=dict(labels), **histogram.to_dict())
+                          for (name, labels), histogram in self.histograms.items()]
+        gauges = [{'name': name, 'labels': dict(labels), 'value': value}
+                  for (name, labels), value in self._gauge_values().items()]
+        return {'time': time.time(), 'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+    def to_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda x: x[0])
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append('# TYPE {} counter'.format(name))
+                typed.add(name)
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for (name, labels), value in sorted(self._gauge_values().items()):
+            if name not in typed:
+                lines.append('# TYPE {} gauge'.format(name))
+                typed.add(name)
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append('# TYPE {} histogram'.format(name))
+                typed.add(name)
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, {'le': bound}), count))
+            lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, {'le': '+Inf'}), histogram.count))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), histogram.sum))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+class JsonLinesExporter(MetricsHook):
+    """Appends one json line per finished stage to ``path``.
+
+    ``write_snapshot()`` appends the current counters and histograms.
+    """
+    def __init__(self, path, registry=None):
+        self.path = path
+        self.registry = registry
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf8') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+    def on_stage_end(self, stage, seconds, info):
+        record = {'time': time.time(), 'stage': stage, 'seconds': seconds}
+        record.update(info)
+        self._write(record)
+
+    def write_snapshot(self):
+        registry = self.registry or metrics
+        self._write(dict(type='snapshot', **registry.to_dict()))
+
+
+def start_http_server(port=9100, addr='', registry=None):
+    """Serve ``/metrics`` in the Prometheus text format from a daemon thread."""
+    registry = registry or metrics
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            logger.debug(format, *args)
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(" > Serving metrics on port %d", server.server_address[1])
+    return server
+
+
+# registry used by the synthesis pipeline
+metrics = MetricsRegistry()
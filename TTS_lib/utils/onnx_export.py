@@ -0,0 +1,248 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import torch
+from torch import nn
+
+from TTS_lib.layers.common_layers import OriginalAttention, AttentionState
+from TTS_lib.layers.tacotron2 import DecoderState
+from TTS_lib.utils.backends import init_states, get_io_names
+
+
+DECODER_STATES = ['query', 'attention_rnn_cell_state', 'decoder_hidden', 'decoder_cell', 'context']
+
+
+def get_state_names(decoder):
+    """Names of the decoder and attention states passed through a decoder step."""
+    attention = decoder.attention
+    attention_states = ['attention_weights']
+    if attention.location_attention:
+        attention_states.append('attention_weights_cum')
+    if attention.forward_attn:
+        attention_states += ['alpha', 'u']
+    return DECODER_STATES, attention_states
+
+
+def check_exportable(model):
+    decoder = model.decoder
+    if not isinstance(decoder.attention, OriginalAttention):
+        raise NotImplementedError(" [!] Only 'original' attention can be exported.")
+    if decoder.attention.windowing:
+        raise NotImplementedError(" [!] Attention windowing cannot be exported.")
+    if decoder.attention.forward_attn and decoder.attention.forward_attn_mask:
+        raise NotImplementedError(" [!] Forward attention masking cannot be exported.")
+
+
+class EncoderStage(nn.Module):
+    """text: B x T_in (int64) -> encoder_outputs: B x T_in x D_en"""
+    def __init__(self, model):
+        super(EncoderStage, self).__init__()
+        self.embedding = model.embedding
+        self.encoder = model.encoder
+
+    def forward(self, text):
+        embedded_inputs = self.embedding(text).transpose(1, 2)
+        return self.encoder.inference(embedded_inputs)
+
+
+class AttentionMemoryStage(nn.Module):
+    """inputs: B x T_in x D -> processed_inputs: B x T_in x D_attn"""
+    def __init__(self, decoder):
+        super(AttentionMemoryStage, self).__init__()
+        self.attention = decoder.attention
+
+    def forward(self, inputs):
+        return self.attention.preprocess_inputs(inputs)
+
+
+class DecoderStepStage(nn.Module):
+    """A single decoder step with all recurrent states as explicit inputs and outputs.
+
+    inputs: memory (B x frame_dim), inputs, processed_inputs and the states
+    returned by ``get_state_names()``.
+    outputs: decoder_output (B x r * frame_dim), stop_token (B x 1) and the updated states.
+    """
+    def __init__(self, decoder):
+        super(DecoderStepStage, self).__init__()
+        self.decoder = decoder
+        self.decoder_states, self.attention_states = get_state_names(decoder)
+
+    def forward(self, memory, inputs, processed_inputs, *states):
+        decoder = self.decoder
+        num_decoder_states = len(self.decoder_states)
+        attention_state = AttentionState(
+            **dict(zip(self.attention_states, states[num_decoder_states:])))
+        state = DecoderState(inputs=inputs, processed_inputs=processed_inputs, mask=None,
+                             attention=attention_state,
+                             **dict(zip(self.decoder_states, states[:num_decoder_states])))
+        decoder_output, _, stop_token = decoder.decode(decoder.prenet(memory), state)
+        stop_token = torch.sigmoid(stop_token)
+        new_states = [getattr(state, name) for name in self.decoder_states]
+        new_states += [getattr(state.attention, name) for name in self.attention_states]
+        return tuple([decoder_output, stop_token] + new_states)
+
+
+class PostnetStage(nn.Module):
+    """mel: B x frame_dim x T_out -> mel_postnet: B x frame_dim x T_out"""
+    def __init__(self, model):
+        super(PostnetStage, self).__init__()
+        self.postnet = model.postnet
+
+    def forward(self, mel):
+        return mel + self.postnet(mel)
+
+
+class GSTTableStage(nn.Module):
+    """style_weights: B x num_style_tokens -> gst_embedding: B x D_gst
+
+    Equivalent to ``Tacotron2.compute_style_embedding`` for a dict of token
+    weights. Each token's attention output is precomputed into a table.
+    """
+    def __init__(self, model):
+        super(GSTTableStage, self).__init__()
+        style_token_layer = model.gst_layer.style_token_layer
+        tokens = torch.tanh(style_token_layer.style_tokens)
+        query = torch.zeros(1, 1, style_token_layer.query_dim)
+        with torch.no_grad():
+            table = [style_token_layer.attention(query, token.view(1, 1, -1)).view(-1)
+                     for token in tokens]
+        self.register_buffer('table', torch.stack(table))
+
+    def forward(self, style_weights):
+        return torch.matmul(style_weights, self.table)
+
+
+def build_stages(model):
+    """Return the exportable stages of a Tacotron2 model and their metadata."""
+    check_exportable(model)
+    decoder = model.decoder
+    decoder_states, attention_states = get_state_names(decoder)
+    stages = {
+        'encoder': EncoderStage(model),
+        'attention_memory': AttentionMemoryStage(decoder),
+        'decoder_step': DecoderStepStage(decoder),
+        'postnet': PostnetStage(model),
+    }
+    meta = {
+        'r': decoder.r,
+        'frame_dim': decoder.frame_dim,
+        'input_dim': decoder.encoder_embedding_dim,
+        'query_dim': decoder.query_dim,
+        'decoder_rnn_dim': decoder.decoder_rnn_dim,
+        'max_decoder_steps': decoder.max_decoder_steps,
+        'decoder_states': decoder_states,
+        'attention_states': attention_states,
+        'num_speakers': model.num_speakers,
+        'gst': bool(model.gst),
+        'num_style_tokens': 0,
+    }
+    if model.gst:
+        stages['gst'] = GSTTableStage(model)
+        meta['num_style_tokens'] = stages['gst'].table.size(0)
+    for stage in stages.values():
+        stage.eval()
+    return stages, meta
+
+
+def get_example_inputs(meta, num_chars=10, T_in=13):
+    """Example inputs for tracing/exporting the stages."""
+    B = 1
+    text = torch.randint(1, num_chars, (B, T_in), dtype=torch.long)
+    inputs = torch.rand(B, T_in, meta['input_dim'])
+    processed_inputs = torch.rand(B, T_in, 128)
+    memory = torch.rand(B, meta['frame_dim'])
+    states = init_states(meta, B, T_in, torch.zeros)
+    return {
+        'encoder': (text, ),
+        'attention_memory': (inputs, ),
+        'decoder_step': tuple([memory, inputs, processed_inputs] + states),
+        'postnet': (torch.rand(B, meta['frame_dim'], 7), ),
+        'gst': (torch.rand(B, meta['num_style_tokens']), ),
+    }
+
+
+def get_dynamic_axes(meta):
+    time_states = {'attention_weights', 'attention_weights_cum', 'alpha'}
+    step_axes = {'memory': {0: 'batch'}, 'inputs': {0: 'batch', 1: 'T_in'},
+                 'processed_inputs': {0: 'batch', 1: 'T_in'},
+                 'decoder_output': {0: 'batch'}, 'stop_token': {0: 'batch'}}
+    for name in meta['decoder_states'] + meta['attention_states']:
+        axes = {0: 'batch', 1: 'T_in'} if name in time_states else {0: 'batch'}
+        step_axes[name] = axes
+        step_axes['next_' + name] = axes
+    return {
+        'encoder': {'text': {0: 'batch', 1: 'T_in'}, 'encoder_outputs': {0: 'batch', 1: 'T_in'}},
+        'attention_memory': {'inputs': {0: 'batch', 1: 'T_in'}, 'processed_inputs': {0: 'batch', 1: 'T_in'}},
+        'decoder_step': step_axes,
+        'postnet': {'mel': {0: 'batch', 2: 'T_out'}, 'mel_postnet': {0: 'batch', 2: 'T_out'}},
+        'gst': {'style_weights': {0: 'batch'}, 'gst_embedding': {0: 'batch'}},
+    }
+
+
+def _onnx_export(stage, example_inputs, path, input_names, output_names, dynamic_axes, opset_version):
+    kwargs = dict(input_names=input_names, output_names=output_names,
+                  dynamic_axes=dynamic_axes, opset_version=opset_version)
+    try:
+        # newer torch versions default to the dynamo based exporter
+        torch.onnx.export(stage, example_inputs, path, dynamo=False, **kwargs)
+    except TypeError:
+        torch.onnx.export(stage, example_inputs, path, **kwargs)
+
+
+@torch.no_grad()
+def export_onnx(model, out_path, opset_version=13):
+    """Export the Tacotron2 stages as separate ONNX graphs.
+
+    Writes ``encoder.onnx``, ``attention_memory.onnx``, ``decoder_step.onnx``,
+    ``postnet.onnx`` and ``gst.onnx`` (GST models), the speaker embedding table
+    ``speaker_embedding.npy`` (multi-speaker models) and ``stages.json``
+    describing the step inputs and outputs.
+    """
+    model = model.cpu().eval()
+    stages, meta = build_stages(model)
+    os.makedirs(out_path, exist_ok=True)
+    example_inputs = get_example_inputs(meta, num_chars=model.embedding.num_embeddings)
+    io_names = get_io_names(meta)
+    dynamic_axes = get_dynamic_axes(meta)
+    for name, stage in stages.items():
+        input_names, output_names = io_names[name]
+        stage_path = os.path.join(out_path, name + '.onnx')
+        print(" > Exporting {}".format(stage_path))
+        _onnx_export(stage, example_inputs[name], stage_path, input_names, output_names,
+                     dynamic_axes[name], opset_version)
+    if model.num_speakers > 1:
+        np.save(os.path.join(out_path, 'speaker_embedding.npy'),
+                model.speaker_embedding.weight.detach().numpy())
+    with open(os.path.join(out_path, 'stages.json'), 'w') as f:
+        json.dump(meta, f, indent=4)
+    return meta
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from TTS_lib.utils.io import load_config, load_checkpoint
+    from TTS_lib.utils.generic_utils import setup_model
+    from TTS_lib.utils.text import TextFrontend
+    parser = argparse.ArgumentParser(description='Export Tacotron2 stages to ONNX.')
+    parser.add_argument('config_path', type=str, help='path to config.json')
+    parser.add_argument('checkpoint_path', type=str, help='path to the model checkpoint')
+    parser.add_argument('out_path', type=str, help='output folder for the ONNX graphs')
+    parser.add_argument('--speakers_json', type=str, default='', help='path to speakers.json')
+    parser.add_argument('--opset', type=int, default=13, help='ONNX opset version')
+    args = parser.parse_args()
+
+    C = load_config(args.config_path)
+    num_speakers = 0
+    if args.speakers_json:
+        with open(args.speakers_json, 'r') as f:
+            num_speakers = len(json.load(f))
+    num_chars = TextFrontend.from_config(C).num_chars
+    model = setup_model(num_chars, num_speakers, C)
+    model, _ = load_checkpoint(model, args.checkpoint_path)
+    export_onnx(model, args.out_path, opset_version=args.opset)
+
+
+if __name__ == '__main__':
+    main()
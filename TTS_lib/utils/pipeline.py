@@ -0,0 +1,149 @@
+"""Bounded queue pipeline of processing stages.
+
+Every stage runs its function on one or more worker threads and hands the
+results to the next stage through a bounded queue, so a slow stage holds
+back the ones before it instead of letting results pile up in memory:
+
+    pipeline = Pipeline([Stage('frontend', prepare),
+                         Stage('acoustic_model', decode, setup=lambda: torch.set_num_threads(4)),
+                         Stage('vocoder', vocode, num_workers=2),
+                         Stage('writer', write)], queue_size=4)
+    for path in pipeline.map(lines):
+        ...
+
+torch and the numpy FFTs release the GIL, so the stages run in parallel
+and the throughput approaches the one of the slowest stage. ``map`` reads
+its items lazily and yields the results in input order. An item that
+fails skips the remaining stages, ``map`` raises its exception or yields
+it with ``return_exceptions``.
+"""
+import queue
+import threading
+import time
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('pipeline')
+
+# end of the input of a stage
+_END = object()
+
+
+class Stage():
+    """A pipeline stage.
+
+    Args:
+        name (str): name for the logs and thread names.
+        fn (callable): called with the output of the previous stage.
+        num_workers (int): worker threads running ``fn``.
+        setup (callable): called once in every worker thread before the
+            first item, e.g. to set the thread budget of the stage.
+    """
+    def __init__(self, name, fn, num_workers=1, setup=None):
+        if num_workers < 1:
+            raise ValueError(" [!] Stage {} needs at least one worker".format(name))
+        self.name = name
+        self.fn = fn
+        self.num_workers = num_workers
+        self.setup = setup
+        # seconds spent in fn, summed over the workers
+        self.busy_seconds = 0.0
+        self.num_items = 0
+
+
+class Pipeline():
+    """Runs items through ``stages`` connected by queues of ``queue_size`` items."""
+    def __init__(self, stages, queue_size=4):
+        if not stages:
+            raise ValueError(" [!] A pipeline needs at least one stage")
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+
+    def _work(self, stage, inputs, outputs, remaining, stop):
+        if stage.setup is not None:
+            stage.setup()
+        while True:
+            item = inputs.get()
+            if item is _END:
+                with self._lock:
+                    remaining[stage.name] -= 1
+                    last = remaining[stage.name] == 0
+                # the last worker of a stage ends the next one, the others
+                # pass the end on to their siblings
+                (outputs if last else inputs).put(_END)
+                return
+            index, value = item
+            if stop.is_set():
+                # drain, so the stages before do not block
+                continue
+            if not isinstance(value, Exception):
+                start_time = time.perf_counter()
+                try:
+                    value = stage.fn(value)
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.error(" [!] Pipeline stage %s failed at item %d: %s", stage.name, index, e)
+                    value = e
+                with self._lock:
+                    stage.busy_seconds += time.perf_counter() - start_time
+                    stage.num_items += 1
+            outputs.put((index, value))
+
+    def _feed(self, items, inputs, stop):
+        try:
+            for index, value in enumerate(items):
+                if stop.is_set():
+                    break
+                inputs.put((index, value))
+        except Exception as e:  # pylint: disable=broad-except
+            # a failing input iterator fails the item it would have produced
+            logger.error(" [!] Pipeline input failed: %s", e)
+            inputs.put((-1, e))
+        inputs.put(_END)
+
+    def map(self, items, return_exceptions=False):
+        """Yield the results of ``items`` in their order."""
+        stop = threading.Event()
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        # results are collected right away, the order is restored below
+        queues.append(queue.Queue())
+        remaining = {stage.name: stage.num_workers for stage in self.stages}
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], stop),
+                                    name='pipeline_input', daemon=True)]
+        for idx, stage in enumerate(self.stages):
+            for worker_idx in range(stage.num_workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(stage, queues[idx], queues[idx + 1], remaining, stop),
+                    name='pipeline_{}_{}'.format(stage.name, worker_idx), daemon=True))
+        for thread in threads:
+            thread.start()
+        results = {}
+        next_index = 0
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _END:
+                    break
+                index, value = item
+                if index < 0:
+                    raise value
+                results[index] = value
+                while next_index in results:
+                    value = results.pop(next_index)
+                    next_index += 1
+                    if isinstance(value, Exception) and not return_exceptions:
+                        raise value
+                    yield value
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def run(self, items, return_exceptions=False):
+        """List of the results of ``items``."""
+        return list(self.map(items, return_exceptions))
+
+    def report(self):
+        """Busy seconds of every stage, the largest one limits the throughput."""
+        with self._lock:
+            return {stage.name: round(stage.busy_seconds / stage.num_workers, 3) for stage in self.stages}
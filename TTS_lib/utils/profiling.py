@@ -0,0 +1,108 @@
+import sys
+import json
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+
+
+class StartupProfiler():
+    """Measures import time per module and initialization time per stage.
+
+    The import hook wraps ``builtins.__import__`` and records every module
+    that is imported for the first time with its cumulative and self time.
+    Imports of background threads are included, their time can contain
+    waiting for the import lock. Imports done through ``importlib.import_module`` are attributed to the
+    importing module. Stages are timed with ``with profiler.stage(name):``.
+    """
+    def __init__(self):
+        self.imports = {}
+        self.stages = []
+        self.start_time = time.perf_counter()
+        self._original_import = None
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_argv(cls, argv, flag='--profile-startup'):
+        """Return an installed profiler if ``flag`` is in ``argv``, else None."""
+        if flag not in argv:
+            return None
+        profiler = cls()
+        profiler.install()
+        return profiler
+
+    def install(self):
+        if self._original_import is not None:
+            return
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._original_import is None:
+            return
+        builtins.__import__ = self._original_import
+        self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):  # pylint: disable=redefined-builtin
+        if level == 0 and name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        # every thread keeps its own stack of nested imports
+        stack = self._local.__dict__.setdefault('stack', [])
+        loaded_before = set(sys.modules) if level > 0 else None
+        stack.append(0.0)
+        start_time = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            if level > 0:
+                new_modules = [m for m in list(sys.modules) if m not in loaded_before]
+                name = min(new_modules, key=len) if new_modules else None
+            with self._lock:
+                if name is not None and name not in self.imports:
+                    self.imports[name] = {'cumulative': elapsed, 'self': elapsed - children}
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.stages.append((name, time.perf_counter() - start_time))
+
+    def to_dict(self):
+        return {'total': time.perf_counter() - self.start_time,
+                'stages': [{'name': name, 'seconds': seconds} for name, seconds in self.stages],
+                'imports': self.imports}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def report(self, num_imports=25):
+        top_level = {}
+        for name, times in self.imports.items():
+            root = name.split('.')[0]
+            top_level[root] = top_level.get(root, 0.0) + times['self']
+        print(" > Startup profile: {:.3f}s since start".format(time.perf_counter() - self.start_time))
+        print(" | > Import time per package (self):")
+        for name, seconds in sorted(top_level.items(), key=lambda x: -x[1])[:num_imports]:
+            print(" | > {:<40} {:>8.3f}s".format(name, seconds))
+        print(" | > Import time per module (cumulative):")
+        imports = sorted(self.imports.items(), key=lambda x: -x[1]['cumulative'])
+        for name, times in imports[:num_imports]:
+            print(" | > {:<40} {:>8.3f}s (self {:.3f}s)".format(name, times['cumulative'], times['self']))
+        if self.stages:
+            print(" | > Stages:")
+            for name, seconds in self.stages:
+                print(" | > {:<40} {:>8.3f}s".format(name, seconds))
+
+
+@contextmanager
+def null_stage(name):  # pylint: disable=unused-argument
+    yield
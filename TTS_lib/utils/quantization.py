@@ -0,0 +1,123 @@
+import torch
+from torch import nn
+import numpy as np
+
+from TTS_lib.utils.synthesis import text_to_seqvec, id_to_torch, numpy_to_torch
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('quantization')
+
+try:
+    from torch.ao.quantization import quantize_dynamic
+except ImportError:
+    from torch.quantization import quantize_dynamic
+
+
+# sentences used by the quality check if the config does not define any
+CHECK_SENTENCES = [
+    "Hallo, wie geht es dir?",
+    "Im Minental versammelt sich eine Armee des Bösen unter der Führung von Drachen.",
+    "Wir müssen sie aufhalten, so lange wir noch können!",
+    "Ich bin nur ein einfacher Bauer.",
+]
+
+DEFAULT_QUANTIZATION_CONFIG = {
+    "enabled": False,
+    "check_sentences": None,
+    "max_mel_error": 0.1,           # mean absolute difference of the postnet outputs
+    "max_alignment_error": 0.05,    # mean drift of the attended input position / T_in
+    "max_length_difference": 0.1,   # relative difference of the number of decoder steps
+    "on_failure": "refuse"          # "refuse" keeps the fp32 model, "warn" uses int8 anyway
+}
+
+
+def get_quantization_config(C):
+    q_config = dict(DEFAULT_QUANTIZATION_CONFIG)
+    if 'quantization' in C.keys() and C.quantization is not None:
+        q_config.update(C.quantization)
+    return q_config
+
+
+def quantize_model(model, dtype=torch.qint8):
+    """Return a copy of the model with dynamically quantized LSTMCell and Linear layers.
+
+    This covers the decoder rnns, the linear projection, the prenet and the
+    attention layers. Quantized models run on CPU only.
+    """
+    model = model.cpu().eval()
+    return quantize_dynamic(model, {nn.LSTMCell, nn.Linear}, dtype=dtype, inplace=False)
+
+
+def _alignment_drift(alignment, alignment_ref):
+    T_out = min(alignment.shape[0], alignment_ref.shape[0])
+    positions = alignment[:T_out].argmax(-1)
+    positions_ref = alignment_ref[:T_out].argmax(-1)
+    return float(np.abs(positions - positions_ref).mean() / alignment_ref.shape[-1])
+
+
+def compare_models(model, model_ref, C, sentences, speaker_id=None, style_input=None):
+    """Run both models on the given sentences and measure how far the outputs of
+    ``model`` are from ``model_ref``.
+
+    Returns:
+        dict: worst mel error, alignment error and length difference over all sentences.
+    """
+    speaker_id = id_to_torch(speaker_id) if speaker_id is not None else None
+    if style_input is not None and not isinstance(style_input, dict):
+        raise RuntimeError(" [!] Quantization check only supports style token weights as style input.")
+    results = {'mel_error': 0.0, 'alignment_error': 0.0, 'length_difference': 0.0}
+    for sentence in sentences:
+        inputs = numpy_to_torch(text_to_seqvec(sentence, C), torch.long).unsqueeze(0)
+        _, postnet_output, alignments, _ = model.inference(
+            inputs, speaker_ids=speaker_id, input_style=style_input)
+        _, postnet_output_ref, alignments_ref, _ = model_ref.inference(
+            inputs, speaker_ids=speaker_id, input_style=style_input)
+        postnet_output = postnet_output[0].numpy()
+        postnet_output_ref = postnet_output_ref[0].numpy()
+        T_out = min(postnet_output.shape[0], postnet_output_ref.shape[0])
+        mel_error = np.abs(postnet_output[:T_out] - postnet_output_ref[:T_out]).mean()
+        alignment_error = _alignment_drift(alignments[0].numpy(), alignments_ref[0].numpy())
+        length_difference = abs(postnet_output.shape[0] - postnet_output_ref.shape[0]) / postnet_output_ref.shape[0]
+        results['mel_error'] = max(results['mel_error'], float(mel_error))
+        results['alignment_error'] = max(results['alignment_error'], alignment_error)
+        results['length_difference'] = max(results['length_difference'], length_difference)
+    return results
+
+
+def setup_quantized_model(model, C, speaker_id=None, style_input=None, check_results=None):
+    """Quantize the model if enabled in the config and gate it on output quality.
+
+    The quantized model is compared against the fp32 model on the check
+    sentences. If a threshold is exceeded the fp32 model is returned
+    (``on_failure: "refuse"``) or a warning is printed (``on_failure: "warn"``).
+    Passing the results of an earlier check for the same checkpoint skips it.
+
+    Returns:
+        model: model to use for inference.
+        dict: results of the quality check, None if quantization is disabled.
+    """
+    q_config = get_quantization_config(C)
+    if not q_config['enabled']:
+        return model, None
+    if q_config['on_failure'] not in ('refuse', 'warn'):
+        raise ValueError(" [!] Unknown value for quantization on_failure: {}".format(q_config['on_failure']))
+    logger.info(" > Quantizing model to int8 for CPU inference...")
+    model = model.cpu().eval()
+    quantized_model = quantize_model(model)
+    if check_results is None:
+        sentences = q_config['check_sentences'] or CHECK_SENTENCES
+        results = compare_models(quantized_model, model, C, sentences, speaker_id, style_input)
+    else:
+        results = check_results
+    failed = [name for name, threshold in [('mel_error', q_config['max_mel_error']),
+                                           ('alignment_error', q_config['max_alignment_error']),
+                                           ('length_difference', q_config['max_length_difference'])]
+              if results[name] > threshold]
+    logger.info(" | > mel error: {mel_error:.4f} alignment error: {alignment_error:.4f} "
+          "length difference: {length_difference:.4f}".format(**results))
+    if failed:
+        if q_config['on_failure'] == 'refuse':
+            logger.warning(" [!] Quantized model exceeds %s thresholds, using fp32 model.", ', '.join(failed))
+            return model, results
+        logger.warning(" [!] Quantized model exceeds %s thresholds.", ', '.join(failed))
+    return quantized_model, results
@@ -0,0 +1,134 @@
+"""Slim inference checkpoints.
+
+A slim checkpoint only holds the model weights, the reduction factor ``r``
+and the config the model was trained with. Layout:
+
+    8 bytes   magic ``TTSSLIM1``
+    8 bytes   header size (little endian uint64)
+    header    utf-8 json: r, config and name -> dtype, shape, offset of each tensor
+    data      raw tensor bytes, every tensor aligned to 64 bytes
+
+The data section is memory-mapped on load, so weights are not unpickled or
+copied and the pages are shared between worker processes.
+"""
+import os
+import json
+import mmap
+import struct
+import argparse
+
+import numpy as np
+import torch
+
+MAGIC = b'TTSSLIM1'
+ALIGNMENT = 64
+
+
+def is_slim_checkpoint(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_slim_checkpoint(state_dict, out_path, r=None, config=None, fp16=False):
+    """Write a slim checkpoint.
+
+    Args:
+        state_dict (dict): model weights.
+        out_path (str): output file.
+        r (int): decoder reduction factor the weights were trained with.
+        config (dict): model config embedded into the checkpoint.
+        fp16 (bool): store floating point weights in half precision.
+    """
+    arrays = {}
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu()
+        if fp16 and tensor.is_floating_point():
+            tensor = tensor.half()
+        arrays[name] = tensor.contiguous().numpy()
+    tensors = {}
+    offset = 0
+    for name, array in arrays.items():
+        tensors[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    header = {'r': r, 'config': config, 'fp16': fp16, 'tensors': tensors}
+    header = json.dumps(header).encode('utf8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+    with open(out_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + tensors[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+def load_slim_checkpoint(path, dtype=torch.float32):
+    """Memory-map a slim checkpoint.
+
+    Floating point weights stored in half precision are converted to
+    ``dtype``, which copies them. Pass ``dtype=None`` to keep the stored
+    precision.
+
+    Returns:
+        dict: ``model`` (state dict), ``r`` and ``config`` like the state of a
+        training checkpoint.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise RuntimeError(" [!] {} is not a slim checkpoint.".format(path))
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size).decode('utf8'))
+        # copy-on-write mapping: pages stay shared with the page cache until written
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    data_start = _align(len(MAGIC) + 8 + header_size)
+    state_dict = {}
+    for name, info in header['tensors'].items():
+        array_dtype = np.dtype(info['dtype'])
+        count = int(np.prod(info['shape'], dtype=np.int64))
+        array = np.frombuffer(buffer, dtype=array_dtype, count=count,
+                              offset=data_start + info['offset']).reshape(info['shape'])
+        tensor = torch.from_numpy(array)
+        if dtype is not None and tensor.is_floating_point() and tensor.dtype != dtype:
+            tensor = tensor.to(dtype)
+        state_dict[name] = tensor
+    return {'model': state_dict, 'r': header['r'], 'config': header['config']}
+
+
+def load_state_dict(model, state_dict):
+    """Load weights by assigning the given tensors instead of copying them, if supported."""
+    try:
+        model.load_state_dict(state_dict, assign=True)
+    except TypeError:
+        # torch < 2.1
+        model.load_state_dict(state_dict)
+    return model
+
+
+def convert_checkpoint(checkpoint_path, out_path, config=None, fp16=False):
+    """Convert a training checkpoint (``.pth.tar``) into a slim checkpoint."""
+    state = torch.load(checkpoint_path, map_location=torch.device('cpu'))
+    save_slim_checkpoint(state['model'], out_path, r=state.get('r'), config=config, fp16=fp16)
+    print(" > Slim checkpoint: {} ({:.1f} MB -> {:.1f} MB)".format(
+        out_path, os.path.getsize(checkpoint_path) / 1024 ** 2, os.path.getsize(out_path) / 1024 ** 2))
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from TTS_lib.utils.io import load_config
+    parser = argparse.ArgumentParser(description='Convert a checkpoint into a slim inference checkpoint.')
+    parser.add_argument('checkpoint_path', type=str, help='path to the .pth.tar checkpoint')
+    parser.add_argument('out_path', type=str, help='path to the slim checkpoint')
+    parser.add_argument('--config_path', type=str, default=None, help='config.json to embed')
+    parser.add_argument('--fp16', action='store_true', help='store weights in half precision')
+    args = parser.parse_args()
+    config = dict(load_config(args.config_path)) if args.config_path else None
+    convert_checkpoint(args.checkpoint_path, args.out_path, config=config, fp16=args.fp16)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,35 @@
-import pkg_resources
-installed = {pkg.key for pkg in pkg_resources.working_set}  #pylint: disable=not-an-iterable
-if 'tensorflow' in installed or 'tensorflow-gpu' in installed:
-    import tensorflow as tf
-import torch
+import importlib
+import importlib.util
 #import torchaudio
 import numpy as np
-from .text import text_to_sequence, phoneme_to_sequence
+from .text import TextFrontend
+from .backends import InferenceBackend
+from .metrics import metrics
 
 
-def text_to_seqvec(text, CONFIG):
-    text_cleaner = [CONFIG.text_cleaner]
+def get_tf():
+    """Import TensorFlow on first use of the TF backend."""
+    if importlib.util.find_spec('tensorflow') is None:
+        raise RuntimeError(' [!] TensorFlow is not installed.')
+    return importlib.import_module('tensorflow')
+
+
+def text_to_seqvec(text, CONFIG, frontend=None):
     # text ot phonemes to sequence vector
-    if CONFIG.use_phonemes:
-        seq = np.asarray(
-            phoneme_to_sequence(text, text_cleaner, CONFIG.phoneme_language,
-                                CONFIG.enable_eos_bos_chars,
-                                tp=CONFIG.characters if 'characters' in CONFIG.keys() else None),
-            dtype=np.int32)
-    else:
-        seq = np.asarray(text_to_sequence(text, text_cleaner, tp=CONFIG.characters if 'characters' in CONFIG.keys() else None), dtype=np.int32)
-    return seq
+    if frontend is None:
+        frontend = TextFrontend.from_config(CONFIG)
+    return np.asarray(frontend.encode(text), dtype=np.int32)
+
+
+def get_torch():
+    """Import PyTorch on first use, the onnxruntime backend runs without it."""
+    return importlib.import_module('torch')
 
 
 def numpy_to_torch(np_array, dtype, cuda=False):
     if np_array is None:
         return None
+    torch = get_torch()
     tensor = torch.as_tensor(np_array, dtype=dtype)
     if cuda:
         return tensor.cuda()
@@ -34,11 +39,12 @@ def numpy_to_torch(np_array, dtype, cuda=False):
 def numpy_to_tf(np_array, dtype):
     if np_array is None:
         return None
-    tensor = tf.convert_to_tensor(np_array, dtype=dtype)
+    tensor = get_tf().convert_to_tensor(np_array, dtype=dtype)
     return tensor
 
 
 def compute_style_mel(style_wav, ap, cuda=False):
+    torch = get_torch()
     style_mel = torch.FloatTensor(ap.melspectrogram(
         ap.load_wav(style_wav))).unsqueeze(0)
     if cuda:
@@ -46,17 +52,33 @@ def compute_style_mel(style_wav, ap, cuda=False):
     return style_mel
 
 
-def run_model_torch(model, inputs, CONFIG, truncated, speaker_id=None, style_mel=None):
+def run_model_torch(model, inputs, CONFIG, truncated, speaker_id=None, style_mel=None,
+                    encoder_cache=None, model_key=None, lean=False, max_decoder_steps=None,
+                    cancel_event=None, decoder_state=None):
+    # lean: only the mel outputs are collected by the decoder
+    # truncated: continues ``decoder_state`` and returns the new state as well
+    outputs = dict(return_alignments=False, return_stop_tokens=False) if lean else {}
+    if max_decoder_steps is not None:
+        outputs['max_decoder_steps'] = max_decoder_steps
+    if cancel_event is not None:
+        outputs['cancel_event'] = cancel_event
+    encoder_outputs = None
+    if not truncated and hasattr(model, 'encode'):
+        with metrics.stage('encoder', tokens=inputs.size(1)):
+            if encoder_cache is not None:
+                encoder_outputs = encoder_cache.get_or_compute(model, inputs, model_key)
+            else:
+                encoder_outputs = model.encode(inputs)
+    if truncated:
+        return model.inference_truncated(inputs, speaker_ids=speaker_id, input_style=style_mel,
+                                         decoder_state=decoder_state)
     if CONFIG.use_gst:
         decoder_output, postnet_output, alignments, stop_tokens = model.inference(
-            inputs, input_style=style_mel, speaker_ids=speaker_id)
+            inputs, input_style=style_mel, speaker_ids=speaker_id,
+            encoder_outputs=encoder_outputs, **outputs)
     else:
-        if truncated:
-            decoder_output, postnet_output, alignments, stop_tokens = model.inference_truncated(
-                inputs, speaker_ids=speaker_id)
-        else:
-            decoder_output, postnet_output, alignments, stop_tokens = model.inference(
-                inputs, speaker_ids=speaker_id)
+        decoder_output, postnet_output, alignments, stop_tokens = model.inference(
+            inputs, speaker_ids=speaker_id, encoder_outputs=encoder_outputs, **outputs)
     return decoder_output, postnet_output, alignments, stop_tokens
 
 
@@ -81,6 +103,10 @@ def parse_outputs_torch(postnet_output, decoder_output, alignments, stop_tokens)
     return postnet_output, decoder_output, alignment, stop_tokens
 
 
+def parse_outputs_lean_torch(postnet_output):
+    return postnet_output[0].data.cpu().numpy(), None, None, None
+
+
 def parse_outputs_tf(postnet_output, decoder_output, alignments, stop_tokens):
     postnet_output = postnet_output[0].numpy()
     decoder_output = decoder_output[0].numpy()
@@ -89,6 +115,10 @@ def parse_outputs_tf(postnet_output, decoder_output, alignments, stop_tokens):
     return postnet_output, decoder_output, alignment, stop_tokens
 
 
+def parse_outputs_numpy(postnet_output, decoder_output, alignments, stop_tokens):
+    return postnet_output[0], decoder_output[0], alignments[0], stop_tokens[0]
+
+
 def trim_silence(wav, ap):
     return wav[:ap.find_endpoint(wav)]
 
@@ -107,7 +137,7 @@ def inv_spectrogram(postnet_output, ap, CONFIG):
 def id_to_torch(speaker_id, cuda=False):
     if speaker_id is not None:
         speaker_id = np.asarray(speaker_id)
-        speaker_id = torch.from_numpy(speaker_id).unsqueeze(0)
+        speaker_id = get_torch().from_numpy(speaker_id).unsqueeze(0)
     if cuda:
         return speaker_id.cuda()
     return speaker_id
@@ -142,7 +172,15 @@ def synthesis(model,
               enable_eos_bos_chars=False, #pylint: disable=unused-argument
               use_griffin_lim=False,
               do_trim_silence=False,
-              backend='torch'):
+              backend='torch',
+              encoder_cache=None,
+              model_key=None,
+              lean=False,
+              frontend=None,
+              max_decoder_steps=None,
+              tokens=None,
+              cancel_event=None,
+              decoder_state=None):
     """Synthesize voice for the given text.
 
         Args:
@@ -155,10 +193,27 @@ def synthesis(model,
             speaker_id (int): id of speaker
             style_input (str): Uses for style embedding of GST.
             truncated (bool): keep model states after inference. It can be used
-                for continuous inference at long texts.
+                for continuous inference at long texts, the decoder state is
+                returned as the last output. Torch backend only.
             enable_eos_bos_chars (bool): enable special chars for end of sentence and start of sentence.
             do_trim_silence (bool): trim silence after synthesis.
-            backend (str): tf or torch
+            backend (str or TTS_lib.utils.backends.InferenceBackend): tf, torch
+                or a backend instance e.g. for TorchScript or onnxruntime.
+            encoder_cache (TTS_lib.utils.cache.EncoderCache): reuse encoder
+                outputs of previously seen token sequences.
+            model_key (hashable): identity of the loaded model weights used as
+                part of the encoder cache key.
+            lean (bool): only return the waveform and postnet output,
+                alignment, decoder output and stop tokens are None.
+            frontend (TTS_lib.utils.text.TextFrontend): text frontend of the
+                model, created from CONFIG if None.
+            max_decoder_steps (int): step limit of the torch or backend decoder
+                for this text, e.g. from a ``TTS_lib.utils.duration.DurationEstimator``.
+            tokens (list): token ids of ``text`` if it was already encoded.
+            cancel_event (threading.Event): stops the torch or backend decoder at
+                the next step once set, see ``TTS_lib.utils.backends.DecodingCancelled``.
+            decoder_state (TTS_lib.layers.tacotron2.DecoderState): state returned
+                by the previous ``truncated`` call, None starts a new utterance.
     """
     # GST processing
     style_mel = None
@@ -168,9 +223,18 @@ def synthesis(model,
         else:
             style_mel = compute_style_mel(style_input, ap)
     # preprocess the given text
-    inputs = text_to_seqvec(text, CONFIG)
+    if tokens is not None:
+        inputs = np.asarray(tokens, dtype=np.int32)
+    else:
+        with metrics.stage('phonemization' if CONFIG.use_phonemes else 'text_to_sequence', chars=len(text)):
+            inputs = text_to_seqvec(text, CONFIG, frontend)
     # pass tensors to backend
-    if backend == 'torch':
+    if isinstance(backend, InferenceBackend):
+        inputs = inputs[None].astype(np.int64)
+        if style_mel is not None and not isinstance(style_mel, dict):
+            style_mel = style_mel.cpu().numpy()
+    elif backend == 'torch':
+        torch = get_torch()
         if speaker_id is not None:
             speaker_id = id_to_torch(speaker_id, cuda=use_cuda)
         if not isinstance(style_mel, dict):
@@ -179,15 +243,34 @@ def synthesis(model,
         inputs = inputs.unsqueeze(0)
     else:
         # TODO: handle speaker id for tf model
+        tf = get_tf()
         style_mel = numpy_to_tf(style_mel, tf.float32)
         inputs = numpy_to_tf(inputs, tf.int32)
         inputs = tf.expand_dims(inputs, 0)
     # synthesize voice
-    if backend == 'torch':
-        decoder_output, postnet_output, alignments, stop_tokens = run_model_torch(
-            model, inputs, CONFIG, truncated, speaker_id, style_mel)
-        postnet_output, decoder_output, alignment, stop_tokens = parse_outputs_torch(
+    if isinstance(backend, InferenceBackend):
+        with metrics.stage('acoustic_model', backend=backend.name, tokens=inputs.shape[1]):
+            decoder_output, postnet_output, alignments, stop_tokens = backend.inference(
+                inputs, speaker_id, style_mel, max_decoder_steps=max_decoder_steps, cancel_event=cancel_event)
+        postnet_output, decoder_output, alignment, stop_tokens = parse_outputs_numpy(
             postnet_output, decoder_output, alignments, stop_tokens)
+        if lean:
+            decoder_output, alignment, stop_tokens = None, None, None
+    elif backend == 'torch':
+        outputs = run_model_torch(
+            model, inputs, CONFIG, truncated, speaker_id, style_mel,
+            encoder_cache=encoder_cache, model_key=model_key, lean=lean,
+            max_decoder_steps=max_decoder_steps, cancel_event=cancel_event,
+            decoder_state=decoder_state)
+        decoder_output, postnet_output, alignments, stop_tokens = outputs[:4]
+        if truncated:
+            decoder_state = outputs[4]
+        if lean:
+            postnet_output, decoder_output, alignment, stop_tokens = parse_outputs_lean_torch(
+                postnet_output)
+        else:
+            postnet_output, decoder_output, alignment, stop_tokens = parse_outputs_torch(
+                postnet_output, decoder_output, alignments, stop_tokens)
     else:
         decoder_output, postnet_output, alignments, stop_tokens = run_model_tf(
             model, inputs, CONFIG, truncated, speaker_id, style_mel)
@@ -197,8 +280,11 @@ def synthesis(model,
     # plot results
     wav = None
     if use_griffin_lim:
-        wav = inv_spectrogram(postnet_output, ap, CONFIG)
-        # trim silence
-        if do_trim_silence:
-            wav = trim_silence(wav, ap)
+        with metrics.stage('vocoder', vocoder='GriffinLim', frames=postnet_output.shape[0]):
+            wav = inv_spectrogram(postnet_output, ap, CONFIG)
+            # trim silence
+            if do_trim_silence:
+                wav = trim_silence(wav, ap)
+    if truncated:
+        return wav, alignment, decoder_output, postnet_output, stop_tokens, inputs, decoder_state
     return wav, alignment, decoder_output, postnet_output, stop_tokens, inputs
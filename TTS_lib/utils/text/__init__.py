@@ -1,19 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import re
-from packaging import version
-import phonemizer
-from phonemizer.phonemize import phonemize
 from TTS_lib.utils.text import cleaners
 from TTS_lib.utils.text.symbols import make_symbols, symbols, phonemes, _phoneme_punctuations, _bos, \
     _eos
+from TTS_lib.utils.logger import get_logger
 
-# Mappings from symbol to numeric ID and vice versa:
-_symbol_to_id = {s: i for i, s in enumerate(symbols)}
-_id_to_symbol = {i: s for i, s in enumerate(symbols)}
-
-_phonemes_to_id = {s: i for i, s in enumerate(phonemes)}
-_id_to_phonemes = {i: s for i, s in enumerate(phonemes)}
+logger = get_logger('text')
 
 # Regular expression matching text enclosed in curly braces:
 _CURLY_RE = re.compile(r'(.*?)\{(.+?)\}(.*)')
@@ -26,6 +19,11 @@ def text2phone(text, language):
     '''
     Convert graphemes to phonemes.
     '''
+    # phonemizer is only imported by models with phonemes, on their first sentence
+    # pylint: disable=import-outside-toplevel
+    from packaging import version
+    import phonemizer
+    from phonemizer.phonemize import phonemize
     seperator = phonemizer.separator.Separator(' |', '', '|')
     #try:
     punctuations = re.findall(PHONEME_PUNCTUATION_PATTERN, text)
@@ -57,54 +55,173 @@ def text2phone(text, language):
     return ph
 
 
-def pad_with_eos_bos(phoneme_sequence, tp=None):
-    # pylint: disable=global-statement
-    global _phonemes_to_id, _bos, _eos
-    if tp:
-        _bos = tp['bos']
-        _eos = tp['eos']
-        _, _phonemes = make_symbols(**tp)
-        _phonemes_to_id = {s: i for i, s in enumerate(_phonemes)}
+class TextFrontend():
+    """Text to id sequence conversion of one model config.
+
+    The frontend owns the cleaners, the vocabulary and the phonemizer
+    settings and is not modified after construction. One instance can be
+    shared by threads and pickled to worker processes, e.g. to prepare the
+    next sentences while the model is decoding.
+
+    Args:
+        cleaner_names (list): names of the functions in ``cleaners``.
+        characters (dict): custom vocabulary, the ``characters`` entry of
+            config.json. Defaults to ``symbols.symbols``/``symbols.phonemes``.
+        use_phonemes (bool): convert the text to phonemes before encoding.
+        phoneme_language (str): espeak language of the phonemizer.
+        enable_eos_bos (bool): pad phoneme sequences with eos and bos ids.
+    """
+    def __init__(self, cleaner_names, characters=None, use_phonemes=False,
+                 phoneme_language=None, enable_eos_bos=False):
+        self.cleaner_names = list(cleaner_names)
+        self.characters = dict(characters) if characters else None
+        self.use_phonemes = use_phonemes
+        self.phoneme_language = phoneme_language
+        self.enable_eos_bos = enable_eos_bos
+        if self.characters:
+            self.symbols, self.phonemes = make_symbols(**self.characters)
+            self.bos = self.characters.get('bos', _bos)
+            self.eos = self.characters.get('eos', _eos)
+        else:
+            self.symbols, self.phonemes = list(symbols), list(phonemes)
+            self.bos, self.eos = _bos, _eos
+        # Mappings from symbol to numeric ID and vice versa:
+        self.symbol_to_id = {s: i for i, s in enumerate(self.symbols)}
+        self.id_to_symbol = {i: s for i, s in enumerate(self.symbols)}
+        self.phonemes_to_id = {s: i for i, s in enumerate(self.phonemes)}
+        self.id_to_phonemes = {i: s for i, s in enumerate(self.phonemes)}
+
+    @classmethod
+    def from_config(cls, CONFIG):
+        return cls([CONFIG.text_cleaner],
+                   characters=CONFIG.characters if 'characters' in CONFIG.keys() else None,
+                   use_phonemes=CONFIG.use_phonemes,
+                   phoneme_language=CONFIG.get('phoneme_language', None),
+                   enable_eos_bos=CONFIG.get('enable_eos_bos_chars', False))
+
+    @property
+    def num_chars(self):
+        """Size of the input embedding of models using this frontend."""
+        return len(self.phonemes) if self.use_phonemes else len(self.symbols)
+
+    def encode(self, text):
+        """Text -> list of ids, phonemized if the config uses phonemes."""
+        if self.use_phonemes:
+            return self.phoneme_to_sequence(text)
+        return self.text_to_sequence(text)
+
+    def decode(self, sequence):
+        if self.use_phonemes:
+            return self.sequence_to_phoneme(sequence)
+        return self.sequence_to_text(sequence)
+
+    def clean(self, text):
+        return _clean_text(text, self.cleaner_names)
+
+    def pad_with_eos_bos(self, phoneme_sequence):
+        return [self.phonemes_to_id[self.bos]] + list(phoneme_sequence) + [self.phonemes_to_id[self.eos]]
+
+    def phoneme_to_sequence(self, text):
+        sequence = []
+        text = text.replace(":", "")
+        clean_text = self.clean(text)
+        to_phonemes = text2phone(clean_text, self.phoneme_language)
+        if to_phonemes is None:
+            logger.warning("!! After phoneme conversion the result is None. -- %s ", clean_text)
+        # iterate by skipping empty strings - NOTE: might be useful to keep it to have a better intonation.
+        for phoneme in filter(None, to_phonemes.split('|')):
+            sequence += self._phoneme_to_sequence(phoneme)
+        # Append EOS char
+        if self.enable_eos_bos:
+            sequence = self.pad_with_eos_bos(sequence)
+        return sequence
+
+    def sequence_to_phoneme(self, sequence):
+        '''Converts a sequence of IDs back to a string'''
+        result = ''
+        for symbol_id in sequence:
+            if symbol_id in self.id_to_phonemes:
+                s = self.id_to_phonemes[symbol_id]
+                result += s
+        return result.replace('}{', ' ')
+
+    def text_to_sequence(self, text):
+        '''Converts a string of text to a sequence of IDs corresponding to the symbols in the text.
+
+          The text can optionally have ARPAbet sequences enclosed in curly braces embedded
+          in it. For example, "Turn left on {HH AW1 S S T AH0 N} Street."
+        '''
+        sequence = []
+        # Check for curly braces and treat their contents as ARPAbet:
+        while text:
+            m = _CURLY_RE.match(text)
+            if not m:
+                sequence += self._symbols_to_sequence(self.clean(text))
+                break
+            sequence += self._symbols_to_sequence(self.clean(m.group(1)))
+            sequence += self._arpabet_to_sequence(m.group(2))
+            text = m.group(3)
+        return sequence
+
+    def sequence_to_text(self, sequence):
+        '''Converts a sequence of IDs back to a string'''
+        result = ''
+        for symbol_id in sequence:
+            if symbol_id in self.id_to_symbol:
+                s = self.id_to_symbol[symbol_id]
+                # Enclose ARPAbet back in curly braces:
+                if len(s) > 1 and s[0] == '@':
+                    s = '{%s}' % s[1:]
+                result += s
+        return result.replace('}{', ' ')
+
+    def _symbols_to_sequence(self, syms):
+        return [self.symbol_to_id[s] for s in syms if self._should_keep_symbol(s)]
+
+    def _phoneme_to_sequence(self, phons):
+        return [self.phonemes_to_id[s] for s in list(phons) if self._should_keep_phoneme(s)]
+
+    def _arpabet_to_sequence(self, text):
+        return self._symbols_to_sequence(['@' + s for s in text.split()])
+
+    def _should_keep_symbol(self, s):
+        return s in self.symbol_to_id and s not in ['~', '^', '_']
+
+    def _should_keep_phoneme(self, p):
+        return p in self.phonemes_to_id and p not in ['~', '^', '_']
+
+
+# frontends of the module level functions by their arguments
+_frontends = {}
+
+
+def get_frontend(cleaner_names=(), tp=None, use_phonemes=False, language=None, enable_eos_bos=False):
+    """Shared TextFrontend for the given settings."""
+    key = (tuple(cleaner_names), tuple(sorted(tp.items())) if tp else None,
+           use_phonemes, language, enable_eos_bos)
+    frontend = _frontends.get(key)
+    if frontend is None:
+        frontend = TextFrontend(cleaner_names, characters=tp, use_phonemes=use_phonemes,
+                                phoneme_language=language, enable_eos_bos=enable_eos_bos)
+        if len(_frontends) > 64:
+            _frontends.clear()
+        _frontends[key] = frontend
+    return frontend
 
-    return [_phonemes_to_id[_bos]] + list(phoneme_sequence) + [_phonemes_to_id[_eos]]
+
+def pad_with_eos_bos(phoneme_sequence, tp=None):
+    return get_frontend(tp=tp).pad_with_eos_bos(phoneme_sequence)
 
 
 def phoneme_to_sequence(text, cleaner_names, language, enable_eos_bos=False, tp=None):
-    # pylint: disable=global-statement
-    global _phonemes_to_id
-    if tp:
-        _, _phonemes = make_symbols(**tp)
-        _phonemes_to_id = {s: i for i, s in enumerate(_phonemes)}
-
-    sequence = []
-    text = text.replace(":", "")
-    clean_text = _clean_text(text, cleaner_names)
-    to_phonemes = text2phone(clean_text, language)
-    if to_phonemes is None:
-        print("!! After phoneme conversion the result is None. -- {} ".format(clean_text))
-    # iterate by skipping empty strings - NOTE: might be useful to keep it to have a better intonation.
-    for phoneme in filter(None, to_phonemes.split('|')):
-        sequence += _phoneme_to_sequence(phoneme)
-    # Append EOS char
-    if enable_eos_bos:
-        sequence = pad_with_eos_bos(sequence, tp=tp)
-    return sequence
+    frontend = get_frontend(cleaner_names, tp, use_phonemes=True, language=language,
+                            enable_eos_bos=enable_eos_bos)
+    return frontend.phoneme_to_sequence(text)
 
 
 def sequence_to_phoneme(sequence, tp=None):
-    # pylint: disable=global-statement
     '''Converts a sequence of IDs back to a string'''
-    global _id_to_phonemes
-    result = ''
-    if tp:
-        _, _phonemes = make_symbols(**tp)
-        _id_to_phonemes = {i: s for i, s in enumerate(_phonemes)}
-
-    for symbol_id in sequence:
-        if symbol_id in _id_to_phonemes:
-            s = _id_to_phonemes[symbol_id]
-            result += s
-    return result.replace('}{', ' ')
+    return get_frontend(tp=tp).sequence_to_phoneme(sequence)
 
 
 def text_to_sequence(text, cleaner_names, tp=None):
@@ -120,43 +237,12 @@ def text_to_sequence(text, cleaner_names, tp=None):
       Returns:
         List of integers corresponding to the symbols in the text
     '''
-    # pylint: disable=global-statement
-    global _symbol_to_id
-    if tp:
-        _symbols, _ = make_symbols(**tp)
-        _symbol_to_id = {s: i for i, s in enumerate(_symbols)}
-
-    sequence = []
-    # Check for curly braces and treat their contents as ARPAbet:
-    while text:
-        m = _CURLY_RE.match(text)
-        if not m:
-            sequence += _symbols_to_sequence(_clean_text(text, cleaner_names))
-            break
-        sequence += _symbols_to_sequence(
-            _clean_text(m.group(1), cleaner_names))
-        sequence += _arpabet_to_sequence(m.group(2))
-        text = m.group(3)
-    return sequence
+    return get_frontend(cleaner_names, tp).text_to_sequence(text)
 
 
 def sequence_to_text(sequence, tp=None):
     '''Converts a sequence of IDs back to a string'''
-    # pylint: disable=global-statement
-    global _id_to_symbol
-    if tp:
-        _symbols, _ = make_symbols(**tp)
-        _id_to_symbol = {i: s for i, s in enumerate(_symbols)}
-
-    result = ''
-    for symbol_id in sequence:
-        if symbol_id in _id_to_symbol:
-            s = _id_to_symbol[symbol_id]
-            # Enclose ARPAbet back in curly braces:
-            if len(s) > 1 and s[0] == '@':
-                s = '{%s}' % s[1:]
-            result += s
-    return result.replace('}{', ' ')
+    return get_frontend(tp=tp).sequence_to_text(sequence)
 
 
 def _clean_text(text, cleaner_names):
@@ -166,23 +252,3 @@ def _clean_text(text, cleaner_names):
             raise Exception('Unknown cleaner: %s' % name)
         text = cleaner(text)
     return text
-
-
-def _symbols_to_sequence(syms):
-    return [_symbol_to_id[s] for s in syms if _should_keep_symbol(s)]
-
-
-def _phoneme_to_sequence(phons):
-    return [_phonemes_to_id[s] for s in list(phons) if _should_keep_phoneme(s)]
-
-
-def _arpabet_to_sequence(text):
-    return _symbols_to_sequence(['@' + s for s in text.split()])
-
-
-def _should_keep_symbol(s):
-    return s in _symbol_to_id and s not in ['~', '^', '_']
-
-
-def _should_keep_phoneme(p):
-    return p in _phonemes_to_id and p not in ['~', '^', '_']
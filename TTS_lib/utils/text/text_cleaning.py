@@ -4,6 +4,10 @@ import re
 
 import num2words
 
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('text')
+
 #
 #   Number patterns
 #
@@ -144,8 +148,8 @@ def clean_word(word):
     bad_chars = get_bad_character(word)
 
     if len(bad_chars) > 0:
-        print('Bad characters in "{}"'.format(word))
-        print('--> {}'.format(', '.join(bad_chars)))
+        logger.warning('Bad characters in "%s"', word)
+        logger.warning('--> %s', ', '.join(bad_chars))
 
     return word
 
@@ -0,0 +1,206 @@
+"""Minimal asyncio WebSocket server (RFC 6455), no dependencies besides the
+standard library, like the metrics server in ``TTS_lib.utils.metrics``.
+
+    async def echo(socket):
+        while True:
+            message = await socket.recv()
+            if message is None:
+                break
+            await socket.send(message)
+
+    server = await serve(echo, 'localhost', 8765)
+
+Text messages are received as str, binary ones as bytes. Fragmented
+messages are joined, pings are answered. Extensions (compression) are not
+negotiated.
+
+Browsers let any web page open connections to local servers, so requests
+with an ``Origin`` header are only accepted from localhost pages or the
+``allowed_origins`` of ``serve``. Clients outside of browsers send no
+``Origin`` and are always accepted.
+"""
+import base64
+import asyncio
+import hashlib
+import struct
+from urllib.parse import urlsplit
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('websocket')
+
+_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+# largest message accepted from a client
+MAX_MESSAGE_SIZE = 1 << 20
+# pages of these hosts may always connect
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + _GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def origin_allowed(origin, allowed_origins=()):
+    """True for requests without ``Origin``, from localhost pages or from
+    one of ``allowed_origins`` (e.g. ``https://tools.example.org``)."""
+    if origin is None:
+        return True
+    if origin.rstrip('/') in {allowed.rstrip('/') for allowed in allowed_origins}:
+        return True
+    try:
+        return urlsplit(origin).hostname in LOCAL_HOSTS
+    except ValueError:
+        return False
+
+
+async def handshake(reader, writer, allowed_origins=()):
+    """Read the upgrade request and answer it. Returns the request path or
+    None if it was not a WebSocket request or its origin is not allowed."""
+    request = await reader.readuntil(b'\r\n\r\n')
+    lines = request.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    key = headers.get('sec-websocket-key')
+    if len(parts) < 2 or parts[0] != 'GET' or 'websocket' not in headers.get('upgrade', '').lower() or not key:
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        await writer.drain()
+        return None
+    if not origin_allowed(headers.get('origin'), allowed_origins):
+        logger.warning(" [!] Rejected a WebSocket request from %s", headers.get('origin'))
+        writer.write(b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        await writer.drain()
+        return None
+    writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                  'Sec-WebSocket-Accept: {}\r\n\r\n').format(accept_key(key)).encode('ascii'))
+    await writer.drain()
+    return parts[1]
+
+
+def encode_frame(opcode, payload, mask=None):
+    """A single final frame, ``mask`` (4 bytes) for client frames."""
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask is not None else 0
+    if len(payload) < 126:
+        header.append(mask_bit | len(payload))
+    elif len(payload) < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', len(payload))
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', len(payload))
+    if mask is not None:
+        header += mask
+        payload = _apply_mask(payload, mask)
+    return bytes(header) + bytes(payload)
+
+
+def _apply_mask(payload, mask):
+    # xor with the repeated 4 byte mask, as one big integer operation
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+
+class WebSocket():
+    """Server side of an upgraded connection."""
+    def __init__(self, reader, writer, path='/'):
+        self.reader = reader
+        self.writer = writer
+        self.path = path
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+
+    async def _read_frame(self):
+        first, second = await self.reader.readexactly(2)
+        fin, opcode = first & 0x80, first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+        if length > MAX_MESSAGE_SIZE:
+            raise ConnectionClosed('frame of {} bytes'.format(length))
+        mask = await self.reader.readexactly(4) if second & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask is not None:
+            payload = _apply_mask(payload, mask)
+        return fin, opcode, payload
+
+    async def recv(self):
+        """Next message, None once the connection is closed."""
+        message, message_opcode = b'', None
+        try:
+            while True:
+                fin, opcode, payload = await self._read_frame()
+                if opcode == OP_PING:
+                    await self._send_frame(OP_PONG, payload)
+                    continue
+                if opcode == OP_PONG:
+                    continue
+                if opcode == OP_CLOSE:
+                    await self.close()
+                    return None
+                if opcode != OP_CONTINUATION:
+                    message_opcode = opcode
+                message += payload
+                if len(message) > MAX_MESSAGE_SIZE:
+                    raise ConnectionClosed('message too large')
+                if fin:
+                    return message.decode('utf8') if message_opcode == OP_TEXT else message
+        except (asyncio.IncompleteReadError, ConnectionError, ConnectionClosed):
+            self.closed = True
+            return None
+
+    async def _send_frame(self, opcode, payload):
+        if self.closed:
+            raise ConnectionClosed()
+        async with self._send_lock:
+            self.writer.write(encode_frame(opcode, payload))
+            await self.writer.drain()
+
+    async def send(self, message):
+        """Send a str as text or bytes as a binary message."""
+        if isinstance(message, str):
+            await self._send_frame(OP_TEXT, message.encode('utf8'))
+        else:
+            await self._send_frame(OP_BINARY, message)
+
+    async def close(self, code=1000):
+        if self.closed:
+            return
+        try:
+            await self._send_frame(OP_CLOSE, struct.pack('!H', code))
+        except (ConnectionError, ConnectionClosed):
+            pass
+        self.closed = True
+        self.writer.close()
+
+
+async def serve(handler, host='localhost', port=8765, allowed_origins=()):
+    """Start a server calling ``await handler(socket)`` for every connection,
+    ``allowed_origins`` are the web pages besides localhost allowed to connect."""
+    async def on_connection(reader, writer):
+        try:
+            path = await handshake(reader, writer, allowed_origins)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            path = None
+        if path is None:
+            writer.close()
+            return
+        socket = WebSocket(reader, writer, path)
+        try:
+            await handler(socket)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(" [!] WebSocket handler failed: %s", e)
+        finally:
+            await socket.close()
+
+    return await asyncio.start_server(on_connection, host, port)
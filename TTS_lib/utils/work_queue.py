@@ -0,0 +1,287 @@
+"""Leased work items in a folder on storage shared by several hosts.
+
+    queue/
+        job.json            settings of the job
+        items/<id>.json     payload of every work item
+        leases/<id>.json    worker, expiry and attempt of claimed items
+        attempts/<id>.<n>   one empty file per claimed attempt
+        done/<id>.json      results
+        failed/<id>.json    items that failed ``max_attempts`` times
+
+    queue = WorkQueue.create('/net/render/queue', settings, payloads)
+    ...
+    queue = WorkQueue('/net/render/queue')
+    work(queue, handler)  # on any number of hosts
+
+Workers claim attempt n of an item by creating ``attempts/<id>.<n>``
+exclusively, so every attempt is counted once even if its worker dies right
+away, then write the lease and renew it while they work on the item. The
+lease of a crashed or disconnected worker expires and the item is claimed
+again, a failing item is released at once. Only files are created
+exclusively and replaced atomically, no file locks, so any shared file
+system (NFS, SMB) works; the clocks of the hosts have to be synchronized to
+well below the lease time.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+
+from TTS_lib.utils.logger import get_logger
+
+logger = get_logger('work_queue')
+
+
+def write_json(path, data):
+    """Write ``data`` to ``path`` atomically."""
+    tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex[:8])
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    """Contents of ``path``, None if it does not exist or is being written."""
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class WorkItem():
+    def __init__(self, item_id, payload, attempt):
+        self.id = item_id
+        self.payload = payload
+        self.attempt = attempt
+
+
+class WorkQueue():
+    """Work items in the folder ``path``.
+
+    Args:
+        path (str): queue folder on shared storage.
+        lease_seconds (float): a claimed item is requeued if its lease is
+            not renewed for this long.
+        max_attempts (int): claims of an item before it is marked failed.
+        worker_id (str): name of this worker in the leases, default
+            ``<host>-<pid>-<random>``.
+    """
+    def __init__(self, path, lease_seconds=300.0, max_attempts=3, worker_id=None):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or '{}-{}-{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+        self.settings = read_json(os.path.join(path, 'job.json'))
+        if self.settings is None:
+            raise FileNotFoundError(" [!] No work queue in {}".format(path))
+        self._item_ids = None
+
+    @classmethod
+    def create(cls, path, settings, payloads, **kwargs):
+        """Queue ``payloads`` (json serializable) in the new folder ``path``."""
+        if os.path.exists(os.path.join(path, 'job.json')):
+            raise FileExistsError(" [!] {} already holds a work queue".format(path))
+        for folder in ('items', 'leases', 'attempts', 'done', 'failed'):
+            os.makedirs(os.path.join(path, folder), exist_ok=True)
+        for idx, payload in enumerate(payloads):
+            write_json(os.path.join(path, 'items', '{:06d}.json'.format(idx)), payload)
+        # written last, workers only start on complete queues
+        write_json(os.path.join(path, 'job.json'), dict(settings, created=time.time()))
+        return cls(path, **kwargs)
+
+    def _file(self, folder, item_id):
+        return os.path.join(self.path, folder, item_id + '.json')
+
+    def item_ids(self):
+        if self._item_ids is None:
+            self._item_ids = sorted(name[:-len('.json')] for name in os.listdir(os.path.join(self.path, 'items'))
+                                    if name.endswith('.json'))
+        return self._item_ids
+
+    def _finished_ids(self, folder):
+        return {name[:-len('.json')] for name in os.listdir(os.path.join(self.path, folder))
+                if name.endswith('.json')}
+
+    def _attempts(self):
+        """{item id: number of its last claimed attempt}"""
+        attempts = {}
+        for name in os.listdir(os.path.join(self.path, 'attempts')):
+            item_id, _, attempt = name.rpartition('.')
+            if attempt.isdigit():
+                attempts[item_id] = max(attempts.get(item_id, 0), int(attempt))
+        return attempts
+
+    def _lease_state(self, item_id, attempt):
+        """(lease or None, expiry) of the last claimed ``attempt`` of ``item_id``."""
+        if attempt == 0:
+            return None, 0.0
+        lease = read_json(self._file('leases', item_id))
+        if lease is not None and lease.get('attempt') == attempt:
+            return lease, lease['expires']
+        # claimed, but the worker has not written its lease yet or died before
+        try:
+            claimed = os.path.getmtime(self._attempt_file(item_id, attempt))
+        except FileNotFoundError:
+            return None, 0.0
+        return None, claimed + self.lease_seconds
+
+    def _attempt_file(self, item_id, attempt):
+        return os.path.join(self.path, 'attempts', '{}.{}'.format(item_id, attempt))
+
+    def claim(self):
+        """Lease the next open item, None if every item is done, failed or leased."""
+        finished = self._finished_ids('done') | self._finished_ids('failed')
+        attempts = self._attempts()
+        for item_id in self.item_ids():
+            if item_id in finished:
+                continue
+            attempt = attempts.get(item_id, 0)
+            lease, expires = self._lease_state(item_id, attempt)
+            if expires > time.time():
+                continue
+            error = lease.get('error') if lease is not None else None
+            if attempt >= self.max_attempts:
+                logger.error(" [!] Item %s failed %d times: %s", item_id, attempt, error)
+                write_json(self._file('failed', item_id), {'attempts': attempt, 'error': error})
+                continue
+            if attempt > 0:
+                logger.warning(" [!] Item %s of %s is claimed again%s", item_id,
+                               lease.get('worker') if lease is not None else None,
+                               ', it failed: {}'.format(error) if error else '')
+            attempt += 1
+            try:
+                # only one worker gets an attempt, it is counted even if the worker dies
+                os.close(os.open(self._attempt_file(item_id, attempt), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            self._write_lease(item_id, attempt)
+            if os.path.exists(self._file('done', item_id)) or os.path.exists(self._file('failed', item_id)):
+                # finished and its lease removed since the listing
+                os.remove(self._file('leases', item_id))
+                continue
+            payload = read_json(self._file('items', item_id))
+            return WorkItem(item_id, payload, attempt)
+        return None
+
+    def _lease(self, attempt, expires=None, error=None):
+        lease = {'worker': self.worker_id, 'attempt': attempt,
+                 'expires': time.time() + self.lease_seconds if expires is None else expires}
+        if error is not None:
+            lease['error'] = error
+        return lease
+
+    def _write_lease(self, item_id, attempt, expires=None, error=None):
+        write_json(self._file('leases', item_id), self._lease(attempt, expires, error))
+
+    def owns(self, item):
+        lease = read_json(self._file('leases', item.id))
+        return lease is not None and lease['worker'] == self.worker_id and lease['attempt'] == item.attempt
+
+    def renew(self, item):
+        """Extend the lease of ``item``, False if it was lost to another worker."""
+        if not self.owns(item):
+            return False
+        self._write_lease(item.id, item.attempt)
+        return True
+
+    def complete(self, item, result=None):
+        write_json(self._file('done', item.id), {'worker': self.worker_id, 'attempt': item.attempt,
+                                                 'finished': time.time(), 'result': result})
+        if self.owns(item):
+            os.remove(self._file('leases', item.id))
+
+    def release(self, item, error):
+        """Give a failed item back, it is claimed again or marked failed
+        after ``max_attempts``."""
+        if self.owns(item):
+            self._write_lease(item.id, item.attempt, expires=0.0, error=repr(error))
+
+    def results(self):
+        """{item id: result} of the done items."""
+        return {item_id: read_json(self._file('done', item_id))['result']
+                for item_id in sorted(self._finished_ids('done'))}
+
+    def payload(self, item_id):
+        return read_json(self._file('items', item_id))
+
+    def failed(self):
+        return {item_id: read_json(self._file('failed', item_id)) for item_id in sorted(self._finished_ids('failed'))}
+
+    def status(self):
+        done, failed = self._finished_ids('done'), self._finished_ids('failed')
+        attempts = self._attempts()
+        leased = 0
+        for item_id in self.item_ids():
+            if item_id in done or item_id in failed:
+                continue
+            if self._lease_state(item_id, attempts.get(item_id, 0))[1] > time.time():
+                leased += 1
+        total = len(self.item_ids())
+        return {'items': total, 'done': len(done), 'failed': len(failed), 'leased': leased,
+                'queued': total - len(done) - len(failed) - leased}
+
+    @property
+    def finished(self):
+        status = self.status()
+        return status['done'] + status['failed'] == status['items']
+
+
+class LeaseKeeper():
+    """Renews the lease of ``item`` from a background thread while in the ``with`` block."""
+    def __init__(self, queue, item):
+        self.queue = queue
+        self.item = item
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, name='tts_lease', daemon=True)
+
+    def _renew(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                if not self.queue.renew(self.item):
+                    logger.warning(" [!] Lost the lease of item %s", self.item.id)
+                    self.lost = True
+                    return
+            except OSError as e:
+                # the share may be back before the lease expires
+                logger.warning(" [!] Renewing the lease of item %s failed: %s", self.item.id, e)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def work(queue, handler, poll_seconds=10.0, max_items=None):
+    """Claim items and ``complete`` them with ``handler(payload)`` until the
+    queue is finished. Items leased by other workers are waited for, their
+    leases may expire. Returns the number of completed items."""
+    num_done = 0
+    while max_items is None or num_done < max_items:
+        item = queue.claim()
+        if item is None:
+            if queue.finished:
+                break
+            time.sleep(poll_seconds)
+            continue
+        logger.info(" > Item %s, attempt %d", item.id, item.attempt)
+        with LeaseKeeper(queue, item) as keeper:
+            try:
+                result = handler(item.payload)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(" [!] Item %s failed: %s", item.id, e)
+                queue.release(item, e)
+                continue
+        if keeper.lost:
+            # another worker claimed the item, its result counts
+            logger.warning(" [!] Dropping the result of item %s, its lease was lost", item.id)
+            continue
+        queue.complete(item, result)
+        num_done += 1
+    return num_done
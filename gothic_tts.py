@@ -1,7 +1,10 @@
+import sys
+from TTS_lib.utils.profiling import StartupProfiler
+# start before the other imports to include them in the profile
+startup_profiler = StartupProfiler.from_argv(sys.argv)
 import PySimpleGUI as sg
 import threading
 from TTS_lib import synthesize
-from torch.cuda import is_available
 import json
 from glob import glob
 from pathlib import Path
@@ -13,6 +16,7 @@ from datetime import date
 
 # Global Variables
 status = False
+cuda_available = None
 _platform = platform.system()
 version = '0.0.2'
 
@@ -37,11 +41,23 @@ def synthesize_tts(text,
                         speaker_config=speaker_config,
                         speaker_name=speaker,
                         vocoder=vocoder_type,
-                        sentence_file=sentence_file)
+                        sentence_file=sentence_file,
+                        profiler=startup_profiler)
+        if startup_profiler is not None and startup_profiler.stages:
+            startup_profiler.uninstall()
+            startup_profiler.report()
+            startup_profiler.stages = []
 
     status = True
 
 
+def check_cuda():
+    """[Import torch in the background, so the window opens without waiting for it]"""
+    global cuda_available
+    import torch
+    cuda_available = torch.cuda.is_available()
+
+
 def open_output_folder(speaker_path):
     """[Try to determin the operating system and use the corresponding function to open a folder]
 
@@ -92,7 +108,8 @@ def main_gui():
     sentence_file = ''
     text_memory = ''
     speaker_name = None
-    cuda_available = is_available()
+    cuda_checked = False
+    threading.Thread(target=check_cuda, daemon=True).start()
     gst_dict = {}
     # preload style token dict with zeros
     for index, _ in enumerate(range(10)):
@@ -117,9 +134,7 @@ def main_gui():
     loadingAnimation = sg.Image(PATH_LOADING_GIF, visible=False, key='loadingAnim', background_color='white')
     textInput = sg.Multiline('Im Minental versammelt sich eine Armee des Bösen unter der Führung von Drachen! Wir müssen sie aufhalten, so lange wir noch können.',
      size=(60, 6), pad=[5, 5], border_width=1, font=('Arial', 12), text_color=TEXT_COLOR, background_color=TEXTINPUT_BACKGROUND, key='textInput')
-    use_cuda = sg.Checkbox('Use CUDA?', default=cuda_available, key='use_cuda', visible=cuda_available)
-    cuda_color =  'green' if cuda_available else 'red'
-    cuda_text = '(CUDA Support Enabled)' if cuda_available else '(CUDA Support Disabled)'
+    use_cuda = sg.Checkbox('Use CUDA?', default=False, key='use_cuda', visible=False)
 
     # get project folders
     project_folders = glob(PATH_PROJECT)
@@ -138,7 +153,7 @@ def main_gui():
     layout = [
         [sg.Text('Project Settings:', font=('Arial', 12, 'bold'))],
         [projectFolders],
-        [sg.Text(cuda_text, text_color=cuda_color, font=('Arial', 10,'bold')), use_cuda],
+        [sg.Text('(Checking CUDA Support...)', size=(25, None), font=('Arial', 10,'bold'), key='lblCuda'), use_cuda],
         [sg.Text('Speaker:', pad=[5, 5], justification='left', font=('Arial', 11), key='lblSpeaker'), 
          sg.DropDown(speaker_lst, speaker_lst[0], size=(max_length_name, None), font=('Arial', 11), pad=[5, 5], key='dbSpeaker'),
          sg.Checkbox('Generate for all', default=False, font=('Arial', 11), key='create_all')],
@@ -190,6 +205,14 @@ def main_gui():
         if event in ('btnExit', 'Exit'):  # if user closes window or clicks exit
             break
 
+        # show the result of the cuda check once torch is loaded
+        if not cuda_checked and cuda_available is not None:
+            cuda_color =  'green' if cuda_available else 'red'
+            cuda_text = '(CUDA Support Enabled)' if cuda_available else '(CUDA Support Disabled)'
+            window['lblCuda'].update(cuda_text, text_color=cuda_color)
+            window['use_cuda'].update(value=cuda_available, visible=cuda_available)
+            cuda_checked = True
+
         # if another porject is select, load the corresponding configuration files
         if event in 'dbProject':
             if Path(values['dbProject'] + "/speakers.json").is_file():
@@ -0,0 +1,65 @@
+"""Work queue shared by several local processes.
+
+    python -m unittest tests.test_work_queue
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from collections import Counter
+
+from TTS_lib.utils.work_queue import WorkQueue, work
+
+NUM_WORKERS = 8
+MAX_ATTEMPTS = 2
+
+
+def handle(payload):
+    # one line per run, appends of a few bytes are not interleaved
+    with open(payload['log'], 'a', encoding='utf8') as f:
+        f.write('{}\n'.format(payload['name']))
+    if payload['fail']:
+        raise RuntimeError('{} always fails'.format(payload['name']))
+    return payload['name']
+
+
+def run_worker(path):
+    queue = WorkQueue(path, lease_seconds=5.0, max_attempts=MAX_ATTEMPTS)
+    work(queue, handle, poll_seconds=0.01)
+
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_processes(self):
+        log = os.path.join(self.path, 'runs.log')
+        payloads = [{'name': 'item{}'.format(idx), 'fail': idx % 3 == 0, 'log': log} for idx in range(30)]
+        queue = WorkQueue.create(os.path.join(self.path, 'queue'), {}, payloads)
+        workers = [multiprocessing.Process(target=run_worker, args=(queue.path,)) for _ in range(NUM_WORKERS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(120)
+            self.assertEqual(worker.exitcode, 0)
+
+        with open(log, 'r', encoding='utf8') as f:
+            runs = Counter(line.strip() for line in f)
+        for payload in payloads:
+            # failing items run exactly max_attempts times, the others once
+            self.assertEqual(runs[payload['name']], MAX_ATTEMPTS if payload['fail'] else 1, payload['name'])
+        status = queue.status()
+        self.assertEqual(status['done'], 20)
+        self.assertEqual(status['failed'], 10)
+        self.assertTrue(queue.finished)
+        self.assertEqual(sorted(queue.results().values()),
+                         sorted(payload['name'] for payload in payloads if not payload['fail']))
+        self.assertTrue(all(failed['attempts'] == MAX_ATTEMPTS for failed in queue.failed().values()))
+
+
+if __name__ == '__main__':
+    unittest.main()